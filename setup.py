@@ -21,7 +21,14 @@ setup(
     package_dir={"": "src"},
     include_package_data=True,
     zip_safe=False,
-    entry_points={"console_scripts": ["signingscript = signingscript.script:main"]},
+    entry_points={
+        "console_scripts": [
+            "signingscript = signingscript.daemon:client_main",
+            "signingscript-explain = signingscript.script:explain_main",
+            "signingscript-daemon = signingscript.daemon:main",
+            "signingscript-autograph-broker = signingscript.broker:main",
+        ]
+    },
     license="MPL2",
     install_requires=install_requires,
 )
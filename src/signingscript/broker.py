@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+"""Signingscript autograph broker.
+
+With several scriptworker replicas on a node, every task process opens its
+own connections to autograph. `signingscript-autograph-broker` is one
+process per node that the tasks send their autograph requests to over a
+Unix socket instead. It:
+
+* sends them over one pool of connections, with a per-node limit on
+  concurrent requests to each autograph server
+* batches concurrent ``/sign/hash`` and ``/sign/data`` requests for the
+  same server and credentials into a single autograph request. If autograph
+  rejects a batch, other than by throttling, its requests are sent again
+  one at a time, so one task's bad request doesn't fail the others'
+* remembers hash and data signatures, so inputs signed by any task on the
+  node are only sent to autograph once
+
+The protocol is newline-delimited json. Each request is::
+
+    {"id": 1, "url": "...", "user": "...", "password": "...", "request": [...]}
+
+and the broker replies with ``{"id": 1, "response": [...]}``, or
+``{"id": 1, "status": 503, "error": "..."}`` if autograph couldn't sign it.
+
+"""
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+
+from signingscript import concurrency, executor, latency
+
+log = logging.getLogger(__name__)
+
+# The autograph methods whose requests can be batched and remembered. Files
+# are large and signed one at a time.
+BATCH_METHODS = ("hash", "data")
+
+# How long tasks wait for the broker to answer, by default
+DEFAULT_TIMEOUT = 1800
+
+_socket_path = None
+_timeout = DEFAULT_TIMEOUT
+
+
+# configure {{{1
+def configure(config):
+    """Set the broker that `call` sends requests to.
+
+    Args:
+        config (dict): the running config. ``autograph_broker_socket`` is
+            the broker's Unix socket, or None to call autograph directly.
+            ``autograph_broker_timeout`` is how long to wait for the broker
+            to answer, in seconds.
+
+    """
+    global _socket_path, _timeout
+    _socket_path = config.get("autograph_broker_socket")
+    _timeout = config.get("autograph_broker_timeout", DEFAULT_TIMEOUT)
+
+
+def is_configured():
+    """Return whether autograph requests should go through a broker.
+
+    Returns:
+        bool: True if ``autograph_broker_socket`` is set
+
+    """
+    return bool(_socket_path)
+
+
+# call {{{1
+async def call(url, user, password, request_json):
+    """Send an autograph request through the broker.
+
+    Args:
+        url (str): the autograph url to post to
+        user (str): the autograph user
+        password (str): the autograph password
+        request_json (list): the sign requests
+
+    Raises:
+        requests.HTTPError: if the broker couldn't get a signature
+        asyncio.TimeoutError: if the broker doesn't answer within
+            ``autograph_broker_timeout``
+
+    Returns:
+        list: autograph's response, or None if there's no broker to send it
+            to, and autograph should be called directly.
+
+    """
+    if not _socket_path:
+        return None
+    try:
+        reader, writer = await asyncio.open_unix_connection(_socket_path)
+    except OSError as exc:
+        log.warning(
+            "Autograph broker isn't listening on %s (%s); calling autograph directly",
+            _socket_path,
+            exc,
+        )
+        return None
+    try:
+        request = {
+            "id": 0,
+            "url": url,
+            "user": user,
+            "password": password,
+            "request": request_json,
+        }
+        writer.write(_encode(request))
+        # The broker queues requests behind the other tasks' ones on the
+        # node before autograph's deadlines apply, so this deadline has to
+        # be longer than theirs, or busy nodes would give up on requests
+        # the broker is still signing, and send them again
+        line = await asyncio.wait_for(reader.readline(), _timeout)
+    finally:
+        writer.close()
+    if not line:
+        raise ConnectionError("Autograph broker closed the connection")
+    message = json.loads(line.decode("utf-8"))
+    if "error" in message:
+        # Imported here, since clients only need it on failure
+        import requests
+
+        # Pass the status on, so throttling is seen through the broker
+        response = requests.Response()
+        response.status_code = message.get("status")
+        raise requests.HTTPError(
+            "{} from autograph broker for {}: {}".format(
+                message.get("status"), url, message["error"]
+            ),
+            response=response,
+        )
+    return message["response"]
+
+
+def _encode(message):
+    return json.dumps(message).encode("utf-8") + b"\n"
+
+
+def _memo_key(url, user, password, item):
+    return hashlib.sha256(
+        json.dumps([url, user, password, item], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class _Batch(object):
+    """Sign requests waiting to be sent to autograph together."""
+
+    def __init__(self, items=None, futures=None):
+        """Start a batch, empty by default."""
+        self.items = items or []
+        self.futures = futures or []
+        self.flush_handle = None
+
+
+# Broker {{{1
+class Broker(object):
+    """Forward autograph requests from the tasks on a node.
+
+    Args:
+        socket_path (str): the path of the Unix socket to listen on
+        max_connections (int, optional): the most concurrent requests to
+            each autograph server. Defaults to 8.
+        batch_size (int, optional): the most sign requests to send in one
+            autograph request. Defaults to 16.
+        batch_window (float, optional): how long to wait for more sign
+            requests to batch, in seconds. Defaults to 0.005.
+        memo_size (int, optional): how many signatures to remember.
+            Defaults to 4096.
+
+    """
+
+    def __init__(
+        self,
+        socket_path,
+        max_connections=8,
+        batch_size=16,
+        batch_window=0.005,
+        memo_size=4096,
+    ):
+        """Listen on `socket_path`."""
+        self.socket_path = socket_path
+        self.max_connections = max_connections
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.memo_size = memo_size
+        self.memo = collections.OrderedDict()
+        self.batches = {}
+        self.limits = {}
+        self.clients = set()
+        self.server = None
+
+    async def start(self):
+        """Start listening."""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # Create the socket accessible to this user only, rather than
+        # restricting it once others may have connected
+        umask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(
+                self._connected, self.socket_path
+            )
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        log.info("Listening on %s", self.socket_path)
+
+    async def close(self):
+        """Stop listening, and drop the connected clients."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for client in self.clients:
+            client.cancel()
+        if self.clients:
+            await asyncio.wait(self.clients)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _connected(self, reader, writer):
+        client = asyncio.ensure_future(self.handle(reader, writer))
+        self.clients.add(client)
+        client.add_done_callback(self.clients.discard)
+
+    async def handle(self, reader, writer):
+        """Answer the requests from a task, in whatever order they finish.
+
+        Tasks wait for their answers, so a task that hangs up has given up on
+        them, e.g. because it was cancelled. Its unanswered requests are
+        cancelled too.
+
+        """
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                future = asyncio.ensure_future(self._answer(line, writer))
+                pending.add(future)
+                future.add_done_callback(pending.discard)
+        except ConnectionError as exc:
+            log.warning("Dropped a client: %s", exc)
+        finally:
+            for future in list(pending):
+                future.cancel()
+            writer.close()
+
+    async def _answer(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line.decode("utf-8"))
+            request_id = request.get("id")
+            response = await self.sign(
+                request["url"], request["user"], request["password"], request["request"]
+            )
+            message = {"id": request_id, "response": response}
+        except Exception as exc:
+            log.warning("Failed to sign for a client: %s", exc)
+            status = getattr(getattr(exc, "response", None), "status_code", None)
+            message = {"id": request_id, "status": status, "error": str(exc)}
+        if not writer.is_closing():
+            writer.write(_encode(message))
+
+    async def sign(self, url, user, password, request_json):
+        """Sign `request_json`, batching and remembering where possible.
+
+        Args:
+            url (str): the autograph url to post to
+            user (str): the autograph user
+            password (str): the autograph password
+            request_json (list): the sign requests
+
+        Returns:
+            list: autograph's response
+
+        """
+        method = url.rpartition("/")[2]
+        if method not in BATCH_METHODS:
+            return await self._post(url, user, password, request_json)
+        futures = []
+        for item in request_json:
+            key = _memo_key(url, user, password, item)
+            future = self.memo.get(key)
+            if future is None or (future.done() and future.exception()):
+                future = self._queue(url, user, password, item)
+                self.memo[key] = future
+                while len(self.memo) > self.memo_size:
+                    self.memo.popitem(last=False)
+            else:
+                self.memo.move_to_end(key)
+            futures.append(future)
+        # The memo's futures are shared, so don't let one client cancel them
+        return list(await asyncio.gather(*(asyncio.shield(f) for f in futures)))
+
+    def _queue(self, url, user, password, item):
+        loop = asyncio.get_event_loop()
+        key = (url, user, password)
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = _Batch()
+            batch.flush_handle = loop.call_later(self.batch_window, self._flush, key)
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.batch_size:
+            self._flush(key)
+        return future
+
+    def _flush(self, key):
+        batch = self.batches.pop(key, None)
+        if batch is None:
+            return
+        batch.flush_handle.cancel()
+        asyncio.ensure_future(self._send_batch(key, batch))
+
+    async def _send_batch(self, key, batch):
+        url, user, password = key
+        try:
+            response = await self._post(url, user, password, batch.items)
+            if len(response) != len(batch.items):
+                raise ValueError(
+                    "Autograph returned {} signatures for {} requests".format(
+                        len(response), len(batch.items)
+                    )
+                )
+        except Exception as exc:
+            if len(batch.items) > 1 and not concurrency.is_throttled(exc):
+                log.warning(
+                    "Autograph rejected a batch of %d requests (%s); "
+                    "sending them one at a time",
+                    len(batch.items),
+                    exc,
+                )
+                await asyncio.gather(
+                    *(
+                        self._send_batch(key, _Batch([item], [future]))
+                        for item, future in zip(batch.items, batch.futures)
+                    )
+                )
+                return
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future, signed in zip(batch.futures, response):
+            if not future.done():
+                future.set_result(signed)
+
+    async def _post(self, url, user, password, request_json):
+        # Imported here, since clients only need `call`
+        from signingscript import sign
+
+        server = url.rpartition("/sign/")[0]
+        limit = self.limits.get(server)
+        if limit is None:
+            limit = self.limits[server] = asyncio.Semaphore(self.max_connections)
+        async with limit:
+            return await executor.run_io(
+                sign.post_autograph, url, user, password, request_json
+            )
+
+
+# main {{{1
+def main(config_path=None):
+    """Start the autograph broker.
+
+    Reads ``autograph_broker_socket`` and the ``autograph_broker_*`` limits
+    from the script config, which is the same config that `signingscript`
+    is run with.
+
+    Args:
+        config_path (str, optional): the path to the script config. Reads
+            ``sys.argv[1]`` if None. Defaults to None.
+
+    """
+    from signingscript.script import get_default_config
+
+    if config_path is None:
+        if len(sys.argv) != 2:
+            print("Usage: {} CONFIG_FILE".format(sys.argv[0]), file=sys.stderr)
+            sys.exit(1)
+        config_path = sys.argv[1]
+    config = get_default_config()
+    with open(config_path) as fh:
+        config.update(json.load(fh))
+    if not config.get("autograph_broker_socket"):
+        print("No autograph_broker_socket in {}".format(config_path), file=sys.stderr)
+        sys.exit(1)
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.DEBUG if config.get("verbose") else logging.INFO,
+    )
+    logging.getLogger("mohawk").setLevel(logging.INFO)
+    executor.configure(config)
+    latency.configure(config)
+
+    loop = asyncio.get_event_loop()
+    broker = Broker(
+        config["autograph_broker_socket"],
+        max_connections=config["autograph_broker_max_connections"],
+        batch_size=config["autograph_broker_batch_size"],
+        batch_window=config["autograph_broker_batch_window"],
+        memo_size=config["autograph_broker_memo_size"],
+    )
+    loop.run_until_complete(broker.start())
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(broker.close())
+        executor.shutdown()
+
+
+__name__ == "__main__" and main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+"""Signingscript adaptive concurrency limits.
+
+Signing runs many requests at once, so without a limit a task can fire
+hundreds of requests at autograph or the signing servers, and be throttled.
+Each backend server, and each format on it, gets an `AdaptiveLimit` on its
+requests in flight. Limits start from the configured values, and adjust
+with AIMD: they grow by one request per round of successful requests, and
+halve when the server throttles, or when a format's fixed-size requests,
+like ``/sign/hash``, take much longer than the fastest seen. How long other
+requests take depends on their payload, or on how long they wait to be
+picked up, so it says little about the load. This keeps throughput near what the backend
+can handle without overloading it.
+
+Uploads hold the file and its encoded copies in memory while they run, so
+they're also admitted by a `MemoryBudget`, which limits the bytes in flight
+rather than the number of requests.
+
+"""
+import asyncio
+import collections
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Responses that mean the server wants fewer requests
+THROTTLE_STATUSES = (429, 503)
+
+_DEFAULTS = {
+    "concurrency_limits": {"autograph": 8, "signing_server": 4},
+    "format_concurrency_limits": {},
+    "max_concurrency": 64,
+    "latency_tolerance": 3.0,
+    "autograph_memory_budget": None,
+}
+_config = dict(_DEFAULTS)
+_limits = {}
+_budget = None
+
+
+# configure {{{1
+def configure(config):
+    """Set the initial limits from the script config.
+
+    The limits learned so far are kept unless the settings have changed,
+    so a daemon carries them across tasks.
+
+    Args:
+        config (dict): the running config. ``concurrency_limits`` are the
+            initial limits for each server, by server type, and
+            ``format_concurrency_limits`` those for formats on a server,
+            which default to the server's. ``max_concurrency`` caps every
+            limit, and a format's fixed-size requests taking
+            ``latency_tolerance`` times the fastest seen halves its limit.
+            ``autograph_memory_budget`` is the most bytes that uploads in
+            flight can hold in memory, or None for no limit.
+
+    """
+    global _budget
+    settings = {key: config.get(key, default) for key, default in _DEFAULTS.items()}
+    if settings != _config:
+        _config.update(settings)
+        _limits.clear()
+        _budget = None
+        if settings["autograph_memory_budget"]:
+            _budget = MemoryBudget(settings["autograph_memory_budget"])
+
+
+def is_throttled(exc):
+    """Return whether an exception is the server asking for fewer requests.
+
+    Args:
+        exc (Exception): the exception a request raised, or None
+
+    Returns:
+        bool: True if it's a throttling response
+
+    """
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status in THROTTLE_STATUSES
+
+
+# AdaptiveLimit {{{1
+class AdaptiveLimit(object):
+    """An AIMD limit on the requests in flight to a backend.
+
+    Limits aren't thread-safe, and their waiters belong to the event loop
+    they were created on, so requests must be limited from the task's loop.
+
+    Args:
+        name (str): what the limit is for, for logging
+        initial (int): the starting limit
+        maximum (int): the largest the limit can grow to
+        tolerance (float, optional): how many times the fastest latency seen
+            a request can take before the limit is halved. If None,
+            latency doesn't affect the limit. Defaults to None.
+
+    """
+
+    def __init__(self, name, initial, maximum, tolerance=None):
+        """Start at `initial` requests in flight."""
+        self.name = name
+        self.limit = float(max(1, min(initial, maximum)))
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.min_latency = None
+        self._last_decrease = 0.0
+        self._waiters = collections.deque()
+
+    async def acquire(self):
+        """Wait until a request can be sent under the limit.
+
+        Returns:
+            float: when the request was admitted, to pass to `release`
+
+        """
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # Pass the wakeup on to the next waiter
+                    self._wake()
+                raise
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, throttled=False, succeeded=True, timed=True):
+        """Finish a request, and adjust the limit by how it went.
+
+        Args:
+            started (float): what `acquire` returned
+            throttled (bool, optional): whether the server throttled the
+                request. Defaults to False.
+            succeeded (bool, optional): whether the request succeeded.
+                Other failures don't change the limit. Defaults to True.
+            timed (bool, optional): whether the request's latency is
+                comparable to the others', so can halve the limit. Defaults
+                to True.
+
+        """
+        saturated = self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+        now = time.monotonic()
+        latency = now - started
+        if throttled:
+            self._decrease(started, now, "throttled")
+        elif succeeded:
+            slow = timed and self._observe(latency)
+            if slow:
+                self._decrease(started, now, "{:.2f}s latency".format(latency))
+            elif saturated and self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _observe(self, latency):
+        if self.tolerance is None:
+            return False
+        if self.min_latency is None:
+            self.min_latency = latency
+            return False
+        # Let the baseline drift up, so it follows a backend that's gotten
+        # slower for good
+        self.min_latency = min(latency, self.min_latency * 1.01)
+        return latency > self.min_latency * self.tolerance
+
+    def _decrease(self, started, now, reason):
+        # Requests sent before the last decrease were sent at the old limit,
+        # so only halve once for them
+        if started < self._last_decrease:
+            return
+        self._last_decrease = now
+        self.limit = max(1.0, self.limit / 2)
+        log.info("%s: %s, limiting to %d requests", self.name, reason, self.limit)
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while self._waiters and free > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+class _Limits(object):
+    """Hold a slot in several limits for one request."""
+
+    def __init__(self, limits, timed):
+        """Limit a request by each of `limits`, narrowest first."""
+        self.limits = limits
+        self.timed = timed
+        self.started = []
+
+    async def __aenter__(self):
+        """Wait for a slot in every limit."""
+        try:
+            for limit in self.limits:
+                self.started.append(await limit.acquire())
+        except BaseException:
+            for limit, started in zip(self.limits, self.started):
+                limit.release(started, succeeded=False, timed=self.timed)
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Release the slots, and adjust the limits."""
+        throttled = is_throttled(exc)
+        for limit, started in zip(self.limits, self.started):
+            limit.release(
+                started, throttled=throttled, succeeded=exc is None, timed=self.timed
+            )
+
+
+def _get_limit(key, name, initial, tolerance=None):
+    limit = _limits.get(key)
+    if limit is None:
+        limit = _limits[key] = AdaptiveLimit(
+            name, initial, _config["max_concurrency"], tolerance
+        )
+    return limit
+
+
+# limit {{{1
+def limit(server_type, server, fmt, fixed_size=False):
+    """Limit a request to a backend server, for a format.
+
+    The server's limit reacts to throttling. Requests for different formats
+    can take very different times, so only the format's limit reacts to
+    latency as well, and only for fixed-size requests.
+
+    Args:
+        server_type (str): ``autograph`` or ``signing_server``
+        server (str): the server the request is for
+        fmt (str): the format being signed
+        fixed_size (bool, optional): whether the request's size is the same
+            whatever is being signed, e.g. a ``/sign/hash`` request, so its
+            latency reflects the server's load. Defaults to False.
+
+    Returns:
+        async context manager: holds a slot in both limits while the
+            request runs
+
+    """
+    server_limit = _config["concurrency_limits"].get(server_type) or 1
+    format_limit = _config["format_concurrency_limits"].get(fmt, server_limit)
+    return _Limits(
+        [
+            _get_limit(
+                (server, fmt),
+                "{} {}".format(server, fmt),
+                format_limit,
+                tolerance=_config["latency_tolerance"],
+            ),
+            _get_limit((server,), server, server_limit),
+        ],
+        timed=fixed_size,
+    )
+
+
+# MemoryBudget {{{1
+class MemoryBudget(object):
+    """Admit work by how many bytes of memory it needs.
+
+    Work that fits in what's left of the budget starts at once, so small
+    uploads flow freely, and work that doesn't waits in line. While work is
+    waiting, the bytes that are given back are set aside for the first in
+    line, so small work can't starve large work. Work larger than the whole
+    budget waits until it's the only work running.
+
+    Args:
+        limit (int): the budget, in bytes
+
+    """
+
+    def __init__(self, limit):
+        """Start with all of `limit` free."""
+        self.limit = limit
+        self.used = 0
+        self.reserved = 0
+        self._waiters = collections.deque()
+
+    def _fits(self, size, reserved=0):
+        return self.used + reserved + size <= self.limit
+
+    async def acquire(self, size):
+        """Wait until `size` bytes fit in the budget, and take them.
+
+        Args:
+            size (int): the bytes needed
+
+        Returns:
+            int: the bytes taken, to pass to `release`
+
+        """
+        size = min(size, self.limit)
+        if self._fits(size, self.reserved):
+            self.used += size
+            return size
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append((size, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as it was cancelled
+                self.release(size)
+            else:
+                if self._waiters[0][1] is waiter:
+                    self.reserved = 0
+                self._waiters.remove((size, waiter))
+                self._wake()
+            raise
+        return size
+
+    def release(self, size):
+        """Give back bytes taken by `acquire`.
+
+        Args:
+            size (int): what `acquire` returned
+
+        """
+        self.used -= size
+        if self._waiters:
+            self.reserved = min(self._waiters[0][0], self.reserved + size)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._fits(self._waiters[0][0]):
+            size, waiter = self._waiters.popleft()
+            self.used += size
+            self.reserved = 0
+            waiter.set_result(None)
+        for size, waiter in list(self._waiters)[1:]:
+            if self._fits(size, self.reserved):
+                self._waiters.remove((size, waiter))
+                self.used += size
+                waiter.set_result(None)
+
+
+class _Reservation(object):
+    """Hold part of the memory budget while some work runs."""
+
+    def __init__(self, budget, size):
+        """Reserve `size` bytes of `budget`."""
+        self.budget = budget
+        self.size = size
+        self.taken = 0
+
+    async def __aenter__(self):
+        """Wait for the bytes to be free."""
+        if self.budget is not None:
+            self.taken = await self.budget.acquire(self.size)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Give the bytes back."""
+        if self.budget is not None:
+            self.budget.release(self.taken)
+
+
+# reserve_memory {{{1
+def reserve_memory(size):
+    """Hold `size` bytes of the ``autograph_memory_budget`` while work runs.
+
+    Args:
+        size (int): the estimated bytes the work holds in memory
+
+    Returns:
+        async context manager: holds the bytes while the work runs. If
+            there's no budget, it doesn't wait.
+
+    """
+    return _Reservation(_budget, size)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+"""Signingscript daemon mode.
+
+Scriptworker starts `signingscript` once per task, so every task pays for
+the imports, reading the server config and certificates, and opening fresh
+TLS connections. `signingscript-daemon` keeps one process running, which
+`signingscript` hands its task to over a Unix socket, so that state stays
+warm across tasks.
+
+The protocol is newline-delimited json. The client sends one request::
+
+    {"config_path": "/path/to/script_config.json", "cwd": "/path/to/cwd"}
+
+and the daemon replies with ``{"log": "..."}`` lines as the task runs,
+followed by ``{"exit_code": 0}``. If the client disconnects, the task is
+cancelled.
+
+The daemon runs tasks with the worker's signing credentials, so only the
+user it runs as may connect: the socket is only accessible to that user,
+and where the platform reports it, the peer's uid is checked as well.
+
+The ``signingscript`` entry point is `client_main`, which only imports the
+rest of signingscript if the task is signed in-process, so the client side
+only uses the standard library.
+
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+
+log = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def _read_socket_path(config_path):
+    try:
+        with open(config_path) as fh:
+            config = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(config, dict):
+        return None
+    return config.get("daemon_socket")
+
+
+# run_task {{{1
+def run_task(config_path, stream=None):
+    """Hand a task to the daemon, if one is configured and listening.
+
+    The daemon's log lines are written to `stream` as they arrive.
+
+    Args:
+        config_path (str): the path to the script config
+        stream (file, optional): where to write the log. Defaults to
+            ``sys.stderr``, where the logging would go in-process.
+
+    Returns:
+        int: the task's exit code, or None if there's no daemon to hand the
+            task to, and it should be run in this process.
+
+    """
+    stream = stream or sys.stderr
+    socket_path = _read_socket_path(config_path)
+    if not socket_path:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError as exc:
+        sock.close()
+        print(
+            "signingscript daemon isn't listening on {} ({}); "
+            "signing in-process".format(socket_path, exc),
+            file=stream,
+        )
+        return None
+    request = {"config_path": os.path.abspath(config_path), "cwd": os.getcwd()}
+    try:
+        with sock, sock.makefile("rwb") as fh:
+            fh.write(json.dumps(request).encode("utf-8") + b"\n")
+            fh.flush()
+            for line in fh:
+                message = json.loads(line.decode("utf-8"))
+                if "log" in message:
+                    print(message["log"], file=stream)
+                    stream.flush()
+                elif "exit_code" in message:
+                    return message["exit_code"]
+    except ConnectionError as exc:
+        # e.g. the daemon refused this user
+        print("signingscript daemon closed the connection: {}".format(exc), file=stream)
+        return 1
+    print("signingscript daemon exited before finishing the task", file=stream)
+    return 1
+
+
+# client_main {{{1
+def client_main():
+    """Start signing script, handing the task to the daemon if there is one.
+
+    Nothing outside the standard library is imported until the task turns
+    out to need signing in this process.
+
+    """
+    if len(sys.argv) == 2:
+        exit_code = run_task(sys.argv[1])
+        if exit_code is not None:
+            sys.exit(exit_code)
+    from signingscript import script
+
+    return script.run_in_process()
+
+
+class _ConnectionHandler(logging.Handler):
+    """Forward log records to the client of the running task.
+
+    Records can be emitted from the executor threads, so they're handed to
+    the event loop to write.
+
+    """
+
+    def __init__(self, loop, writer, level=logging.NOTSET):
+        """Forward records to `writer`."""
+        super().__init__(level)
+        self.loop = loop
+        self.writer = writer
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def emit(self, record):
+        """Send `record` to the client."""
+        try:
+            line = _encode({"log": self.format(record)})
+            self.loop.call_soon_threadsafe(self._write, line)
+        except Exception:
+            self.handleError(record)
+
+    def _write(self, line):
+        if not self.writer.is_closing():
+            self.writer.write(line)
+
+
+def _encode(message):
+    return json.dumps(message).encode("utf-8") + b"\n"
+
+
+def _peer_uid(sock):
+    """Return the uid of the process at the other end of a Unix socket.
+
+    Returns:
+        int: the uid, or None if the platform doesn't support SO_PEERCRED
+
+    """
+    if sock is None or not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+def _load_context(config_path, default_config):
+    """Build the task context, as `scriptworker.client.sync_main` does."""
+    from scriptworker.client import get_task
+    from scriptworker.context import Context
+    from scriptworker.utils import load_json_or_yaml
+
+    context = Context()
+    # Don't let the script overwrite json on disk
+    context.write_json = lambda *args: None
+    context.config = dict(default_config)
+    context.config.update(load_json_or_yaml(config_path, is_path=True))
+    context.task = get_task(context.config)
+    return context
+
+
+# Daemon {{{1
+class Daemon(object):
+    """Sign tasks handed over a Unix socket, one at a time.
+
+    Imports, the executor pools, the parsed signing server config, cached
+    keys, and the autograph and signing server connection pools are kept
+    between tasks. Cached keys are reread if their files change.
+
+    Args:
+        socket_path (str): the path of the Unix socket to listen on
+
+    """
+
+    def __init__(self, socket_path):
+        """Listen on `socket_path`."""
+        self.socket_path = socket_path
+        self.lock = asyncio.Lock()
+        self.connectors = {}
+        self.server = None
+
+    async def start(self):
+        """Start listening.
+
+        Raises:
+            OSError: if another daemon is listening on the socket already.
+
+        """
+        if os.path.exists(self.socket_path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                writer.close()
+                raise OSError(
+                    "A daemon is already listening on {}".format(self.socket_path)
+                )
+        # Create the socket accessible to this user only, rather than
+        # restricting it once others may have connected
+        umask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(self.handle, self.socket_path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        log.info("Listening on %s", self.socket_path)
+
+    async def close(self):
+        """Stop listening, and close the warm connections."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for connector in self.connectors.values():
+            await connector.close()
+        self.connectors = {}
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def handle(self, reader, writer):
+        """Run the task requested by a client."""
+        uid = _peer_uid(writer.get_extra_info("socket"))
+        if uid is not None and uid != os.getuid():
+            log.warning("Refused a client running as uid %s", uid)
+            writer.close()
+            return
+        try:
+            request = json.loads((await reader.readline()).decode("utf-8"))
+            async with self.lock:
+                exit_code = await self._run_until_disconnected(request, reader, writer)
+            if exit_code is not None:
+                writer.write(_encode({"exit_code": exit_code}))
+                await writer.drain()
+        except (ConnectionError, ValueError) as exc:
+            log.warning("Dropped a client: %s", exc)
+        finally:
+            writer.close()
+
+    async def _run_until_disconnected(self, request, reader, writer):
+        loop = asyncio.get_event_loop()
+        handler = _ConnectionHandler(loop, writer)
+        root = logging.getLogger()
+        root.addHandler(handler)
+        run = asyncio.ensure_future(self.run(request))
+        # Clients don't send anything after the request, so this only
+        # finishes when they hang up, e.g. when scriptworker kills the task
+        eof = asyncio.ensure_future(reader.read())
+        try:
+            await asyncio.wait({run, eof}, return_when=asyncio.FIRST_COMPLETED)
+            if not run.done():
+                log.warning("Client disconnected; cancelling the task")
+                run.cancel()
+                await asyncio.wait({run})
+                return None
+            # Let log records from the executor threads reach the client
+            # before the exit code does
+            await asyncio.sleep(0)
+            return run.result()
+        finally:
+            eof.cancel()
+            root.removeHandler(handler)
+
+    async def run(self, request):
+        """Sign a task, as `scriptworker.client.sync_main` would.
+
+        Args:
+            request (dict): the client's ``config_path`` and ``cwd``
+
+        Returns:
+            int: the exit code for the task
+
+        """
+        # Imported here, so clients don't pay for them
+        import aiohttp
+        import scriptworker.client
+        from scriptworker.exceptions import ScriptWorkerException
+
+        from signingscript import script
+
+        os.chdir(request["cwd"])
+        try:
+            default_config = script.get_default_config()
+            context = _load_context(request["config_path"], default_config)
+            logging.getLogger().setLevel(
+                logging.DEBUG if context.config.get("verbose") else logging.INFO
+            )
+            scriptworker.client.validate_task_schema(context)
+            async with aiohttp.ClientSession() as session:
+                context.session = session
+                await script.async_main(context, connector=self._connector(context))
+        except ScriptWorkerException as exc:
+            log.exception("Failed to run async_main")
+            return exc.exit_code
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Failed to run async_main")
+            return 1
+        return 0
+
+    def _connector(self, context):
+        from signingscript import script
+
+        key = context.config.get("ssl_cert")
+        connector = self.connectors.get(key)
+        if connector is None or connector.closed:
+            connector = script._craft_aiohttp_connector(context)
+            self.connectors[key] = connector
+        return connector
+
+
+# main {{{1
+def main(config_path=None):
+    """Start the signingscript daemon.
+
+    The socket path is the ``daemon_socket`` in the script config, which
+    is the same config that `signingscript` is run with.
+
+    Args:
+        config_path (str, optional): the path to the script config. Reads
+            ``sys.argv[1]`` if None. Defaults to None.
+
+    """
+    if config_path is None:
+        if len(sys.argv) != 2:
+            print("Usage: {} CONFIG_FILE".format(sys.argv[0]), file=sys.stderr)
+            sys.exit(1)
+        config_path = sys.argv[1]
+    socket_path = _read_socket_path(config_path)
+    if not socket_path:
+        print("No daemon_socket in {}".format(config_path), file=sys.stderr)
+        sys.exit(1)
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
+    logging.getLogger("taskcluster").setLevel(logging.WARNING)
+    logging.getLogger("mohawk").setLevel(logging.INFO)
+
+    # Pay for the imports before the first task arrives
+    from signingscript import executor, script  # noqa: F401
+
+    loop = asyncio.get_event_loop()
+    daemon = Daemon(socket_path)
+    loop.run_until_complete(daemon.start())
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(daemon.close())
+        executor.shutdown()
+
+
+__name__ == "__main__" and main()
@@ -43,3 +43,21 @@ class FailedSubprocess(ScriptWorkerTaskException):
         super(FailedSubprocess, self).__init__(
             msg, exit_code=STATUSES["internal-error"]
         )
+
+
+class MultipleSigningErrors(SigningScriptError):
+    """Several signing operations that ran together failed."""
+
+    def __init__(self, errors):
+        """Initialize MultipleSigningErrors.
+
+        Args:
+            errors (list): the exceptions that the operations raised.
+        """
+        self.errors = errors
+        super(MultipleSigningErrors, self).__init__(
+            "{} signing operations failed:\n{}".format(
+                len(errors),
+                "\n".join("{}: {}".format(type(e).__name__, e) for e in errors),
+            )
+        )
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Signingscript executors for blocking work.
+
+Archive and file operations block, so running them directly in a coroutine
+stalls every other artifact being signed. These run them in a thread pool
+for I/O-bound work, or a process pool for CPU-bound work that holds the GIL,
+so several archives can be extracted, signed and repacked at once.
+
+"""
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+
+log = logging.getLogger(__name__)
+
+_config = {"io_workers": None, "cpu_workers": None}
+_pools = {}
+
+
+# configure {{{1
+def configure(config):
+    """Size the pools from the script config.
+
+    If the sizes have changed, pools that have already started are shut
+    down, and restarted with the new size when next used. Otherwise they're
+    kept, so a daemon reuses them across tasks.
+
+    Args:
+        config (dict): the running config. ``io_workers`` and
+            ``cpu_workers`` are the pool sizes; None uses the
+            `concurrent.futures` defaults.
+
+    """
+    sizes = {key: config.get(key) for key in _config}
+    if sizes == _config:
+        return
+    shutdown()
+    _config.update(sizes)
+
+
+# shutdown {{{1
+def shutdown(wait=True):
+    """Shut down any pools that have started.
+
+    Args:
+        wait (bool, optional): wait for pending work to finish. Defaults to
+            True.
+
+    """
+    while _pools:
+        _, pool = _pools.popitem()
+        pool.shutdown(wait=wait)
+
+
+def _init_cpu_worker():
+    # signingscript.sign and signingscript.task import each other, and only
+    # import cleanly in the order the script imports them. Import them before
+    # any work is unpickled.
+    import signingscript.script  # noqa: F401
+
+
+def _get_pool(kind):
+    pool = _pools.get(kind)
+    if pool is None:
+        if kind == "io":
+            pool = concurrent.futures.ThreadPoolExecutor(
+                _config["io_workers"], thread_name_prefix="signingscript-io"
+            )
+        else:
+            # Forking copies the locks held by other threads, like logging's
+            # and the connection pools', so the workers start from a clean
+            # process instead
+            method = "forkserver"
+            if method not in multiprocessing.get_all_start_methods():
+                method = "spawn"
+            pool = concurrent.futures.ProcessPoolExecutor(
+                _config["cpu_workers"],
+                mp_context=multiprocessing.get_context(method),
+                initializer=_init_cpu_worker,
+            )
+        log.debug("Started the %s pool", kind)
+        _pools[kind] = pool
+    return pool
+
+
+# run_io {{{1
+async def run_io(func, *args, **kwargs):
+    """Run blocking I/O in the thread pool.
+
+    Args:
+        func (callable): the function to run
+        *args: positional arguments for `func`
+        **kwargs: keyword arguments for `func`
+
+    Returns:
+        the result of `func`
+
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        _get_pool("io"), functools.partial(func, *args, **kwargs)
+    )
+
+
+# run_cpu {{{1
+async def run_cpu(func, *args, **kwargs):
+    """Run CPU-bound work in the process pool.
+
+    `func` and its arguments are pickled, so `func` must be a module-level
+    function, and can't rely on state set up in this process. The workers
+    are started with ``forkserver`` (or ``spawn``) rather than forked.
+
+    Args:
+        func (callable): the function to run
+        *args: positional arguments for `func`
+        **kwargs: keyword arguments for `func`
+
+    Returns:
+        the result of `func`
+
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        _get_pool("cpu"), functools.partial(func, *args, **kwargs)
+    )
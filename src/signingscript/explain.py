@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""Signingscript dry-run signing plan explanation.
+
+This estimates what signing a task will do and roughly what it will cost,
+from the task payload and the archive member indexes alone. No signing
+server or autograph instance is contacted.
+
+"""
+import logging
+import os
+import tarfile
+import zipfile
+
+from signingscript.formats import get_signing_format
+
+# signingscript.task must be imported before signingscript.sign, which
+# imports it back.
+from signingscript.task import build_filelist_dict
+from signingscript.sign import (
+    _get_omnija_signing_files,
+    _get_widevine_signing_files,
+    _is_jar_signature_file,
+    _jar_manifest_line,
+    _should_sign_windows,
+    _use_xpi_hash_signing,
+    make_jar_signature_file,
+)
+from signingscript.utils import is_apk_autograph_signing_format
+
+log = logging.getLogger(__name__)
+
+# Upper bound on the size of a digest sent to a hash-signing endpoint.
+_DIGEST_BYTES = 64
+
+# The size of the signature file sent to autograph with `xpi_hash_signing`,
+# which only holds the manifest's digests.
+_XPI_SIGFILE_BYTES = len(make_jar_signature_file(b""))
+
+# Upper bounds on the size of the header of the apk v1 signature file sent
+# with `apk_hash_signing`, and of its section for each entry, less the name.
+_APK_SIGFILE_HEADER_BYTES = 256
+_APK_SIGFILE_SECTION_BYTES = len("SHA-256-Digest: \r\n\r\n") + 44
+
+# Signing functions that send the whole file to the signer, unless a hash
+# signing mode is configured (see `_hash_mode_upload_size`).
+_WHOLE_FILE_FUNCTIONS = (
+    "sign_file",
+    "sign_gpg",
+    "sign_gpg_with_autograph",
+    "sign_jar",
+    "sign_langpack",
+    "sign_macapp",
+)
+
+
+def _b64_size(num_bytes):
+    """Return the size of `num_bytes` once base64-encoded for autograph."""
+    return 4 * ((num_bytes + 2) // 3)
+
+
+# get_archive_members {{{1
+def get_archive_members(path):
+    """Read the member index of a zip or tar archive.
+
+    Args:
+        path (str): the path to the archive
+
+    Returns:
+        list: (name, uncompressed size) tuples for the regular files in the
+            archive, or None if `path` isn't a readable archive.
+
+    """
+    try:
+        if path.endswith((".zip", ".xpi", ".apk", ".ja")):
+            with zipfile.ZipFile(path, mode="r") as z:
+                return [
+                    (i.filename, i.file_size) for i in z.infolist() if not i.is_dir()
+                ]
+        if path.endswith((".tar.gz", ".tar.bz2")):
+            with tarfile.open(path, mode="r:*") as t:
+                return [(m.name, m.size) for m in t.getmembers() if m.isfile()]
+    except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+        log.warning("Can't read the member index of %s: %s", path, e)
+    return None
+
+
+def _apk_sigfile_size(members):
+    """Estimate the size of the apk v1 signature file for `members`."""
+    return _APK_SIGFILE_HEADER_BYTES + sum(
+        len(_jar_manifest_line("Name: {}".format(name).encode("utf-8"), b"\r\n"))
+        + _APK_SIGFILE_SECTION_BYTES
+        for name, _ in members
+        if not _is_jar_signature_file(name)
+    )
+
+
+def _hash_mode_upload_size(context, fmt, signing_function, members):
+    """Return what a hash signing mode sends to autograph for `fmt`.
+
+    Args:
+        context (Context): the signing context, or None if unknown
+        fmt (str): the signing format
+        signing_function (str): the name of the signing function for `fmt`
+        members (list): the archive members of the file to sign, or None
+
+    Raises:
+        SigningScriptError: if ``xpi_hash_signing`` is set, but `fmt` needs
+            COSE signatures
+
+    Returns:
+        int: the bytes sent, or None if the whole file is sent
+
+    """
+    if context is None:
+        return None
+    if signing_function == "sign_gpg_with_autograph":
+        if context.config.get("gpg_hash_signing_keyid"):
+            return _DIGEST_BYTES
+    elif signing_function == "sign_langpack":
+        if _use_xpi_hash_signing(context, fmt):
+            return _XPI_SIGFILE_BYTES
+    elif signing_function == "sign_jar":
+        if (
+            context.config.get("apk_hash_signing")
+            and is_apk_autograph_signing_format(fmt)
+            and members is not None
+        ):
+            return _apk_sigfile_size(members)
+    return None
+
+
+def _inner_files(signing_function, path, members):
+    """Return the archive members `signing_function` will sign, or None if unknown."""
+    if members is None:
+        if signing_function in ("sign_signcode", "sign_authenticode_zip"):
+            return [os.path.basename(path)]
+        return None
+    names = [name for name, _ in members]
+    if signing_function in ("sign_signcode", "sign_authenticode_zip"):
+        return [name for name in names if _should_sign_windows(name)]
+    if signing_function == "sign_widevine":
+        return sorted(_get_widevine_signing_files(names))
+    if signing_function == "sign_omnija":
+        return sorted(_get_omnija_signing_files(names))
+    return None
+
+
+# explain_path {{{1
+def explain_path(path, full_path, formats, context=None):
+    """Estimate the work and cost of signing a single path.
+
+    Args:
+        path (str): the relative path of the upstream artifact
+        full_path (str): the path to the artifact on disk
+        formats (list): the ordered signing formats
+        context (Context, optional): the signing context, whose config
+            selects the hash signing modes. If None, whole files are
+            assumed to be sent. Defaults to None.
+
+    Returns:
+        dict: the formats, the inner files to sign per format, the bytes to
+            upload to autograph and to the signing servers, the number of
+            remote calls, and the uncompressed bytes to repack.
+
+    """
+    size = os.path.getsize(full_path)
+    members = get_archive_members(full_path)
+    member_sizes = dict(members or [])
+    explanation = {
+        "formats": list(formats),
+        "size": size,
+        "inner_files": {},
+        "autograph_upload_bytes": 0,
+        "signing_server_upload_bytes": 0,
+        "remote_calls": 0,
+        "repack_bytes": 0,
+    }
+    for fmt in formats:
+        signing_format = get_signing_format(fmt)
+        signing_function = signing_format.signing_function
+        if signing_function in _WHOLE_FILE_FUNCTIONS:
+            hash_mode_size = _hash_mode_upload_size(
+                context, fmt, signing_function, members
+            )
+            upload_sizes = [size if hash_mode_size is None else hash_mode_size]
+        elif signing_format.hash_only and not signing_format.archive_internal:
+            upload_sizes = [_DIGEST_BYTES]
+        else:
+            inner_files = _inner_files(signing_function, path, members)
+            explanation["inner_files"][fmt] = inner_files
+            if inner_files is None:
+                log.warning("Can't estimate the %s work for %s", fmt, path)
+                continue
+            if signing_format.hash_only:
+                upload_sizes = [_DIGEST_BYTES] * len(inner_files)
+            elif (
+                signing_function == "sign_omnija"
+                and context is not None
+                and _use_xpi_hash_signing(context, fmt)
+            ):
+                upload_sizes = [_XPI_SIGFILE_BYTES] * len(inner_files)
+            else:
+                upload_sizes = [member_sizes.get(f, size) for f in inner_files]
+            if inner_files and members is not None:
+                explanation["repack_bytes"] += sum(member_sizes.values())
+        explanation["remote_calls"] += len(upload_sizes)
+        if signing_format.autograph:
+            explanation["autograph_upload_bytes"] += sum(
+                _b64_size(s) for s in upload_sizes
+            )
+        else:
+            explanation["signing_server_upload_bytes"] += sum(upload_sizes)
+    return explanation
+
+
+# explain_task {{{1
+def explain_task(context):
+    """Estimate the work and cost of signing every path in the task.
+
+    Args:
+        context (Context): the signing context
+
+    Raises:
+        TaskVerificationError: if the upstream artifacts don't exist on disk
+
+    Returns:
+        dict: the per-path explanations under `paths`, and their sums under
+            `total`.
+
+    """
+    paths = {}
+    total = {
+        "autograph_upload_bytes": 0,
+        "signing_server_upload_bytes": 0,
+        "remote_calls": 0,
+        "repack_bytes": 0,
+    }
+    for path, path_dict in build_filelist_dict(context).items():
+        explanation = explain_path(
+            path, path_dict["full_path"], path_dict["formats"], context
+        )
+        for key in total:
+            total[key] += explanation[key]
+        paths[path] = explanation
+    return {"paths": paths, "total": total}
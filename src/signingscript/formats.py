@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""Signingscript signing format registry.
+
+Every signing format a task can request is described by a `SigningFormat`,
+which names the `signingscript.sign` function that handles it and declares
+the traits the rest of signingscript uses to order and schedule work.
+
+Attributes:
+    SigningFormat (namedtuple): a registered signing format.
+        ``pattern`` (str): the regex matching the format name.
+        ``signing_function`` (str): the name of the function in
+            `signingscript.sign` that signs this format.
+        ``autograph`` (bool): signed by autograph rather than a signing server.
+        ``modifies_binary`` (bool): the signed file is rewritten in place.
+        ``detached_sig`` (bool): produces separate signature files.
+        ``archive_internal`` (bool): signs files inside an archive.
+        ``hash_only`` (bool): only a digest is sent to the signer.
+        ``signs_bundle`` (bool): signs a whole app bundle, so must follow any
+            format that changes the bundle contents.
+    FORMATS (tuple): the registered formats, in match order.
+    DEFAULT_FORMAT (SigningFormat): the format used for unregistered names.
+
+"""
+from collections import namedtuple
+import functools
+import re
+
+
+SigningFormat = namedtuple(
+    "SigningFormat",
+    [
+        "pattern",
+        "signing_function",
+        "autograph",
+        "modifies_binary",
+        "detached_sig",
+        "archive_internal",
+        "hash_only",
+        "signs_bundle",
+    ],
+)
+
+
+def _format(
+    pattern,
+    signing_function,
+    autograph=False,
+    modifies_binary=True,
+    detached_sig=False,
+    archive_internal=False,
+    hash_only=False,
+    signs_bundle=False,
+):
+    return SigningFormat(
+        pattern,
+        signing_function,
+        autograph,
+        modifies_binary,
+        detached_sig,
+        archive_internal,
+        hash_only,
+        signs_bundle,
+    )
+
+
+# Names are matched in full first. If no pattern matches the whole name, the
+# first pattern matching a prefix of it wins, e.g. `widevine_blessed` is a
+# `widevine` format. More specific patterns must therefore come first.
+FORMATS = (
+    # TODO: Remove the next item (in favor of the regex one), once Focus is migrated
+    _format("autograph_focus", "sign_jar", autograph=True),
+    _format("autograph_apk_.+", "sign_jar", autograph=True),
+    _format(
+        "autograph_hash_only_mar384(:\\w+)?",
+        "sign_mar384_with_autograph_hash",
+        autograph=True,
+        hash_only=True,
+    ),
+    _format(
+        "autograph_stage_mar384(:\\w+)?",
+        "sign_mar384_with_autograph_hash",
+        autograph=True,
+        hash_only=True,
+    ),
+    _format("gpg", "sign_gpg", modifies_binary=False, detached_sig=True),
+    _format(
+        "autograph_gpg",
+        "sign_gpg_with_autograph",
+        autograph=True,
+        modifies_binary=False,
+        detached_sig=True,
+    ),
+    _format("jar", "sign_jar"),
+    _format("focus-jar", "sign_jar"),
+    _format("macapp", "sign_macapp", signs_bundle=True),
+    _format("osslsigncode", "sign_signcode", archive_internal=True),
+    _format("sha2signcode", "sign_signcode", archive_internal=True),
+    # sha2signcodestub uses a generic sign_file
+    _format("signcode", "sign_signcode", archive_internal=True),
+    _format(
+        "widevine",
+        "sign_widevine",
+        modifies_binary=False,
+        detached_sig=True,
+        archive_internal=True,
+    ),
+    _format(
+        "autograph_widevine",
+        "sign_widevine",
+        autograph=True,
+        modifies_binary=False,
+        detached_sig=True,
+        archive_internal=True,
+        hash_only=True,
+    ),
+    _format("autograph_omnija", "sign_omnija", autograph=True, archive_internal=True),
+    _format("autograph_langpack", "sign_langpack", autograph=True),
+    _format(
+        "autograph_authenticode_stub",
+        "sign_authenticode_zip",
+        autograph=True,
+        archive_internal=True,
+        hash_only=True,
+    ),
+    _format(
+        "autograph_authenticode",
+        "sign_authenticode_zip",
+        autograph=True,
+        archive_internal=True,
+        hash_only=True,
+    ),
+)
+
+DEFAULT_FORMAT = _format("default", "sign_file")
+
+_FORMATS_RE = re.compile(
+    "|".join("(?P<f{}>{})".format(i, f.pattern) for i, f in enumerate(FORMATS))
+)
+
+
+# get_signing_format {{{1
+@functools.lru_cache(maxsize=None)
+def get_signing_format(format_):
+    """Look up the registered `SigningFormat` for a format name.
+
+    Args:
+        format_ (str): the format name, e.g. `autograph_hash_only_mar384:keyid`
+
+    Returns:
+        SigningFormat: the matching format, or `DEFAULT_FORMAT` for
+            unregistered names. Unregistered `autograph_` names are
+            autograph-backed.
+
+    """
+    match = _FORMATS_RE.fullmatch(format_) or _FORMATS_RE.match(format_)
+    if match:
+        return FORMATS[int(match.lastgroup[1:])]
+    return DEFAULT_FORMAT._replace(autograph=format_.startswith("autograph_"))
+
+
+# format_sort_key {{{1
+def format_sort_key(format_):
+    """Return the sort key that orders a format relative to the others.
+
+    Formats that modify binaries come first. Archive-internal detached
+    signatures (widevine) must cover the final binaries, bundle signing
+    (macapp) must cover the whole bundle including those signatures, and
+    plain detached signatures (gpg) must cover the final file.
+
+    Args:
+        format_ (str): the format name
+
+    Returns:
+        tuple: the sort key.
+
+    """
+    f = get_signing_format(format_)
+    return (
+        f.detached_sig and not f.archive_internal,
+        f.signs_bundle,
+        f.detached_sig and f.archive_internal,
+    )
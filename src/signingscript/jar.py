@@ -0,0 +1,650 @@
+#!/usr/bin/env python
+"""Signingscript jar archive helpers.
+
+`JarReader` reads the same archives as the vendored `mozjar.JarReader`,
+including Gecko's preloading layout, from a read-only map of the file, and
+keeps the central directory in a compact column table.
+
+`StreamingJarWriter` writes the same archives as the vendored
+`mozjar.JarWriter`, but writes each entry to disk as it's added rather than
+holding the whole archive in memory.
+
+"""
+from array import array
+import collections
+import concurrent.futures
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+JAR_STORED = 0
+JAR_DEFLATED = 8
+JAR_BROTLI = 0x81
+
+_CHUNK_SIZE = 1024 * 1024
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_LOCAL_HEADER_MAGIC = 0x04034B50
+_CDIR_ENTRY = struct.Struct("<IHHHHHHIIIHHHHHII")
+_CDIR_ENTRY_MAGIC = 0x02014B50
+_CDIR_END = struct.Struct("<IHHHHIIH")
+_CDIR_END_MAGIC = 0x06054B50
+_CDIR_END_SIGNATURE = struct.pack("<I", _CDIR_END_MAGIC)
+_MAX_COMMENT_SIZE = 0xFFFF
+# January 1st, 2010. See bug 592369.
+_LASTMOD_DATE = ((2010 - 1980) << 9) | (1 << 5) | 1
+
+
+class JarReaderError(Exception):
+    """Error type for jar reader errors."""
+
+
+class JarWriterError(Exception):
+    """Error type for jar writer errors."""
+
+
+class JarEntryReader(object):
+    """An entry in a `JarReader`.
+
+    This has the attributes `StreamingJarWriter` needs to copy the entry
+    without recompressing it.
+
+    """
+
+    __slots__ = (
+        "filename",
+        "compress",
+        "crc32",
+        "compressed_size",
+        "uncompressed_size",
+        "_reader",
+        "_offset",
+    )
+
+    def __init__(self, reader, index):
+        """Read the entry's fields from the reader's table."""
+        self._reader = reader
+        self._offset = reader.offsets[index]
+        self.filename = reader.names[index]
+        self.compress = reader.compressions[index]
+        self.crc32 = reader.crc32s[index]
+        self.compressed_size = reader.compressed_sizes[index]
+        self.uncompressed_size = reader.uncompressed_sizes[index]
+
+    @property
+    def compressed(self):
+        """bool: whether the entry is compressed."""
+        return self.compress != JAR_STORED
+
+    @property
+    def compressed_data(self):
+        """bytes: the raw entry data, as stored in the jar."""
+        data = self._reader._data
+        (magic,) = struct.unpack_from("<I", data, self._offset)
+        if magic != _LOCAL_HEADER_MAGIC:
+            raise JarReaderError("Bad local file header for {}".format(self.filename))
+        name_size, extra_size = struct.unpack_from("<HH", data, self._offset + 26)
+        start = self._offset + _LOCAL_HEADER.size + name_size + extra_size
+        end = start + self.compressed_size
+        return data[start:end]
+
+    def read(self):
+        """Return the uncompressed entry data.
+
+        Raises:
+            JarReaderError: for unsupported compression, or a size mismatch.
+
+        """
+        data = self.compressed_data
+        if self.compress == JAR_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        elif self.compress != JAR_STORED:
+            raise JarReaderError(
+                "Unsupported compression {} for {}".format(self.compress, self.filename)
+            )
+        if len(data) != self.uncompressed_size:
+            raise JarReaderError("Corrupted file? {}".format(self.filename))
+        return data
+
+
+# JarReader {{{1
+class JarReader(object):
+    """Read a jar archive from a read-only map of the file.
+
+    The central directory is parsed once into parallel columns, so consumers
+    that only need entry metadata don't allocate anything per entry.
+    Directories are skipped.
+
+    Attributes:
+        names (list): the entry names, in central directory order.
+        offsets (array): the local file header offset of each entry.
+        compressions (array): the compression method of each entry.
+        crc32s (array): the crc32 of each entry.
+        compressed_sizes (array): the compressed size of each entry.
+        uncompressed_sizes (array): the uncompressed size of each entry.
+        last_preloaded (str): the name of the last entry Gecko preloads, or
+            None if the jar isn't optimized.
+
+    Args:
+        path (str): the path to the jar
+
+    Raises:
+        JarReaderError: if `path` isn't a jar.
+
+    """
+
+    def __init__(self, path):
+        """Map the jar and parse its central directory."""
+        with open(path, "rb") as fh:
+            try:
+                self._data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise JarReaderError("Not a jar? {}".format(path))
+        try:
+            self._parse_cdir()
+        except (JarReaderError, struct.error) as e:
+            self.close()
+            raise JarReaderError("Not a jar? {}: {}".format(path, e))
+
+    def _parse_cdir(self):
+        data = self._data
+        # The end of central directory record is followed by a comment of up
+        # to 64k, which may itself contain the record's signature
+        start = max(0, len(data) - _CDIR_END.size - _MAX_COMMENT_SIZE)
+        end = len(data)
+        while True:
+            end = data.rfind(_CDIR_END_SIGNATURE, start, end)
+            if end < 0:
+                raise JarReaderError("No end of central directory")
+            if end + _CDIR_END.size > len(data):
+                continue
+            (_, _, _, _, count, _, cdir_offset, comment_size) = _CDIR_END.unpack_from(
+                data, end
+            )
+            if end + _CDIR_END.size + comment_size == len(data):
+                break
+        preload = 0
+        # Optimized jars start with the preload size, then the central directory
+        if cdir_offset == 4:
+            (preload,) = struct.unpack_from("<I", data, 0)
+
+        self.names = []
+        self.offsets = array("L")
+        self.compressions = array("H")
+        self.crc32s = array("L")
+        self.compressed_sizes = array("L")
+        self.uncompressed_sizes = array("L")
+        self.last_preloaded = None
+        unpack = _CDIR_ENTRY.unpack_from
+        pos = cdir_offset
+        for _ in range(count):
+            (
+                magic,
+                creator_version,
+                _,
+                _,
+                compression,
+                _,
+                _,
+                crc32,
+                compressed_size,
+                uncompressed_size,
+                name_size,
+                extra_size,
+                comment_size,
+                _,
+                _,
+                external_attr,
+                offset,
+            ) = unpack(data, pos)
+            if magic != _CDIR_ENTRY_MAGIC:
+                raise JarReaderError("Bad central directory entry")
+            name_start = pos + _CDIR_ENTRY.size
+            name_end = name_start + name_size
+            pos = name_end + extra_size + comment_size
+            # Skip directories. The creator host system is 0 for MSDOS, where
+            # the low attribute bits are FAT attributes, and 3 for Unix, where
+            # the high bits are the st_mode.
+            host = creator_version >> 8
+            if (host == 0 and external_attr & 0x10) or (
+                host == 3 and external_attr & (0o040000 << 16)
+            ):
+                continue
+            self.names.append(data[name_start:name_end].decode("utf-8"))
+            self.offsets.append(offset)
+            self.compressions.append(compression)
+            self.crc32s.append(crc32)
+            self.compressed_sizes.append(compressed_size)
+            self.uncompressed_sizes.append(uncompressed_size)
+            if offset < preload:
+                self.last_preloaded = self.names[-1]
+
+    def __enter__(self):
+        """Context manager __enter__ method."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        """Context manager __exit__ method."""
+        self.close()
+
+    def close(self):
+        """Unmap the jar."""
+        self._data.close()
+
+    def __len__(self):
+        """Return the number of entries."""
+        return len(self.names)
+
+    def __iter__(self):
+        """Iterate over the entries, as `JarEntryReader`s."""
+        for index in range(len(self.names)):
+            yield JarEntryReader(self, index)
+
+    @property
+    def compression(self):
+        """int: the highest compression method used, like `mozjar.JarReader`."""
+        return max(self.compressions, default=JAR_STORED)
+
+
+class _Entry(object):
+    __slots__ = (
+        "name",
+        "creator_version",
+        "external_attr",
+        "lastmod_time",
+        "lastmod_date",
+        "compression",
+        "crc32",
+        "compressed_size",
+        "uncompressed_size",
+        "offset",
+    )
+
+    @property
+    def min_version(self):
+        return 20 if self.compression != JAR_STORED else 10
+
+    @property
+    def general_flag(self):
+        # Max compression
+        return 2 if self.compression != JAR_STORED else 0
+
+    def local_header(self):
+        return (
+            _LOCAL_HEADER.pack(
+                _LOCAL_HEADER_MAGIC,
+                self.min_version,
+                self.general_flag,
+                self.compression,
+                self.lastmod_time,
+                self.lastmod_date,
+                self.crc32,
+                self.compressed_size,
+                self.uncompressed_size,
+                len(self.name),
+                0,
+            )
+            + self.name
+        )
+
+    def cdir_entry(self, base_offset):
+        return (
+            _CDIR_ENTRY.pack(
+                _CDIR_ENTRY_MAGIC,
+                self.creator_version,
+                self.min_version,
+                self.general_flag,
+                self.compression,
+                self.lastmod_time,
+                self.lastmod_date,
+                self.crc32,
+                self.compressed_size,
+                self.uncompressed_size,
+                len(self.name),
+                0,
+                0,
+                0,
+                0,
+                self.external_attr,
+                self.offset + base_offset,
+            )
+            + self.name
+        )
+
+
+def _normalize_name(name):
+    if isinstance(name, bytes):
+        name = name.decode("utf-8")
+    return name.replace(os.sep, "/").encode("utf-8")
+
+
+def _compression(compress):
+    if compress is True or compress is None:
+        return JAR_DEFLATED
+    if compress is False:
+        return JAR_STORED
+    return compress
+
+
+def _read_chunks(data, fileobj):
+    if fileobj is None:
+        return [bytes(data)]
+    return iter(lambda: fileobj.read(_CHUNK_SIZE), b"")
+
+
+def _rewind(fileobj):
+    try:
+        fileobj.seek(0)
+    except (AttributeError, OSError):
+        return False
+    return True
+
+
+def _compress_entry(raw, compress, compress_level):
+    """Compress a whole entry in memory, for the writer's thread pool.
+
+    zlib releases the GIL while compressing, so entries compress in
+    parallel.
+
+    Returns:
+        tuple: the compression used, crc32, uncompressed size and payload.
+
+    """
+    crc = zlib.crc32(raw) & 0xFFFFFFFF
+    if compress == JAR_DEFLATED:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        deflated = compressor.compress(raw) + compressor.flush()
+        if len(deflated) < len(raw):
+            return JAR_DEFLATED, crc, len(raw), deflated
+    return JAR_STORED, crc, len(raw), raw
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time[:6]
+    return (
+        (hour << 11) | (minute << 5) | (second // 2),
+        ((year - 1980) << 9) | (month << 5) | day,
+    )
+
+
+# StreamingJarWriter {{{1
+class StreamingJarWriter(object):
+    """Write a jar archive, streaming each entry to disk as it's added.
+
+    Entries are written in the order they're added. If `last_preloaded` is
+    given, every entry up to and including it is preloaded by Gecko, and the
+    entries are spooled to a temporary file next to `file` until the central
+    directory, which Gecko expects first, can be written.
+
+    With a single worker, memory use is bounded by the size of a compression
+    chunk. With more, entries are compressed whole in a thread pool, at most
+    two per worker at a time, and still written in the order they're added.
+    Either way the archive is the same.
+
+    Args:
+        file (str): the path to write the archive to
+        compress (int or bool, optional): the default compression for
+            entries. Defaults to deflate.
+        compress_level (int, optional): the zlib compression level. Defaults
+            to 9.
+        last_preloaded (str, optional): the name of the last entry to
+            preload. Defaults to None, for a standard jar layout.
+        workers (int, optional): the number of entries to compress
+            concurrently. Defaults to 1.
+
+    """
+
+    def __init__(
+        self, file, compress=True, compress_level=9, last_preloaded=None, workers=1
+    ):
+        """Open the archive for writing."""
+        self._file = file
+        self._compress = _compression(compress)
+        self._compress_level = compress_level
+        self._last_preloaded = (
+            _normalize_name(last_preloaded) if last_preloaded else None
+        )
+        self._preload_size = 0
+        self._entries = []
+        self._names = set()
+        self._executor = None
+        self._pending = collections.deque()
+        self._max_pending = 2 * workers
+        if workers > 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+        if self._last_preloaded:
+            self._data = tempfile.TemporaryFile(
+                dir=os.path.dirname(os.path.abspath(file))
+            )
+        else:
+            self._data = open(file, "wb")
+
+    def __enter__(self):
+        """Context manager __enter__ method."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        """Finish the archive, or discard it on error."""
+        if exc_type is None:
+            self.finish()
+        else:
+            self._close()
+
+    def add(self, name, data, compress=None, mode=None, date_time=None):
+        """Add an entry to the archive.
+
+        `data` may be bytes, a file-like object, or an entry read from another
+        jar (anything with `compressed_data`, `compress`, `crc32`,
+        `compressed_size` and `uncompressed_size`). Entries read from another
+        jar with the same compression are copied without recompressing.
+
+        As with `mozjar.JarWriter`, data is only stored compressed if that's
+        smaller than storing it uncompressed. Names ending in ``/`` are
+        directories.
+
+        Args:
+            name (str): the name of the entry
+            data: the contents of the entry
+            compress (int or bool, optional): the compression to use.
+                Defaults to the writer's default.
+            mode (int, optional): the unix permissions to store.
+            date_time (tuple, optional): the modification time, as in
+                `zipfile.ZipInfo`. Defaults to January 1st 2010, like
+                `mozjar.JarWriter`.
+
+        Raises:
+            JarWriterError: for duplicate entries, or unsupported data or
+                compression.
+
+        """
+        entry = _Entry()
+        entry.name = _normalize_name(name)
+        if entry.name in self._names:
+            raise JarWriterError("File {} already in jar".format(name))
+        entry.creator_version = 20
+        entry.external_attr = 0
+        if mode is not None:
+            # Unix host, so the mode is honored
+            entry.creator_version |= 3 << 8
+            entry.external_attr = (mode & 0xFFFF) << 16
+        if entry.name.endswith(b"/"):
+            # MS-DOS directory attribute
+            entry.external_attr |= 0x10
+        if date_time is None:
+            entry.lastmod_time, entry.lastmod_date = 0, _LASTMOD_DATE
+        else:
+            entry.lastmod_time, entry.lastmod_date = _dos_date_time(date_time)
+        compress = self._compress if compress is None else _compression(compress)
+
+        if hasattr(data, "compressed_data") and data.compress == compress:
+            result = concurrent.futures.Future()
+            result.set_result(
+                (
+                    compress if data.compressed else JAR_STORED,
+                    data.crc32,
+                    data.uncompressed_size,
+                    data.compressed_data,
+                )
+            )
+            if data.compressed:
+                entry.compressed_size = data.compressed_size
+        else:
+            if hasattr(data, "read"):
+                fileobj = data
+                _rewind(fileobj)
+            elif isinstance(data, (bytes, bytearray, memoryview)):
+                fileobj = None
+            else:
+                raise JarWriterError("Don't know how to handle {}".format(type(data)))
+            if compress not in (JAR_STORED, JAR_DEFLATED):
+                raise JarWriterError("Unsupported compression {}".format(compress))
+            if self._executor is None:
+                self._names.add(entry.name)
+                self._stream_data(entry, data, fileobj, compress)
+                self._add_written(entry)
+                return
+            # Read here, as callers may close their files once this returns
+            result = self._executor.submit(
+                _compress_entry,
+                b"".join(_read_chunks(data, fileobj)),
+                compress,
+                self._compress_level,
+            )
+        self._names.add(entry.name)
+        self._pending.append((entry, result))
+        self._drain()
+
+    def _drain(self, wait=False):
+        """Write out compressed entries, in order, as they're ready.
+
+        Blocks while too many entries are pending, or until all of them are
+        written if `wait` is set.
+
+        """
+        while self._pending:
+            entry, result = self._pending[0]
+            if not (wait or len(self._pending) > self._max_pending or result.done()):
+                break
+            self._pending.popleft()
+            (
+                entry.compression,
+                entry.crc32,
+                entry.uncompressed_size,
+                payload,
+            ) = result.result()
+            entry.compressed_size = len(payload)
+            entry.offset = self._data.tell()
+            self._data.write(entry.local_header())
+            self._data.write(payload)
+            self._add_written(entry)
+
+    def _add_written(self, entry):
+        if (
+            max(entry.offset, entry.compressed_size, entry.uncompressed_size)
+            > 0xFFFFFFFF
+        ):
+            raise JarWriterError("{} needs zip64".format(entry.name.decode("utf-8")))
+        if entry.name == self._last_preloaded:
+            self._preload_size = self._data.tell()
+        self._entries.append(entry)
+
+    def _stream_data(self, entry, data, fileobj, compress):
+        """Write an entry's data, back-patching the local header once it's known."""
+        entry.offset = self._data.tell()
+        entry.compression = compress
+        entry.crc32 = entry.compressed_size = entry.uncompressed_size = 0
+        self._data.write(entry.local_header())
+        data_offset = self._data.tell()
+        crc = 0
+        size = 0
+        compressor = None
+        if compress == JAR_DEFLATED:
+            compressor = zlib.compressobj(
+                self._compress_level, zlib.DEFLATED, -zlib.MAX_WBITS
+            )
+        for chunk in _read_chunks(data, fileobj):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            self._data.write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            self._data.write(compressor.flush())
+        compressed_size = self._data.tell() - data_offset
+        if compressor and compressed_size >= size:
+            # Compression didn't help, so store the data instead
+            if fileobj is None or _rewind(fileobj):
+                self._data.seek(data_offset)
+                self._data.truncate()
+                for chunk in _read_chunks(data, fileobj):
+                    self._data.write(chunk)
+                entry.compression = JAR_STORED
+                compressed_size = size
+        entry.crc32 = crc & 0xFFFFFFFF
+        entry.compressed_size = compressed_size
+        entry.uncompressed_size = size
+        end = self._data.tell()
+        self._data.seek(entry.offset)
+        self._data.write(entry.local_header())
+        self._data.seek(end)
+
+    def _cdir_end(self, cdir_size, cdir_offset):
+        if len(self._entries) > 0xFFFF:
+            raise JarWriterError("Too many entries without zip64")
+        return _CDIR_END.pack(
+            _CDIR_END_MAGIC,
+            0,
+            0,
+            len(self._entries),
+            len(self._entries),
+            cdir_size,
+            cdir_offset,
+            0,
+        )
+
+    def _close(self):
+        if self._executor is not None:
+            for _, result in self._pending:
+                result.cancel()
+            self._executor.shutdown()
+        self._data.close()
+
+    def finish(self):
+        """Write the central directory, and close the archive.
+
+        The layout matches `mozjar.JarWriter.finish`. Optimized archives start
+        with the preload size, the central directory and an end of central
+        directory record, followed by the entries and a second end of central
+        directory record.
+
+        Raises:
+            JarWriterError: if `last_preloaded` was never added.
+
+        """
+        try:
+            self._drain(True)
+            cdir_size = sum(_CDIR_ENTRY.size + len(e.name) for e in self._entries)
+            if not self._last_preloaded:
+                data_size = self._data.tell()
+                for entry in self._entries:
+                    self._data.write(entry.cdir_entry(0))
+                self._data.write(self._cdir_end(cdir_size, data_size))
+                return
+            if not self._preload_size:
+                raise JarWriterError(
+                    "Preloaded file {} not in jar".format(
+                        self._last_preloaded.decode("utf-8")
+                    )
+                )
+            end = self._cdir_end(cdir_size, 4)
+            base_offset = 4 + cdir_size + len(end)
+            with open(self._file, "wb") as to:
+                to.write(struct.pack("<I", self._preload_size + base_offset))
+                for entry in self._entries:
+                    to.write(entry.cdir_entry(base_offset))
+                to.write(end)
+                self._data.seek(0)
+                shutil.copyfileobj(self._data, to, _CHUNK_SIZE)
+                to.write(end)
+        finally:
+            self._close()
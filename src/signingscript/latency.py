@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""Signingscript autograph request deadlines and hedging.
+
+Every autograph request gets connect and read deadlines, so a stalled
+connection fails and is retried, rather than hanging until the task times
+out. Small requests can also be hedged: when a ``/sign/hash`` or
+``/sign/data`` request takes longer than the 95th percentile of recent ones
+of the same size to the same server, a duplicate goes to another suitable
+server, and the first response wins. ``/sign/file`` uploads, and other
+requests larger than ``autograph_hedge_max_size``, are never hedged, since
+duplicating them would double the upload, and the memory it takes.
+
+"""
+import asyncio
+import collections
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# The autograph methods that can be hedged
+HEDGE_METHODS = ("hash", "data")
+
+_DEFAULTS = {
+    "autograph_connect_timeout": 10,
+    "autograph_read_timeout": 300,
+    "autograph_hedging": False,
+    "autograph_hedge_min_samples": 20,
+    "autograph_hedge_max_size": 1024 * 1024,
+}
+_config = dict(_DEFAULTS)
+_windows = {}
+
+# How many recent latencies to keep for each server, method and size class
+WINDOW_SIZE = 200
+
+
+# configure {{{1
+def configure(config):
+    """Set the deadlines and hedging from the script config.
+
+    Args:
+        config (dict): the running config. ``autograph_connect_timeout``
+            and ``autograph_read_timeout`` are the deadlines, in seconds.
+            ``autograph_hedging`` turns hedging on, once
+            ``autograph_hedge_min_samples`` latencies have been seen for a
+            server, for requests of up to ``autograph_hedge_max_size``
+            bytes.
+
+    """
+    _config.update(
+        {key: config.get(key, default) for key, default in _DEFAULTS.items()}
+    )
+
+
+# timeouts {{{1
+def timeouts():
+    """Return the deadlines for an autograph request.
+
+    Returns:
+        tuple: the connect and read timeouts, in seconds, as `requests`
+            takes them
+
+    """
+    return (_config["autograph_connect_timeout"], _config["autograph_read_timeout"])
+
+
+# record {{{1
+def size_class(size):
+    """Return which latency window a request of `size` bytes belongs to.
+
+    Latency grows with the size of the request, so a large request is only
+    compared with others within a factor of 4 or so of its size.
+
+    Args:
+        size (int): the size of the request's payload, in bytes
+
+    Returns:
+        int: the size class
+
+    """
+    return size.bit_length() // 2
+
+
+def record(server, method, seconds, size=0):
+    """Record how long a successful request took.
+
+    Args:
+        server (str): the autograph server
+        method (str): the autograph method, e.g. ``hash``
+        seconds (float): how long the request took
+        size (int, optional): the size of the request's payload, in bytes.
+            Defaults to 0.
+
+    """
+    key = (server, method, size_class(size))
+    window = _windows.get(key)
+    if window is None:
+        window = _windows[key] = collections.deque(maxlen=WINDOW_SIZE)
+    window.append(seconds)
+
+
+def percentile(server, method, size=0, fraction=0.95):
+    """Return a percentile of the recent latencies for requests like this one.
+
+    Args:
+        server (str): the autograph server
+        method (str): the autograph method
+        size (int, optional): the size of the request's payload, in bytes.
+            Defaults to 0.
+        fraction (float, optional): the percentile, from 0 to 1. Defaults
+            to 0.95.
+
+    Returns:
+        float: the latency, in seconds, or None if fewer than
+            ``autograph_hedge_min_samples`` have been seen
+
+    """
+    window = _windows.get((server, method, size_class(size)), ())
+    if not window or len(window) < _config["autograph_hedge_min_samples"]:
+        return None
+    ordered = sorted(window)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def timed(server, method, coro, size=0):
+    """Await `coro`, recording its latency if it succeeds.
+
+    Args:
+        server (str): the autograph server
+        method (str): the autograph method
+        coro (coroutine): the request
+        size (int, optional): the size of the request's payload, in bytes.
+            Defaults to 0.
+
+    Returns:
+        the result of `coro`
+
+    """
+    started = time.monotonic()
+    result = await coro
+    record(server, method, time.monotonic() - started, size)
+    return result
+
+
+# hedge {{{1
+async def hedge(method, servers, call, size=0):
+    """Make a request, hedging it to a second server if it's slow.
+
+    Args:
+        method (str): the autograph method. Only `HEDGE_METHODS` are hedged.
+        servers (list): the servers that can handle the request, primary
+            first
+        call (callable): takes a server, and returns a coroutine making the
+            request to it
+        size (int, optional): the size of the request's payload, in bytes.
+            Requests larger than ``autograph_hedge_max_size`` aren't
+            hedged. Defaults to 0.
+
+    Returns:
+        the first successful response
+
+    """
+    primary = servers[0]
+    delay = None
+    if (
+        _config["autograph_hedging"]
+        and method in HEDGE_METHODS
+        and len(servers) > 1
+        and size <= _config["autograph_hedge_max_size"]
+    ):
+        delay = percentile(primary.server, method, size)
+    first = asyncio.ensure_future(call(primary))
+    if delay is None:
+        return await first
+    # Whatever's still pending is cancelled on the way out, including if
+    # this is cancelled while waiting to hedge
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+
+        backup = servers[1]
+        log.info(
+            "autograph %s request to %s is taking longer than %.2fs; hedging to %s",
+            method,
+            primary.server,
+            delay,
+            backup.server,
+        )
+        pending.add(asyncio.ensure_future(call(backup)))
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                if not future.exception():
+                    return future.result()
+        # Both failed; report the primary's failure
+        return first.result()
+    finally:
+        for future in pending:
+            future.cancel()
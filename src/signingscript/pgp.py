@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""Signingscript OpenPGP packet helpers.
+
+These build v4 detached signatures (RFC 4880) around a signature made
+elsewhere, so that only the signature hash needs to be sent to the signer.
+
+Attributes:
+    PGPKey (namedtuple): the parts of an OpenPGP public key a signature
+        refers to.
+        ``fingerprint`` (bytes): the v4 fingerprint.
+        ``key_id`` (bytes): the 8-byte key id.
+        ``algorithm`` (int): the public key algorithm id.
+
+"""
+import base64
+from collections import namedtuple
+import functools
+import hashlib
+import os
+import struct
+
+from signingscript.exceptions import SigningScriptError
+
+PGPKey = namedtuple("PGPKey", ["fingerprint", "key_id", "algorithm"])
+
+# RFC 4880 9.1 and 9.4
+PUBKEY_ALGORITHM_RSA = 1
+HASH_ALGORITHMS = {"sha256": 8, "sha384": 9, "sha512": 10}
+
+_SIGNATURE_TAG = 2
+_PUBLIC_KEY_TAG = 6
+_BINARY_DOCUMENT = 0x00
+_SUBPACKET_CREATION_TIME = 2
+_SUBPACKET_ISSUER = 16
+_SUBPACKET_ISSUER_FINGERPRINT = 33
+
+
+def _crc24(data):
+    # RFC 4880 6.1
+    crc = 0xB704CE
+    for byte in data:
+        crc ^= byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+    return crc & 0xFFFFFF
+
+
+# armor {{{1
+def armor(data, block_type="SIGNATURE"):
+    """ASCII-armor OpenPGP packets.
+
+    Args:
+        data (bytes): the packets
+        block_type (str, optional): the armor block type. Defaults to
+            ``SIGNATURE``.
+
+    Returns:
+        str: the armored packets
+
+    """
+    encoded = base64.b64encode(data).decode("ascii")
+    lines = [f"-----BEGIN PGP {block_type}-----", ""]
+    while encoded:
+        lines.append(encoded[:64])
+        encoded = encoded[64:]
+    crc = base64.b64encode(struct.pack(">I", _crc24(data))[1:]).decode("ascii")
+    lines.append(f"={crc}")
+    lines.append(f"-----END PGP {block_type}-----")
+    return "\n".join(lines) + "\n"
+
+
+# dearmor {{{1
+def dearmor(text):
+    """Decode ASCII-armored OpenPGP packets.
+
+    Args:
+        text (str): the armored packets
+
+    Raises:
+        SigningScriptError: if `text` isn't armored, or its checksum doesn't
+            match.
+
+    Returns:
+        bytes: the packets
+
+    """
+    lines = [line.strip() for line in text.strip().splitlines()]
+    try:
+        start = next(
+            i for i, line in enumerate(lines) if line.startswith("-----BEGIN PGP ")
+        )
+        end = next(
+            i for i, line in enumerate(lines) if line.startswith("-----END PGP ")
+        )
+        # Armor headers end at the first blank line
+        first = lines.index("", start) + 1
+        body = lines[first:end]
+    except (StopIteration, ValueError):
+        raise SigningScriptError("Not an ASCII-armored OpenPGP block")
+    checksum = None
+    if body and body[-1].startswith("="):
+        checksum = body.pop()[1:]
+    data = base64.b64decode("".join(body))
+    if (
+        checksum is not None
+        and base64.b64decode(checksum) != struct.pack(">I", _crc24(data))[1:]
+    ):
+        raise SigningScriptError("OpenPGP armor checksum mismatch")
+    return data
+
+
+def _read_packet(data):
+    """Return the tag and body of the first packet in `data`."""
+    first = data[0]
+    if not first & 0x80:
+        raise SigningScriptError("Not an OpenPGP packet")
+    if first & 0x40:
+        tag = first & 0x3F
+        if data[1] < 192:
+            length, offset = data[1], 2
+        elif data[1] < 224:
+            length, offset = ((data[1] - 192) << 8) + data[2] + 192, 3
+        elif data[1] == 255:
+            length, offset = struct.unpack(">I", data[2:6])[0], 6
+        else:
+            raise SigningScriptError("Partial length OpenPGP packets aren't supported")
+    else:
+        tag = (first >> 2) & 0x0F
+        length_type = first & 0x03
+        if length_type == 3:
+            raise SigningScriptError(
+                "Indeterminate length OpenPGP packets aren't supported"
+            )
+        size = 1 << length_type
+        length = int.from_bytes(data[1:][:size], "big")
+        offset = 1 + size
+    return tag, data[offset:][:length]
+
+
+def _packet(tag, body):
+    """Encode a new format OpenPGP packet."""
+    length = len(body)
+    if length < 192:
+        header = bytes([length])
+    elif length < 8384:
+        length -= 192
+        header = bytes([(length >> 8) + 192, length & 0xFF])
+    else:
+        header = b"\xff" + struct.pack(">I", length)
+    return bytes([0xC0 | tag]) + header + body
+
+
+def _subpacket(subpacket_type, body):
+    # All our subpackets are shorter than 192 bytes
+    return bytes([len(body) + 1, subpacket_type]) + body
+
+
+def _mpi(value):
+    value = value.lstrip(b"\x00")
+    bits = (len(value) - 1) * 8 + value[0].bit_length() if value else 0
+    return struct.pack(">H", bits) + value
+
+
+# load_public_key {{{1
+def load_public_key(path):
+    """Read the fingerprint, key id and algorithm of an OpenPGP public key.
+
+    Keys are cached, so a long-running process only rereads a key when its
+    file changes, e.g. when the key is rotated between tasks.
+
+    Args:
+        path (str): the path to the ASCII-armored public key
+
+    Raises:
+        SigningScriptError: if the file doesn't start with a v4 public key.
+
+    Returns:
+        PGPKey: the key
+
+    """
+    st = os.stat(path)
+    return _load_public_key(path, st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+@functools.lru_cache(maxsize=16)
+def _load_public_key(path, mtime_ns, size, inode):
+    # The file's stat is part of the cache key, so changes are picked up
+    with open(path, "r") as fh:
+        tag, body = _read_packet(dearmor(fh.read()))
+    if tag != _PUBLIC_KEY_TAG or not body or body[0] != 4:
+        raise SigningScriptError(f"{path} isn't a v4 OpenPGP public key")
+    fingerprint = hashlib.sha1(b"\x99" + struct.pack(">H", len(body)) + body).digest()
+    return PGPKey(fingerprint, fingerprint[-8:], body[5])
+
+
+# make_signature_trailer {{{1
+def make_signature_trailer(key, hash_type, created):
+    """Build the hashed part of a v4 binary document signature.
+
+    The signature hash is the digest of the document followed by this trailer.
+
+    Args:
+        key (PGPKey): the signing key
+        hash_type (str): one of ``HASH_ALGORITHMS``
+        created (int): the signature creation time, in seconds since the epoch
+
+    Raises:
+        SigningScriptError: for keys other than RSA
+
+    Returns:
+        bytes: the trailer
+
+    """
+    if key.algorithm != PUBKEY_ALGORITHM_RSA:
+        raise SigningScriptError(f"Unsupported OpenPGP key algorithm {key.algorithm}")
+    hashed_subpackets = _subpacket(
+        _SUBPACKET_CREATION_TIME, struct.pack(">I", created)
+    ) + _subpacket(_SUBPACKET_ISSUER_FINGERPRINT, b"\x04" + key.fingerprint)
+    hashed = (
+        bytes([4, _BINARY_DOCUMENT, key.algorithm, HASH_ALGORITHMS[hash_type]])
+        + struct.pack(">H", len(hashed_subpackets))
+        + hashed_subpackets
+    )
+    return hashed + b"\x04\xff" + struct.pack(">I", len(hashed))
+
+
+# make_detached_signature {{{1
+def make_detached_signature(key, trailer, digest, signature):
+    """Assemble an armored detached signature.
+
+    Args:
+        key (PGPKey): the signing key
+        trailer (bytes): the trailer from `make_signature_trailer`
+        digest (bytes): the signature hash
+        signature (bytes): the PKCS#1 v1.5 RSA signature of `digest`
+
+    Returns:
+        str: the armored signature, as written to a ``.asc`` file
+
+    """
+    hashed = trailer[:-6]
+    unhashed_subpackets = _subpacket(_SUBPACKET_ISSUER, key.key_id)
+    body = (
+        hashed
+        + struct.pack(">H", len(unhashed_subpackets))
+        + unhashed_subpackets
+        + digest[:2]
+        + _mpi(signature)
+    )
+    return armor(_packet(_SIGNATURE_TAG, body))
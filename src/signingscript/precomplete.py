@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""Signingscript precomplete generation from archive members.
+
+This builds the same ``precomplete`` file as `createprecomplete`, from a list
+of archive member names rather than by walking an extracted tree.
+
+"""
+import difflib
+import posixpath
+
+from signingscript.exceptions import SigningScriptError
+
+PRECOMPLETE = "precomplete"
+
+
+# find_precomplete {{{1
+def find_precomplete(members, where="the archive"):
+    """Find the single `precomplete` file in a list of archive members.
+
+    Args:
+        members (list): the archive member names
+        where (str, optional): what to call the archive in errors.
+
+    Raises:
+        SigningScriptError: if there isn't exactly one `precomplete` file.
+
+    Returns:
+        str: the member name of the `precomplete` file
+
+    """
+    found = [m for m in members if posixpath.basename(m.rstrip("/")) == PRECOMPLETE]
+    if not found:
+        raise SigningScriptError('No `precomplete` file found in "{}"'.format(where))
+    if len(found) > 1:
+        raise SigningScriptError(
+            'More than one `precomplete` file {} in "{}"'.format(found, where)
+        )
+    return found[0]
+
+
+# Precomplete {{{1
+class Precomplete(object):
+    """The remove and rmdir instructions of a `precomplete` file.
+
+    Like `createprecomplete.generate_precomplete`, paths are relative to the
+    directory holding `precomplete`, or to the bundle for
+    ``Contents/Resources/precomplete`` in a mac app. Directories are the
+    members ending in ``/``, and the parents of every member.
+
+    Args:
+        name (str): the member name of the `precomplete` file
+        members (iterable, optional): the archive member names. More can
+            be added later with `add`.
+
+    """
+
+    def __init__(self, name, members=()):
+        """Index `members`."""
+        self.name = posixpath.normpath(name)
+        root = posixpath.dirname(self.name)
+        if posixpath.basename(root) == "Resources":
+            root = posixpath.dirname(posixpath.dirname(root))
+        self._root = "{}/".format(root) if root else ""
+        self.files = set()
+        self.dirs = set()
+        for member in members:
+            self.add(member)
+
+    def add(self, member):
+        """Add an archive member, such as a newly added sigfile.
+
+        Args:
+            member (str): the member name. Directories end in ``/``.
+
+        """
+        is_dir = member.endswith("/")
+        path = posixpath.normpath(member)
+        if path == "." or not path.startswith(self._root):
+            return
+        start = len(self._root)
+        path = path[start:]
+        parts = path.split("/")
+        for i in range(1, len(parts) + is_dir):
+            self._add_dir("/".join(parts[:i]) + "/")
+        if is_dir:
+            return
+        if not (
+            path.endswith("channel-prefs.js")
+            or path.endswith("update-settings.ini")
+            or path.find("distribution/") != -1
+        ):
+            self.files.add(path)
+
+    def _add_dir(self, path):
+        if path.find("distribution/") == -1:
+            self.dirs.add(path)
+
+    def lines(self):
+        """Return the lines of the `precomplete` file.
+
+        Returns:
+            list: the remove lines, then the rmdir lines, each in reverse
+                sorted order.
+
+        """
+        return ['remove "{}"\n'.format(f) for f in sorted(self.files, reverse=True)] + [
+            'rmdir "{}"\n'.format(d) for d in sorted(self.dirs, reverse=True)
+        ]
+
+
+def _sort_key(line):
+    command, _, quoted = line.rstrip("\n").partition(" ")
+    if command not in ("remove", "rmdir") or len(quoted) < 2:
+        return None
+    return (command == "rmdir", quoted[1:-1])
+
+
+def _in_order(keys):
+    if None in keys:
+        return False
+    # Each section is in reverse order, with no duplicates
+    return all(
+        a[0] < b[0] or (a[0] == b[0] and a[1] > b[1]) for a, b in zip(keys, keys[1:])
+    )
+
+
+# diff {{{1
+def diff(before, after):
+    """Diff two `precomplete` files, in `difflib.ndiff` format.
+
+    `precomplete` files are sorted, so this is a linear merge. Files that
+    aren't in `Precomplete.lines` order fall back to `difflib.ndiff`.
+
+    Args:
+        before (list): the lines of the original file
+        after (list): the lines of the new file
+
+    Returns:
+        iterator: the diff lines
+
+    """
+    before_keys = [_sort_key(line) for line in before]
+    after_keys = [_sort_key(line) for line in after]
+    if not (_in_order(before_keys) and _in_order(after_keys)):
+        return difflib.ndiff(before, after)
+    return _merge_diff(before, before_keys, after, after_keys)
+
+
+def _merge_diff(before, before_keys, after, after_keys):
+    i = j = 0
+    while i < len(before) and j < len(after):
+        if before_keys[i] == after_keys[j]:
+            yield "  {}".format(after[j])
+            i += 1
+            j += 1
+        elif before_keys[i][0] < after_keys[j][0] or (
+            before_keys[i][0] == after_keys[j][0]
+            and before_keys[i][1] > after_keys[j][1]
+        ):
+            yield "- {}".format(before[i])
+            i += 1
+        else:
+            yield "+ {}".format(after[j])
+            j += 1
+    for line in before[i:]:
+        yield "- {}".format(line)
+    for line in after[j:]:
+        yield "+ {}".format(line)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""Signingscript preflight checks.
+
+Many payload problems only surface once signing is under way, e.g. a
+langpack with a bad manifest, or a zip with nothing in it to sign. By then
+the task may have spent minutes signing other files. The preflight checks
+every path against its chain of formats before anything is sent to a
+signer, reading only archive indexes and manifests, so a task that's going
+to fail, fails in seconds.
+
+"""
+import asyncio
+import logging
+import os
+import zipfile
+
+from scriptworker.exceptions import TaskVerificationError
+
+from signingscript import executor
+from signingscript.exceptions import SigningScriptError
+from signingscript.formats import get_signing_format
+
+# signingscript.explain imports signingscript.task before signingscript.sign,
+# which imports it back.
+from signingscript.explain import get_archive_members
+from signingscript.sign import (
+    _langpack_id,
+    _should_sign_windows,
+    _use_xpi_hash_signing,
+    get_mar_verification_key,
+)
+from signingscript.task import get_cert_type, get_signing_servers
+from signingscript.utils import split_autograph_format
+
+log = logging.getLogger(__name__)
+
+# The archives that sign_widevine and sign_omnija can sign. dmgs are
+# converted to tarballs first.
+_INTERNAL_ARCHIVE_EXTENSIONS = (".zip", ".tar.bz2", ".tar.gz", ".dmg")
+
+
+def _check_extension(kind, path):
+    if not path.endswith(_INTERNAL_ARCHIVE_EXTENSIONS):
+        raise SigningScriptError("Unknown {} file format for {}".format(kind, path))
+
+
+def _check_widevine(context, fmt, path, full_path):
+    _check_extension("widevine", path)
+
+
+def _check_omnija(context, fmt, path, full_path):
+    _check_extension("omnija", path)
+    _use_xpi_hash_signing(context, fmt)
+
+
+def _check_langpack(context, fmt, path, full_path):
+    if not path.endswith(".xpi"):
+        raise SigningScriptError("Expected a .xpi")
+    _use_xpi_hash_signing(context, fmt)
+    if full_path is None:
+        return
+    try:
+        _langpack_id(full_path)
+    except (KeyError, ValueError, OSError, zipfile.BadZipFile) as e:
+        raise SigningScriptError(
+            "Can't read the langpack manifest of {}: {}".format(path, e)
+        )
+
+
+def _check_windows(context, fmt, path, full_path):
+    if not path.endswith(".zip"):
+        files = [path]
+    elif full_path is None:
+        return
+    else:
+        members = get_archive_members(full_path)
+        if members is None:
+            raise SigningScriptError("Can't read the zip index of {}".format(path))
+        files = [name for name, _ in members]
+    if not any(_should_sign_windows(f) for f in files):
+        raise SigningScriptError(
+            "Did not find any files to sign, all files: {}".format(files)
+        )
+
+
+def _check_authenticode(context, fmt, path, full_path):
+    _check_windows(context, fmt, path, full_path)
+    keys = ["authenticode_cert"]
+    if fmt.endswith("authenticode_stub"):
+        keys.append("authenticode_cross_cert")
+    for key in keys:
+        if not context.config.get(key):
+            raise SigningScriptError(
+                "{} is enabled, but {} is not defined".format(fmt, key)
+            )
+        if not os.path.exists(context.config[key]):
+            raise SigningScriptError(
+                "{} ({}) doesn't exist!".format(key, context.config[key])
+            )
+
+
+def _check_mar(context, fmt, path, full_path):
+    fmt, keyid = split_autograph_format(fmt)
+    key = get_mar_verification_key(get_cert_type(context), fmt, keyid)
+    if not os.path.exists(key):
+        raise SigningScriptError(
+            "Can't find mar verify key for {} ({}): {} doesn't exist".format(
+                fmt, keyid, key
+            )
+        )
+
+
+# Checks for the signing functions that can fail on the payload, keyed by
+# signing function name. Each raises SigningScriptError on a problem.
+_CHECKS = {
+    "sign_widevine": _check_widevine,
+    "sign_omnija": _check_omnija,
+    "sign_langpack": _check_langpack,
+    "sign_signcode": _check_windows,
+    "sign_authenticode_zip": _check_authenticode,
+    "sign_mar384_with_autograph_hash": _check_mar,
+}
+
+
+# check_path {{{1
+def check_path(context, path, full_path, formats):
+    """Check that a path can be signed with its formats, without signing it.
+
+    Args:
+        context (Context): the signing context
+        path (str): the relative path of the upstream artifact
+        full_path (str): the path to the artifact on disk
+        formats (list): the ordered signing formats
+
+    Returns:
+        list: a message for each problem found
+
+    """
+    problems = []
+    signed_path = path
+    for fmt in formats:
+        signing_format = get_signing_format(fmt)
+        signing_function = signing_format.signing_function
+        try:
+            if signing_format.autograph:
+                get_signing_servers(
+                    context, split_autograph_format(fmt)[0], raise_on_empty_list=True
+                )
+            check = _CHECKS.get(signing_function)
+            if check is not None:
+                check(context, fmt, signed_path, full_path)
+        except SigningScriptError as e:
+            problems.append("{} ({}): {}".format(path, fmt, e))
+        if signed_path.endswith(".dmg") and signing_function in (
+            "sign_widevine",
+            "sign_omnija",
+        ):
+            # The later formats sign the converted tarball, which doesn't
+            # exist yet
+            signed_path = "{}.tar.gz".format(os.path.splitext(signed_path)[0])
+            full_path = None
+    return problems
+
+
+# preflight {{{1
+async def preflight(context, filelist_dict):
+    """Check every path in the task before signing any of them.
+
+    The paths are checked concurrently, on the I/O pool.
+
+    Args:
+        context (Context): the signing context, with its signing plan
+        filelist_dict (dict of dicts): the output of `build_filelist_dict`
+
+    Raises:
+        TaskVerificationError: listing every problem found
+
+    """
+    results = await asyncio.gather(
+        *(
+            executor.run_io(
+                check_path, context, path, path_dict["full_path"], path_dict["formats"]
+            )
+            for path, path_dict in filelist_dict.items()
+        )
+    )
+    messages = [message for problems in results for message in problems]
+    if messages:
+        for message in messages:
+            log.error(message)
+        raise TaskVerificationError(messages)
@@ -1,16 +1,22 @@
 #!/usr/bin/env python
 """Signing script."""
 import aiohttp
+import asyncio
+import json
 import logging
 import os
 import ssl
 
 import scriptworker.client
+from signingscript import broker, concurrency, daemon, executor, latency
+from signingscript.explain import explain_task
+from signingscript.preflight import preflight
+from signingscript.sign import warm_autograph_connections
 from signingscript.task import (
     build_filelist_dict,
+    build_signing_plan,
     get_token,
     sign,
-    task_cert_type,
     task_signing_formats,
 )
 from signingscript.utils import (
@@ -24,16 +30,27 @@ log = logging.getLogger(__name__)
 
 
 # async_main {{{1
-async def async_main(context):
+async def async_main(context, connector=None):
     """Sign all the things.
 
     Args:
         context (Context): the signing context.
+        connector (aiohttp.TCPConnector, optional): a connector to reuse,
+            which is left open. If None, one is created for this task.
+            Defaults to None.
 
     """
-    connector = _craft_aiohttp_connector(context)
+    executor.configure(context.config)
+    broker.configure(context.config)
+    concurrency.configure(context.config)
+    latency.configure(context.config)
+    owns_connector = connector is None
+    if owns_connector:
+        connector = _craft_aiohttp_connector(context)
 
-    async with aiohttp.ClientSession(connector=connector) as session:
+    async with aiohttp.ClientSession(
+        connector=connector, connector_owner=owns_connector
+    ) as session:
         context.session = session
         work_dir = context.config["work_dir"]
         context.signing_servers = load_signing_server_config(context)
@@ -55,20 +72,12 @@ async def async_main(context):
                     "Widevine format is enabled, but widevine_cert is not defined"
                 )
 
-        if not all(
-            is_autograph_signing_format(format_) for format_ in all_signing_formats
-        ):
-            log.info("getting signingserver token")
-            await get_token(
-                context,
-                os.path.join(work_dir, "token"),
-                task_cert_type(context),
-                all_signing_formats,
-            )
-
         filelist_dict = build_filelist_dict(context)
+        context.signing_plan = build_signing_plan(context, filelist_dict)
+        await preflight(context, filelist_dict)
+        await _set_up(context, filelist_dict, all_signing_formats)
+
         for path, path_dict in filelist_dict.items():
-            copy_to_dir(path_dict["full_path"], context.config["work_dir"], target=path)
             log.info("signing %s", path)
             output_files = await sign(
                 context, os.path.join(work_dir, path), path_dict["formats"]
@@ -89,6 +98,76 @@ async def async_main(context):
     log.info("Done!")
 
 
+# _set_up {{{1
+async def _set_up(context, filelist_dict, signing_formats):
+    """Get the task ready to sign.
+
+    Fetching the signing server token, connecting to the autograph servers
+    and copying the files to sign into the work dir don't depend on each
+    other, so they run concurrently. If one fails, the rest are cancelled,
+    except for the copies, which can't be interrupted once they've started;
+    they're waited for instead, so nothing is left writing to the work dir.
+
+    Args:
+        context (Context): the signing context, with its signing plan.
+        filelist_dict (dict of dicts): the output of `build_filelist_dict`
+        signing_formats (set): all the task's signing formats
+
+    """
+    work_dir = context.config["work_dir"]
+    setup = [
+        warm_autograph_connections(
+            s for servers in context.signing_plan.servers.values() for s in servers
+        )
+    ]
+    copies = [
+        asyncio.ensure_future(
+            executor.run_io(copy_to_dir, path_dict["full_path"], work_dir, target=path)
+        )
+        for path, path_dict in filelist_dict.items()
+    ]
+    if not all(is_autograph_signing_format(format_) for format_ in signing_formats):
+        log.info("getting signingserver token")
+        setup.append(
+            get_token(
+                context,
+                os.path.join(work_dir, "token"),
+                context.signing_plan.cert_type,
+                signing_formats,
+            )
+        )
+    futures = [asyncio.ensure_future(coro) for coro in setup]
+    try:
+        await asyncio.gather(*futures, *(asyncio.shield(c) for c in copies))
+    finally:
+        for future in futures:
+            future.cancel()
+        await asyncio.wait(futures + copies)
+
+
+# async_explain {{{1
+async def async_explain(context):
+    """Report what signing the task would do and cost, without signing anything.
+
+    The report is printed to stdout as json.
+
+    Args:
+        context (Context): the signing context.
+
+    """
+    report = explain_task(context)
+    for path, explanation in report["paths"].items():
+        log.info(
+            "%s: %s; %d remote calls, %d bytes to autograph, %d bytes to repack",
+            path,
+            ", ".join(explanation["formats"]),
+            explanation["remote_calls"],
+            explanation["autograph_upload_bytes"],
+            explanation["repack_bytes"],
+        )
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
 def _craft_aiohttp_connector(context):
     kwargs = {}
     if context.config.get("ssl_cert"):
@@ -117,6 +196,24 @@ def get_default_config(base_dir=None):
         "token_duration_seconds": 20 * 60,
         "ssl_cert": None,
         "signtool": "signtool",
+        "signtool_in_process": True,
+        "xpi_hash_signing": False,
+        "xpi_cose_formats": ["autograph_omnija", "autograph_langpack"],
+        "apk_hash_signing": False,
+        "zip_compress_level": 6,
+        "compress_workers": None,
+        "io_workers": None,
+        "cpu_workers": None,
+        "concurrency_limits": {"autograph": 8, "signing_server": 4},
+        "format_concurrency_limits": {},
+        "max_concurrency": 64,
+        "latency_tolerance": 3.0,
+        "autograph_memory_budget": None,
+        "autograph_connect_timeout": 10,
+        "autograph_read_timeout": 300,
+        "autograph_hedging": False,
+        "autograph_hedge_min_samples": 20,
+        "autograph_hedge_max_size": 1024 * 1024,
         "schema_file": os.path.join(
             os.path.dirname(__file__), "data", "signing_task_schema.json"
         ),
@@ -125,17 +222,47 @@ def get_default_config(base_dir=None):
         "dmg": "dmg",
         "hfsplus": "hfsplus",
         "gpg_pubkey": None,
+        "gpg_hash_signing_keyid": None,
         "widevine_cert": None,
+        "daemon_socket": None,
+        "autograph_broker_socket": None,
+        "autograph_broker_timeout": 1800,
+        "autograph_broker_max_connections": 8,
+        "autograph_broker_batch_size": 16,
+        "autograph_broker_batch_window": 0.005,
+        "autograph_broker_memo_size": 4096,
     }
     return default_config
 
 
 def main():
-    """Start signing script."""
+    """Start signing script.
+
+    If the config names a ``daemon_socket`` with a daemon listening on it, the
+    task is handed to the daemon. Otherwise it's signed in this process.
+    The ``signingscript`` entry point is `daemon.client_main`, which doesn't
+    import this module unless it has to.
+
+    """
+    return daemon.client_main()
+
+
+def run_in_process():
+    """Sign the task in this process."""
     mohawk_log = logging.getLogger("mohawk")
     mohawk_log.setLevel(logging.INFO)
+    try:
+        return scriptworker.client.sync_main(
+            async_main, default_config=get_default_config()
+        )
+    finally:
+        executor.shutdown()
+
+
+def explain_main():
+    """Explain the signing script's plan for a task, without signing."""
     return scriptworker.client.sync_main(
-        async_main, default_config=get_default_config()
+        async_explain, default_config=get_default_config()
     )
 
 
@@ -2,62 +2,122 @@
 """Signingscript task functions."""
 import asyncio
 import base64
-import difflib
+import concurrent.futures
 import fnmatch
-import glob
+import functools
+import hashlib
+import importlib
 import json
 import logging
 import os
+import random
 import re
 
 # TODO: Use aiohttp for this.
 import requests
 import shutil
+import stat
 import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
+import time
 import zipfile
 
-from requests_hawk import HawkAuth
-from mardor.reader import MarReader
-from mardor.writer import add_signature_block
-
-from scriptworker.utils import (
-    get_single_item_from_sequence,
-    makedirs,
-    raise_future_exceptions,
-    retry_async,
-    rm,
-)
+from scriptworker.utils import makedirs, retry_async, rm
 
+from signingscript import broker
+from signingscript import concurrency
+from signingscript import executor
+from signingscript import latency
+from signingscript import pgp
 from signingscript import task
 from signingscript import utils
-from signingscript.createprecomplete import generate_precomplete
-from signingscript.exceptions import SigningScriptError
-
-try:
-    # NB. The widevine module needs to be deployed separately
-    import widevine
-except ImportError:
-    widevine = None
-
-import winsign.sign
-from winsign.crypto import load_pem_certs
-
-sys.path.append(  # append the mozbuild vendor
-    os.path.abspath(
-        os.path.join(
-            os.path.realpath(os.path.dirname(__file__)), "vendored", "mozbuild"
-        )
-    )
+from signingscript import workspace
+from signingscript.exceptions import SigningScriptError, SigningServerError
+from signingscript.jar import JarReader, StreamingJarWriter
+from signingscript.precomplete import (
+    Precomplete,
+    diff as precomplete_diff,
+    find_precomplete,
 )
-
-from mozpack import mozjar  # noqa: E402
+from signingscript.workspace import Workspace
 
 
 log = logging.getLogger(__name__)
 
+
+class _LazyImport(object):
+    """A format backend, imported the first time it's used.
+
+    Most tasks only sign a few formats, so importing every backend up front
+    slows down startup for nothing. Calling the proxy or getting one of its
+    attributes imports the backend.
+
+    Args:
+        module (str): the module to import
+        attr (str, optional): the name in `module` to use. If None, use the
+            module itself. Defaults to None.
+        submodules (tuple, optional): submodules of `module` to import
+            with it. Defaults to ().
+        optional (bool, optional): whether the backend may not be installed.
+            A missing optional backend is falsy. Defaults to False.
+
+    """
+
+    def __init__(self, module, attr=None, submodules=(), optional=False):
+        """Set up the import, without importing anything."""
+        self._module = module
+        self._attr = attr
+        self._submodules = submodules
+        self._optional = optional
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            for submodule in self._submodules:
+                importlib.import_module(submodule)
+            target = importlib.import_module(self._module)
+            if self._attr is not None:
+                target = getattr(target, self._attr)
+            self._target = target
+        return self._target
+
+    def __bool__(self):
+        """Import an optional backend, and return whether it's installed."""
+        if self._optional:
+            try:
+                self._load()
+            except ImportError:
+                return False
+        return True
+
+    def __getattr__(self, name):
+        """Get an attribute of the backend."""
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        """Call the backend."""
+        return self._load()(*args, **kwargs)
+
+
+HawkAuth = _LazyImport("requests_hawk", "HawkAuth")
+MarReader = _LazyImport("mardor.reader", "MarReader")
+add_signature_block = _LazyImport("mardor.writer", "add_signature_block")
+# NB. The widevine module needs to be deployed separately
+widevine = _LazyImport("widevine", optional=True)
+# Without the signtool library we fall back to the `signtool` executable
+signtool = _LazyImport(
+    "signtool",
+    submodules=("signtool.signing.client", "signtool.signtool"),
+    optional=True,
+)
+winsign = _LazyImport("winsign", submodules=("winsign.sign",))
+load_pem_certs = _LazyImport("winsign.crypto", "load_pem_certs")
+
 _ZIP_ALIGNMENT = (
     "4"
 )  # Value must always be 4, based on https://developer.android.com/studio/command-line/zipalign.html
@@ -94,6 +154,23 @@ _DEFAULT_MAR_VERIFY_KEYS = {
     },
 }
 
+# In-process signtool retry behaviour, mirroring `signtool.signing.client`.
+# It takes the server ~60s to respond to an attempt to get a signed file, so
+# give up on a server after 5 pending responses.
+_SIGNTOOL_MAX_ERRORS = 5
+_SIGNTOOL_MAX_PENDING_TRIES = 5
+_SIGNTOOL_PENDING_SLEEP = 15
+_SIGNTOOL_ERROR_SLEEP = 1
+# The signing servers expect every upload to carry the nonce returned by the
+# previous one, so uploads from concurrent signing threads are serialized.
+_SIGNTOOL_NONCE_LOCK = threading.Lock()
+
+# JAR signature files, which aren't listed in the manifest they sign
+_JAR_SIGNATURE_FILE_RE = re.compile(
+    r"^META-INF/(manifest\.mf|[^/]+\.(sf|rsa|dsa|ec)|cose\.manifest|cose\.sig)$",
+    re.IGNORECASE,
+)
+
 # Langpacks expect the following re to match for addon id
 LANGPACK_RE = re.compile(
     r"^langpack-[a-zA-Z]+(?:-[a-zA-Z]+){0,2}@(?:firefox|devedition).mozilla.org$"
@@ -158,13 +235,12 @@ def build_signtool_cmd(context, from_, fmt, to=None, servers=None):
     work_dir = context.config["work_dir"]
     token = os.path.join(work_dir, "token")
     nonce = os.path.join(work_dir, "nonce")
-    cert_type = task.task_cert_type(context)
     ssl_cert = context.config["ssl_cert"]
     signtool = context.config["signtool"]
     if not isinstance(signtool, (list, tuple)):
         signtool = [signtool]
     cmd = signtool + ["-n", nonce, "-t", token, "-c", ssl_cert]
-    for s in get_suitable_signing_servers(context.signing_servers, cert_type, [fmt]):
+    for s in task.get_signing_servers(context, fmt):
         cmd.extend(["-H", s.server])
     cmd.extend(["-f", fmt])
     cmd.extend(["-o", to, from_])
@@ -193,14 +269,213 @@ async def sign_file(context, from_, fmt, to=None):
         log.info(
             "sign_file(): signing %s with %s... using autograph /sign/file", from_, fmt
         )
-        await sign_file_with_autograph(context, from_, fmt, to=to)
+        return await sign_file_with_autograph(context, from_, fmt, to=to)
     else:
         log.info("sign_file(): signing %s with %s... using signing server", from_, fmt)
-        cmd = build_signtool_cmd(context, from_, fmt, to=to)
-        await utils.execute_subprocess(cmd)
+        servers = task.get_signing_servers(context, fmt)
+        # signtool spreads the requests over the servers, so limit them together
+        async with concurrency.limit(
+            "signing_server", " ".join(sorted(s.server for s in servers)), fmt
+        ):
+            if context.config.get("signtool_in_process") and signtool:
+                await sign_file_with_signtool(context, from_, fmt, to=to)
+            else:
+                cmd = build_signtool_cmd(context, from_, fmt, to=to)
+                # signtool downloads the signed file next to it first
+                workspace.record("{}.tmp".format(to or from_))
+                await utils.execute_subprocess(cmd)
     return to or from_
 
 
+# sign_file_with_signtool {{{1
+async def sign_file_with_signtool(context, from_, fmt, to=None):
+    """Sign a file with the signing servers, driving the signtool library in-process.
+
+    This avoids forking a `signtool` interpreter per file: the token is read
+    once per task, and the HTTPS connections to the signing servers are pooled
+    in `context.signtool_session`.
+
+    Args:
+        context (Context): the signing context
+        from_ (str): the source file to sign
+        fmt (str): the format to sign with
+        to (str, optional): the target path to sign to. If None, overwrite
+            `from_`. Defaults to None.
+
+    Raises:
+        SigningScriptError: when no suitable signing server is found for fmt
+        SigningServerError: when the file can't be signed by any server
+
+    Returns:
+        str: the path to the signed file
+
+    """
+    to = to or from_
+    urls = [
+        "https://{}".format(s.server)
+        for s in task.get_signing_servers(context, fmt, raise_on_empty_list=True)
+    ]
+    session = _get_signtool_session(context)
+    token = _get_signtool_token(context)
+    abort = threading.Event()
+    loop = asyncio.get_event_loop()
+    try:
+        await loop.run_in_executor(
+            None,
+            functools.partial(
+                _signtool_remote_signfile,
+                context,
+                session,
+                token,
+                urls,
+                from_,
+                fmt,
+                to,
+                abort=abort,
+            ),
+        )
+    except asyncio.CancelledError:
+        # The thread can't be interrupted, so stop it before its next request
+        abort.set()
+        raise
+    return to
+
+
+def _get_signtool_session(context):
+    """Return the task-wide requests session used to talk to the signing servers."""
+    session = getattr(context, "signtool_session", None)
+    if session is None:
+        session = requests.Session()
+        _mount_shared_adapter(session)
+        context.signtool_session = session
+    return session
+
+
+def _get_signtool_token(context):
+    """Return the signing server token written by `task.get_token`."""
+    token = getattr(context, "signtool_token", None)
+    if token is None:
+        with open(os.path.join(context.config["work_dir"], "token"), "rb") as fh:
+            token = fh.read()
+        context.signtool_token = token
+    return token
+
+
+def _signtool_upload(context, session, url, from_, fmt, token):
+    """Upload `from_` for signing, passing along and updating the nonce."""
+    nonce_path = os.path.join(context.config["work_dir"], "nonce")
+    with _SIGNTOOL_NONCE_LOCK:
+        try:
+            with open(nonce_path, "rb") as fh:
+                nonce = fh.read()
+        except IOError:
+            nonce = ""
+        r = signtool.signing.client.uploadfile(
+            url,
+            from_,
+            fmt,
+            token,
+            nonce,
+            context.config["ssl_cert"],
+            method=session.post,
+        )
+        r.raise_for_status()
+        nonce = r.headers["X-Nonce"]
+        if isinstance(nonce, str):
+            nonce = nonce.encode("utf-8")
+        with open(nonce_path, "wb") as fh:
+            fh.write(nonce)
+
+
+def _signtool_remote_signfile(
+    context, session, token, urls, from_, fmt, to, abort=None
+):
+    """Sign `from_` into `to`, following the signtool client protocol.
+
+    This blocks, and is meant to run in an executor. Setting `abort` stops
+    it before its next request, and cuts short any wait between requests.
+
+    Raises:
+        SigningServerError: when the file can't be signed by any server, or
+            `abort` is set
+
+    """
+    if fmt.startswith("sha2signcode") and signtool.signtool.is_authenticode_signed(
+        from_
+    ):
+        log.info("Skipping %s because it looks like it's already signed", from_)
+        return
+    if fmt == "macapp":
+        fmt = "dmg"
+    cert = context.config["ssl_cert"]
+    filehash = utils.as_artifact(from_).hexdigest("sha1")
+    utils.mkdir(os.path.dirname(os.path.abspath(to)))
+    urls = list(urls)
+    random.shuffle(urls)
+    abort = abort or threading.Event()
+    errors = 0
+    pendings = 0
+    while errors < _SIGNTOOL_MAX_ERRORS:
+        if abort.is_set():
+            raise SigningServerError(
+                "{}: signing {} with {} was aborted".format(filehash, from_, fmt)
+            )
+        if pendings >= _SIGNTOOL_MAX_PENDING_TRIES:
+            log.error("%s: giving up on %s after %i tries", filehash, urls[0], pendings)
+            urls.append(urls.pop(0))
+            errors += 1
+            pendings = 0
+            continue
+        url = urls[0]
+        log.info("%s: processing %s on %s", filehash, from_, url)
+        r = None
+        try:
+            # Try to get a previously signed copy of this file
+            r = signtool.signing.client.getfile(
+                url, filehash, fmt, cert, method=session.get
+            )
+            r.raise_for_status()
+            responsehash = r.headers["X-SHA1-Digest"]
+            tmpfile = "{}.tmp".format(to)
+            workspace.record(tmpfile)
+            signed = utils.write_artifact(
+                tmpfile, r.iter_content(1024 ** 2), hash_types=("sha1",)
+            )
+            if signed.hexdigest("sha1") != responsehash:
+                log.warning("%s: hash mismatch; trying to download again", filehash)
+                os.unlink(tmpfile)
+                errors += 1
+                continue
+            signtool.signing.client.overwrite_file(tmpfile, to)
+            log.info("%s: OK", filehash)
+            return
+        except requests.HTTPError:
+            if "X-Pending" in r.headers:
+                log.debug("%s: pending; try again in a bit", filehash)
+                abort.wait(_SIGNTOOL_PENDING_SLEEP)
+                pendings += 1
+                continue
+            errors += 1
+            # That didn't work...so let's upload it
+            log.info("%s: uploading for signing", filehash)
+            try:
+                _signtool_upload(context, session, url, from_, fmt, token)
+            except (requests.RequestException, KeyError) as e:
+                log.exception("%s: error uploading file for signing: %s", filehash, e)
+                urls.append(urls.pop(0))
+            abort.wait(_SIGNTOOL_ERROR_SLEEP)
+        except (requests.RequestException, KeyError):
+            log.exception("%s: connection error; trying again soon", filehash)
+            urls.append(urls.pop(0))
+            errors += 1
+            abort.wait(_SIGNTOOL_ERROR_SLEEP)
+    raise SigningServerError(
+        "{}: giving up signing {} with {} after {} tries".format(
+            filehash, from_, fmt, errors
+        )
+    )
+
+
 # sign_gpg {{{1
 async def sign_gpg(context, from_, fmt):
     """Create a detached armored signature with the gpg key.
@@ -234,11 +509,62 @@ async def sign_jar(context, from_, fmt):
         str: the path to the signed file
 
     """
-    await sign_file(context, from_, fmt)
+    if context.config.get("apk_hash_signing") and utils.is_apk_autograph_signing_format(
+        fmt
+    ):
+        await sign_apk_v1_with_autograph(context, from_, fmt)
+    else:
+        await sign_file(context, from_, fmt)
     await zip_align_apk(context, from_)
     return from_
 
 
+# sign_apk_v1_with_autograph {{{1
+async def sign_apk_v1_with_autograph(context, from_, fmt):
+    """Sign an apk with a v1 (JAR) signature, sending only the signature file to autograph.
+
+    The manifest and signature file are built locally, autograph's
+    `/sign/data` endpoint returns the PKCS7 signature of the signature file,
+    and the `META-INF` entries are written into the apk in a single rewrite.
+
+    Args:
+        context (Context): the signing context
+        from_ (str): the apk to sign in place
+        fmt (str): the format to sign with
+
+    Raises:
+        Requests.RequestException: on failure
+        SigningScriptError: when no suitable signing server is found for fmt
+
+    Returns:
+        str: the path to the signed apk
+
+    """
+    if not utils.is_autograph_signing_format(fmt):
+        raise SigningScriptError(f"Not an autograph format: {fmt}")
+    s, *others = task.get_signing_servers(context, fmt, raise_on_empty_list=True)
+    hash_type = "sha1" if utils.is_sha1_apk_autograph_signing_format(fmt) else "sha256"
+    manifest, sigfile = make_apk_v1_signature_files(from_, hash_type)
+    signature = base64.b64decode(
+        await sign_with_autograph(s, sigfile, fmt, "data", hedge_servers=others)
+    )
+    signed_out = tempfile.mkstemp(
+        prefix="apk_signed", suffix=".apk", dir=context.config["work_dir"]
+    )[1]
+    await executor.run_io(
+        _write_zip_with_metafiles,
+        from_,
+        {
+            "META-INF/MANIFEST.MF": manifest,
+            "META-INF/SIGNATURE.SF": sigfile,
+            "META-INF/SIGNATURE.RSA": signature,
+        },
+        signed_out,
+    )
+    shutil.move(signed_out, from_)
+    return from_
+
+
 # sign_macapp {{{1
 async def sign_macapp(context, from_, fmt):
     """Sign a macapp.
@@ -323,10 +649,22 @@ async def sign_langpack(context, orig_path, fmt):
     if not file_extension == ".xpi":
         raise SigningScriptError("Expected a .xpi")
 
-    id = _langpack_id(orig_path)
+    id = await executor.run_io(_langpack_id, orig_path)
     log.info("Identified {} as extension id: {}".format(orig_path, id))
-    # Sign the appropriate inner files
-    await sign_file_with_autograph(context, orig_path, fmt, extension_id=id)
+    if _use_xpi_hash_signing(context, fmt):
+        metafiles = await sign_jar_metafiles_with_autograph(
+            context, orig_path, fmt, extension_id=id
+        )
+        signed_out = tempfile.mkstemp(
+            prefix="langpack_signed", suffix=".xpi", dir=context.config["work_dir"]
+        )[1]
+        await executor.run_io(
+            _write_zip_with_metafiles, orig_path, metafiles, signed_out
+        )
+        shutil.move(signed_out, orig_path)
+    else:
+        # Sign the appropriate inner files
+        await sign_file_with_autograph(context, orig_path, fmt, extension_id=id)
     return orig_path
 
 
@@ -385,14 +723,21 @@ async def sign_widevine_zip(context, orig_path, fmt):
     # speed over disk space.
     tmp_dir = tempfile.mkdtemp(prefix="wvzip", dir=context.config["work_dir"])
     # Get file list
-    all_files = await _get_zipfile_files(orig_path)
-    files_to_sign = _get_widevine_signing_files(all_files)
+    members = await _get_zipfile_files(orig_path)
+    files_to_sign = _get_widevine_signing_files(members)
     is_autograph = utils.is_autograph_signing_format(fmt)
     log.debug("Widevine files to sign: %s", files_to_sign)
     if files_to_sign:
-        # Extract all files so we can create `precomplete` with the full
-        # file list
-        all_files = await _extract_zipfile(context, orig_path, tmp_dir=tmp_dir)
+        # Only extract the files to sign and `precomplete`. `precomplete` is
+        # regenerated from the member list, and the other members are copied
+        # from the original when repacking
+        all_files = await _extract_zipfile(
+            context,
+            orig_path,
+            tmp_dir=tmp_dir,
+            predicate=lambda name: name in files_to_sign
+            or os.path.basename(name) == "precomplete",
+        )
         tasks = []
         # Sign the appropriate inner files
         for from_, fmt in files_to_sign.items():
@@ -400,23 +745,22 @@ async def sign_widevine_zip(context, orig_path, fmt):
             to = f"{from_}.sig"
             if is_autograph:
                 tasks.append(
-                    asyncio.ensure_future(
-                        sign_widevine_with_autograph(
-                            context, from_, "blessed" in fmt, to=to
-                        )
+                    sign_widevine_with_autograph(
+                        context, from_, "blessed" in fmt, to=to
                     )
                 )
             else:
-                tasks.append(
-                    asyncio.ensure_future(sign_file(context, from_, fmt, to=to))
-                )
+                tasks.append(sign_file(context, from_, fmt, to=to))
             all_files.append(to)
-        await raise_future_exceptions(tasks)
+            members.append(os.path.relpath(to, tmp_dir))
+        await utils.run_concurrently(tasks)
         remove_extra_files(tmp_dir, all_files)
         # Regenerate the `precomplete` file, which is used for cleanup before
         # applying a complete mar.
-        _run_generate_precomplete(context, tmp_dir)
-        await _create_zipfile(context, orig_path, all_files, mode="w", tmp_dir=tmp_dir)
+        _run_generate_precomplete(context, tmp_dir, members)
+        await _create_zipfile(
+            context, orig_path, all_files, mode="w", tmp_dir=tmp_dir, orig=orig_path
+        )
     return orig_path
 
 
@@ -470,22 +814,19 @@ async def sign_widevine_tar(context, orig_path, fmt):
             makedirs(os.path.dirname(to))
             if is_autograph:
                 tasks.append(
-                    asyncio.ensure_future(
-                        sign_widevine_with_autograph(
-                            context, from_, "blessed" in fmt, to=to
-                        )
+                    sign_widevine_with_autograph(
+                        context, from_, "blessed" in fmt, to=to
                     )
                 )
             else:
-                tasks.append(
-                    asyncio.ensure_future(sign_file(context, from_, fmt, to=to))
-                )
+                tasks.append(sign_file(context, from_, fmt, to=to))
             all_files.append(to)
-        await raise_future_exceptions(tasks)
+        await utils.run_concurrently(tasks)
         remove_extra_files(tmp_dir, all_files)
         # Regenerate the `precomplete` file, which is used for cleanup before
-        # applying a complete mar.
-        _run_generate_precomplete(context, tmp_dir)
+        # applying a complete mar. It removes the directories too, including
+        # empty ones.
+        _run_generate_precomplete(context, tmp_dir, all_files.members(dirs=True))
         await _create_tarfile(
             context, orig_path, all_files, compression, tmp_dir=tmp_dir
         )
@@ -550,16 +891,23 @@ async def sign_omnija_zip(context, orig_path, fmt):
     files_to_sign = _get_omnija_signing_files(all_files)
     log.debug("Omnija files to sign: %s", files_to_sign)
     if files_to_sign:
-        all_files = await _extract_zipfile(context, orig_path, tmp_dir=tmp_dir)
+        # Only the omni.ja files need to be extracted; the rest are copied
+        # from the original when repacking
+        all_files = await _extract_zipfile(
+            context,
+            orig_path,
+            tmp_dir=tmp_dir,
+            predicate=lambda name: name in files_to_sign,
+        )
         tasks = []
         # Sign the appropriate inner files
         for from_, fmt in files_to_sign.items():
             from_ = os.path.join(tmp_dir, from_)
-            tasks.append(
-                asyncio.ensure_future(sign_omnija_with_autograph(context, from_))
-            )
-        await raise_future_exceptions(tasks)
-        await _create_zipfile(context, orig_path, all_files, mode="w", tmp_dir=tmp_dir)
+            tasks.append(sign_omnija_with_autograph(context, from_))
+        await utils.run_concurrently(tasks)
+        await _create_zipfile(
+            context, orig_path, all_files, mode="w", tmp_dir=tmp_dir, orig=orig_path
+        )
     return orig_path
 
 
@@ -602,10 +950,8 @@ async def sign_omnija_tar(context, orig_path, fmt):
             # Don't try to sign directories
             if not os.path.isfile(from_):
                 continue
-            tasks.append(
-                asyncio.ensure_future(sign_omnija_with_autograph(context, from_))
-            )
-        await raise_future_exceptions(tasks)
+            tasks.append(sign_omnija_with_autograph(context, from_))
+        await utils.run_concurrently(tasks)
         await _create_tarfile(
             context, orig_path, all_files, compression, tmp_dir=tmp_dir
         )
@@ -637,9 +983,10 @@ def _langpack_id(filename):
 
     Side Affect of checking if filenames are actually langpacks.
     """
-    langpack = zipfile.ZipFile(filename, "r")
     id = None
-    with langpack.open("manifest.json", "r") as f:
+    with zipfile.ZipFile(filename, "r") as langpack, langpack.open(
+        "manifest.json", "r"
+    ) as f:
         manifest = json.load(f)
         if not (
             "languages" in manifest
@@ -706,62 +1053,63 @@ def _get_omnija_signing_files(file_list):
 
 
 # _run_generate_precomplete {{{1
-def _run_generate_precomplete(context, tmp_dir):
-    """Regenerate `precomplete` file with widevine sig paths for complete mar."""
+def _run_generate_precomplete(context, tmp_dir, members):
+    """Regenerate `precomplete` file with widevine sig paths for complete mar.
+
+    The new file is built from the archive member list, rather than by
+    walking `tmp_dir`, and the diff is written to
+    ``public/logs/precomplete.diff``.
+
+    Args:
+        context (Context): the signing context
+        tmp_dir (str): the directory the archive was extracted to
+        members (list): the archive member names, including any added
+            sigfiles
+
+    Raises:
+        SigningScriptError: if there isn't exactly one `precomplete` file.
+
+    """
     log.info("Generating `precomplete` file...")
-    path = _ensure_one_precomplete(tmp_dir, "before")
+    precomplete = Precomplete(find_precomplete(members, tmp_dir), members)
+    path = os.path.join(tmp_dir, precomplete.name)
     with open(path, "r") as fh:
         before = fh.readlines()
-    generate_precomplete(os.path.dirname(path))
-    path = _ensure_one_precomplete(tmp_dir, "after")
-    with open(path, "r") as fh:
-        after = fh.readlines()
+    after = precomplete.lines()
+    # Write in binary mode to prevent OS specific line endings
+    with open(path, "wb") as fh:
+        fh.write("".join(after).encode("utf-8"))
     # Create diff file
     diff_path = os.path.join(context.config["work_dir"], "precomplete.diff")
     with open(diff_path, "w") as fh:
-        for line in difflib.ndiff(before, after):
+        for line in precomplete_diff(before, after):
             fh.write(line)
     utils.copy_to_dir(
         diff_path, context.config["artifact_dir"], target="public/logs/precomplete.diff"
     )
 
 
-# _ensure_one_precomplete {{{1
-def _ensure_one_precomplete(tmp_dir, adj):
-    """Ensure we only have one `precomplete` file in `tmp_dir`."""
-    return get_single_item_from_sequence(
-        glob.glob(os.path.join(tmp_dir, "**", "precomplete"), recursive=True),
-        condition=lambda _: True,
-        ErrorClass=SigningScriptError,
-        no_item_error_message='No `precomplete` file found in "{}"'.format(tmp_dir),
-        too_many_item_error_message='More than one `precomplete` file {} in "{}"'.format(
-            adj, tmp_dir
-        ),
-    )
-
-
 # remove_extra_files {{{1
 def remove_extra_files(top_dir, file_list):
-    """Find any extra files in `top_dir`, given an expected `file_list`.
+    """Remove the files recorded in `top_dir` that aren't in `file_list`.
+
+    See `signingscript.workspace.record`.
 
     Args:
-        top_dir (str): the dir to walk
-        file_list (list): the list of expected files
+        top_dir (str): the workspace directory
+        file_list (list): the list of expected files, usually the
+            `Workspace` returned when extracting to `top_dir`
 
     Returns:
         list: the list of extra files
 
     """
-    all_files = [
-        os.path.realpath(f)
-        for f in glob.glob(os.path.join(top_dir, "**", "*"), recursive=True)
-    ]
-    good_files = [os.path.realpath(f) for f in file_list]
-    extra_files = list(set(all_files) - set(good_files))
+    if not isinstance(file_list, Workspace):
+        file_list = Workspace(top_dir, file_list)
+    extra_files = file_list.extra_files()
     for f in extra_files:
-        if os.path.isfile(f):
-            log.warning("Extra file to clean up: {}".format(f))
-            rm(f)
+        log.warning("Extra file to clean up: {}".format(f))
+        rm(f)
     return extra_files
 
 
@@ -828,20 +1176,43 @@ async def _convert_dmg_to_tar_gz(context, from_):
 
 # _get_zipfile_files {{{1
 async def _get_zipfile_files(from_):
-    with zipfile.ZipFile(from_, mode="r") as z:
-        files = z.namelist()
-        return files
+    def namelist():
+        with zipfile.ZipFile(from_, mode="r") as z:
+            return z.namelist()
+
+    return await executor.run_io(namelist)
 
 
 # _extract_zipfile {{{1
-async def _extract_zipfile(context, from_, files=None, tmp_dir=None):
+async def _extract_zipfile(context, from_, files=None, tmp_dir=None, predicate=None):
+    """Extract members of a zipfile.
+
+    Args:
+        context (Context): the signing context
+        from_ (str): the zipfile to extract
+        files (list, optional): the members to extract. Defaults to None,
+            for all members matching `predicate`.
+        tmp_dir (str, optional): the directory to extract to. Defaults to
+            ``work_dir/unzipped``.
+        predicate (callable, optional): takes a member name, and returns
+            whether to extract it. Defaults to None, for all members.
+
+    Raises:
+        SigningScriptError: on failure
+
+    Returns:
+        Workspace: the paths of the extracted members
+
+    """
     work_dir = context.config["work_dir"]
     tmp_dir = tmp_dir or os.path.join(work_dir, "unzipped")
     log.debug(
         "Extracting {} from {} to {}...".format(files or "all files", from_, tmp_dir)
     )
-    try:
-        extracted_files = []
+    workers = _compress_workers(context)
+
+    def extract():
+        extracted_files = Workspace(tmp_dir)
         rm(tmp_dir)
         utils.mkdir(tmp_dir)
         with zipfile.ZipFile(from_, mode="r") as z:
@@ -849,30 +1220,256 @@ async def _extract_zipfile(context, from_, files=None, tmp_dir=None):
                 for name in files:
                     z.extract(name, path=tmp_dir)
                     extracted_files.append(os.path.join(tmp_dir, name))
-            else:
-                for name in z.namelist():
-                    extracted_files.append(os.path.join(tmp_dir, name))
-                z.extractall(path=tmp_dir)
+                return extracted_files
+            infos = [
+                info
+                for info in z.infolist()
+                if predicate is None or predicate(info.filename)
+            ]
+        for info in infos:
+            extracted_files.append(os.path.join(tmp_dir, info.filename))
+        _extract_zip_members(from_, infos, tmp_dir, workers=workers)
         return extracted_files
+
+    try:
+        return await executor.run_io(extract)
     except Exception as e:
         raise SigningScriptError(e)
 
 
+def _zip_member_path(tmp_dir, name):
+    """Return where zipfile.ZipFile.extract extracts `name` to."""
+    arcname = name.replace("/", os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [
+        x
+        for x in arcname.split(os.path.sep)
+        if x not in ("", os.path.curdir, os.path.pardir)
+    ]
+    return os.path.join(tmp_dir, *parts)
+
+
+def _extract_zip_members(from_, infos, tmp_dir, workers=1):
+    """Extract zipfile members, decompressing them across a thread pool.
+
+    The directory tree is created up front, so the workers only write files.
+    Each worker reads through its own ZipFile, as they can't be shared
+    between threads.
+
+    """
+    dirs = set()
+    for info in infos:
+        path = _zip_member_path(tmp_dir, info.filename)
+        dirs.add(path if info.is_dir() else os.path.dirname(path))
+    for path in sorted(dirs):
+        os.makedirs(path, exist_ok=True)
+    file_infos = [info for info in infos if not info.is_dir()]
+    workers = max(1, min(workers, len(file_infos)))
+
+    def extract(worker_infos):
+        with zipfile.ZipFile(from_, mode="r") as z:
+            for info in worker_infos:
+                z.extract(info, path=tmp_dir)
+
+    if workers == 1:
+        extract(file_infos)
+        return
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        futures = [pool.submit(extract, file_infos[i::workers]) for i in range(workers)]
+        for future in futures:
+            future.result()
+
+
 # _create_zipfile {{{1
-async def _create_zipfile(context, to, files, tmp_dir=None, mode="w"):
+async def _create_zipfile(context, to, files, tmp_dir=None, mode="w", orig=None):
+    """Create a zipfile from files in `tmp_dir`.
+
+    Args:
+        context (Context): the signing context
+        to (str): the zipfile to create
+        files (list): the paths to add
+        tmp_dir (str, optional): the directory the member names are relative
+            to. Defaults to ``work_dir/unzipped``.
+        mode (str, optional): ``w`` to create the zipfile, or ``a`` to append
+            to it. Defaults to ``w``.
+        orig (str, optional): a zipfile that `files` were partially extracted
+            from. Its other members are copied in their original order,
+            without recompressing. `orig` may be `to`. Defaults to None.
+
+    Raises:
+        SigningScriptError: on failure
+
+    Returns:
+        str: `to`
+
+    """
     work_dir = context.config["work_dir"]
     tmp_dir = tmp_dir or os.path.join(work_dir, "unzipped")
-    try:
-        log.info("Creating zipfile {}...".format(to))
-        with zipfile.ZipFile(to, mode=mode, compression=zipfile.ZIP_DEFLATED) as z:
-            for f in files:
-                relpath = os.path.relpath(f, tmp_dir)
-                z.write(f, arcname=relpath)
+    log.info("Creating zipfile {}...".format(to))
+    compress_level = context.config.get("zip_compress_level", 6)
+    workers = _compress_workers(context)
+
+    def create():
+        if mode != "w":
+            with zipfile.ZipFile(to, mode=mode, compression=zipfile.ZIP_DEFLATED) as z:
+                for f in files:
+                    relpath = os.path.relpath(f, tmp_dir)
+                    z.write(f, arcname=relpath)
+            return to
+        paths = {
+            os.path.relpath(f, tmp_dir).replace(os.sep, "/").rstrip("/"): f
+            for f in files
+        }
+        out = to
+        if orig:
+            out = tempfile.mkstemp(prefix="zip", suffix=".zip", dir=work_dir)[1]
+        if _zip_may_need_zip64(orig, paths):
+            # StreamingJarWriter can't write zip64 records
+            log.info("%s may need zip64; writing it with zipfile", to)
+            _create_zip64_zipfile(out, orig, paths, compress_level)
+        else:
+            # Entries are deflated in parallel, and written in the same order
+            # and with the same metadata as zipfile.ZipFile.write
+            with StreamingJarWriter(
+                out, compress_level=compress_level, workers=workers
+            ) as writer:
+                if orig:
+                    _copy_zip_members(orig, paths, writer)
+                for name, f in paths.items():
+                    _add_zip_file(writer, name, f)
+        if orig:
+            shutil.move(out, to)
         return to
+
+    try:
+        return await executor.run_io(create)
     except Exception as e:
         raise SigningScriptError(e)
 
 
+def _add_zip_file(writer, name, path, date_time=None):
+    """Add the file or directory at `path` to `writer` as `name`."""
+    st = os.stat(path)
+    if date_time is None:
+        date_time = time.localtime(st.st_mtime)[:6]
+    if stat.S_ISDIR(st.st_mode):
+        writer.add(
+            name + "/", b"", compress=False, mode=st.st_mode, date_time=date_time
+        )
+        return
+    with open(path, "rb") as fh:
+        writer.add(name, fh, mode=st.st_mode, date_time=date_time)
+
+
+def _copy_zip_members(orig, paths, writer):
+    """Copy the members of the zipfile `orig` to `writer`.
+
+    Members in `paths` are read from disk instead, and popped from `paths`.
+    The rest are copied as is.
+
+    """
+    with zipfile.ZipFile(orig, mode="r") as z, JarReader(orig) as reader:
+        entries = {entry.filename: entry for entry in reader}
+        for info in z.infolist():
+            path = paths.pop(info.filename.rstrip("/"), None)
+            if path is not None:
+                _add_zip_file(
+                    writer, info.filename.rstrip("/"), path, date_time=info.date_time
+                )
+                continue
+            mode = info.external_attr >> 16 or None
+            if info.is_dir():
+                writer.add(
+                    info.filename,
+                    b"",
+                    compress=False,
+                    mode=mode,
+                    date_time=info.date_time,
+                )
+                continue
+            entry = entries[info.filename]
+            writer.add(
+                info.filename,
+                entry,
+                compress=entry.compress,
+                mode=mode,
+                date_time=info.date_time,
+            )
+
+
+def _zip_may_need_zip64(orig, paths):
+    """Whether the zip `_create_zipfile` writes may need zip64 records.
+
+    This is an upper bound: entries are never stored larger than their
+    uncompressed size, or than their compressed size in `orig`.
+
+    """
+    count = len(paths)
+    size = 0
+    for name, path in paths.items():
+        size += zipfile.sizeFileHeader + len(name.encode("utf-8"))
+        size += os.path.getsize(path)
+    if orig:
+        with zipfile.ZipFile(orig, mode="r") as z:
+            for info in z.infolist():
+                if info.filename.rstrip("/") in paths:
+                    continue
+                count += 1
+                size += zipfile.sizeFileHeader + len(info.filename.encode("utf-8"))
+                size += max(info.compress_size, info.file_size)
+    return count > zipfile.ZIP_FILECOUNT_LIMIT or size > zipfile.ZIP64_LIMIT
+
+
+def _create_zip64_zipfile(to, orig, paths, compress_level):
+    """Write the zip `_create_zipfile` would, with zipfile, which supports zip64.
+
+    Members of `orig` are recompressed, rather than copied as is. Files
+    replacing them keep their date and compression.
+
+    """
+    # zipfile adds zip64 records as it needs them, based on the sizes
+    def add_file(z, name, path, orig_info=None):
+        info = zipfile.ZipInfo.from_file(path, name)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        if orig_info is not None:
+            info.date_time = orig_info.date_time
+            info.compress_type = orig_info.compress_type
+        if info.is_dir():
+            z.writestr(info, b"")
+            return
+        with open(path, "rb") as fsrc, z.open(info, "w") as fdst:
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+    with zipfile.ZipFile(
+        to, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compress_level
+    ) as z:
+        if orig:
+            with zipfile.ZipFile(orig, mode="r") as orig_zip:
+                for info in orig_zip.infolist():
+                    path = paths.pop(info.filename.rstrip("/"), None)
+                    if path is not None:
+                        add_file(z, info.filename.rstrip("/"), path, info)
+                        continue
+                    to_info = zipfile.ZipInfo(info.filename, info.date_time)
+                    to_info.compress_type = info.compress_type
+                    to_info.external_attr = info.external_attr
+                    if info.is_dir():
+                        z.writestr(to_info, b"")
+                        continue
+                    to_info.file_size = info.file_size
+                    with orig_zip.open(info) as fsrc, z.open(to_info, "w") as fdst:
+                        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+        for name, path in paths.items():
+            add_file(z, name, path)
+
+
+def _compress_workers(context):
+    """Return how many entries to deflate at once when writing archives."""
+    return context.config.get("compress_workers") or os.cpu_count() or 1
+
+
 # _get_tarfile_compression {{{1
 def _get_tarfile_compression(compression):
     compression = compression.lstrip(".")
@@ -886,9 +1483,12 @@ def _get_tarfile_compression(compression):
 # _get_tarfile_files {{{1
 async def _get_tarfile_files(from_, compression):
     compression = _get_tarfile_compression(compression)
-    with tarfile.open(from_, mode="r:{}".format(compression)) as t:
-        files = t.getnames()
-        return files
+
+    def getnames():
+        with tarfile.open(from_, mode="r:{}".format(compression)) as t:
+            return t.getnames()
+
+    return await executor.run_io(getnames)
 
 
 # _extract_tarfile {{{1
@@ -896,16 +1496,29 @@ async def _extract_tarfile(context, from_, compression, tmp_dir=None):
     work_dir = context.config["work_dir"]
     tmp_dir = tmp_dir or os.path.join(work_dir, "untarred")
     compression = _get_tarfile_compression(compression)
-    try:
-        files = []
+
+    def extract():
+        files = Workspace(tmp_dir)
         rm(tmp_dir)
         utils.mkdir(tmp_dir)
         with tarfile.open(from_, mode="r:{}".format(compression)) as t:
             t.extractall(path=tmp_dir)
-            for name in t.getnames():
-                path = os.path.join(tmp_dir, name)
-                os.path.isfile(path) and files.append(path)
+            for member in t.getmembers():
+                path = os.path.join(tmp_dir, member.name)
+                # Only symlinks need checking on disk, as the target may
+                # not be a file
+                if (
+                    member.isfile()
+                    or member.islnk()
+                    or (member.issym() and os.path.isfile(path))
+                ):
+                    files.append(path)
+                elif member.isdir() or (member.issym() and os.path.isdir(path)):
+                    files.dirs.append(path)
         return files
+
+    try:
+        return await executor.run_io(extract)
     except Exception as e:
         raise SigningScriptError(e)
 
@@ -925,22 +1538,95 @@ async def _create_tarfile(context, to, files, compression, tmp_dir=None):
     work_dir = context.config["work_dir"]
     tmp_dir = tmp_dir or os.path.join(work_dir, "untarred")
     compression = _get_tarfile_compression(compression)
+    log.info("Creating tarfile {}...".format(to))
     try:
-        log.info("Creating tarfile {}...".format(to))
-        with tarfile.open(to, mode="w:{}".format(compression)) as t:
-            for f in files:
-                relpath = os.path.relpath(f, tmp_dir)
-                t.add(f, arcname=relpath, filter=_owner_filter)
+        # Compression holds the GIL for long stretches, so use a process
+        await executor.run_cpu(_write_tarfile, to, list(files), compression, tmp_dir)
         return to
     except Exception as e:
         raise SigningScriptError(e)
 
 
+def _write_tarfile(to, files, compression, tmp_dir):
+    with tarfile.open(to, mode="w:{}".format(compression)) as t:
+        for f in files:
+            relpath = os.path.relpath(f, tmp_dir)
+            t.add(f, arcname=relpath, filter=_owner_filter)
+
+
+class _SharedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """An HTTP adapter whose connection pool outlives the sessions using it.
+
+    Closing a session closes its adapters, which would drop the pooled
+    connections. This keeps them open, so connections to autograph and the
+    signing servers are reused across calls, and across tasks when running
+    as a daemon.
+
+    """
+
+    def close(self):
+        """Keep the pooled connections open."""
+
+
+_SHARED_ADAPTER = _SharedHTTPAdapter()
+
+
+def _mount_shared_adapter(session):
+    session.mount("https://", _SHARED_ADAPTER)
+    session.mount("http://", _SHARED_ADAPTER)
+
+
 async def call_autograph(url, user, password, request_json):
-    """Call autograph and return the json response."""
+    """Call autograph and return the json response.
+
+    The request goes through the node's autograph broker if one is
+    configured and listening. Otherwise it's posted from the thread pool.
+    Either way, it fails if it doesn't connect or respond within the
+    ``autograph_connect_timeout`` and ``autograph_read_timeout`` deadlines.
+
+    The thread can't be interrupted, so if this is cancelled, it waits for
+    the thread's request to finish before passing the cancellation on. The
+    caller's concurrency slot and memory reservation are held until then,
+    rather than letting another upload start on top of it.
+
+    """
+    response = await broker.call(url, user, password, request_json)
+    if response is not None:
+        return response
+    posting = asyncio.ensure_future(
+        executor.run_io(post_autograph, url, user, password, request_json)
+    )
+    try:
+        return await asyncio.shield(posting)
+    except asyncio.CancelledError:
+        await asyncio.wait({posting})
+        # Its result is thrown away, along with any failure
+        if not posting.cancelled():
+            posting.exception()
+        raise
+
+
+def post_autograph(url, user, password, request_json):
+    """Post a request to autograph, blocking until it responds.
+
+    Args:
+        url (str): the autograph url to post to
+        user (str): the autograph user
+        password (str): the autograph password
+        request_json (list): the sign requests
+
+    Raises:
+        requests.RequestException: on failure, including taking longer than
+            the ``autograph_*_timeout`` deadlines
+
+    Returns:
+        list: the json response
+
+    """
     auth = HawkAuth(id=user, key=password)
     with requests.Session() as session:
-        r = session.post(url, json=request_json, auth=auth)
+        _mount_shared_adapter(session)
+        r = session.post(url, json=request_json, auth=auth, timeout=latency.timeouts())
         log.debug(
             "Autograph response: %s", r.text[:120] if len(r.text) >= 120 else r.text
         )
@@ -948,7 +1634,65 @@ async def call_autograph(url, user, password, request_json):
         return r.json()
 
 
-def make_signing_req(input_bytes, server, fmt, keyid=None, extension_id=None):
+# How long to wait for autograph's heartbeat, in seconds, to connect and to
+# respond. Signing waits for it, and doesn't need it to succeed, so this is
+# much shorter than the signing requests' deadlines.
+WARM_UP_TIMEOUT = 5
+
+
+def warm_autograph_connection(server):
+    """Open a connection to an autograph server in the shared pool.
+
+    The connection is left in the pool, so the first signing request
+    doesn't wait for the TCP and TLS handshakes. A server that doesn't
+    answer within `WARM_UP_TIMEOUT` is left to the signing requests.
+
+    Args:
+        server (str): the autograph server url
+
+    """
+    try:
+        with requests.Session() as session:
+            _mount_shared_adapter(session)
+            session.get(f"{server}/__lbheartbeat__", timeout=WARM_UP_TIMEOUT)
+    except requests.RequestException as exc:
+        # The signing requests will retry, and report the failure
+        log.warning("Couldn't connect to %s ahead of signing: %s", server, exc)
+
+
+async def warm_autograph_connections(servers):
+    """Open a connection to each autograph server in `servers`, concurrently.
+
+    With an autograph broker, requests go over the broker's connections, so
+    this does nothing.
+
+    Args:
+        servers (iterable): `SigningServer`s, of any server type
+
+    """
+    if broker.is_configured():
+        return
+    urls = sorted({s.server for s in servers if s.server_type == "autograph"})
+    await asyncio.gather(*(executor.run_io(warm_autograph_connection, u) for u in urls))
+
+
+async def _call_autograph_limited(server, fmt, url, sign_req, size=0):
+    # Each attempt takes a slot, so retries after throttling are limited too
+    method = url.rpartition("/")[2]
+    async with concurrency.limit(
+        "autograph", server.server, fmt, fixed_size=method == "hash"
+    ):
+        return await latency.timed(
+            server.server,
+            method,
+            call_autograph(url, server.user, server.password, sign_req),
+            size,
+        )
+
+
+def make_signing_req(
+    input_bytes, server, fmt, keyid=None, extension_id=None, autograph_method="file"
+):
     """Make a signing request object to pass to autograph."""
     base64_input = base64.b64encode(input_bytes).decode("ascii")
     sign_req = {"input": base64_input}
@@ -970,14 +1714,22 @@ def make_signing_req(input_bytes, server, fmt, keyid=None, extension_id=None):
         sign_req.setdefault("options", {})
         # https://bugzilla.mozilla.org/show_bug.cgi?id=1533818#c9
         sign_req["options"]["id"] = extension_id
-        sign_req["options"]["cose_algorithms"] = ["ES256"]
+        if autograph_method == "file":
+            # Only /sign/file adds COSE signatures to the xpi
+            sign_req["options"]["cose_algorithms"] = ["ES256"]
         sign_req["options"]["pkcs7_digest"] = "SHA256"
 
     return [sign_req]
 
 
 async def sign_with_autograph(
-    server, input_bytes, fmt, autograph_method, keyid=None, extension_id=None
+    server,
+    input_bytes,
+    fmt,
+    autograph_method,
+    keyid=None,
+    extension_id=None,
+    hedge_servers=(),
 ):
     """Signs data with autograph and returns the result.
 
@@ -989,6 +1741,10 @@ async def sign_with_autograph(
                                 one of 'file', 'hash', or 'data'
         keyid (str): which key to use on autograph (optional)
         extension_id (str): which id to send to autograph for the extension (optional)
+        hedge_servers (list): other servers for fmt, to hedge slow 'hash' and
+                              'data' requests to if ``autograph_hedging`` is
+                              set, and input_bytes is no larger than
+                              ``autograph_hedge_max_size`` (optional)
 
     Raises:
         Requests.RequestException: on failure
@@ -1001,15 +1757,19 @@ async def sign_with_autograph(
     if autograph_method not in {"file", "hash", "data"}:
         raise SigningScriptError(f"Unsupported autograph method: {autograph_method}")
 
-    sign_req = make_signing_req(input_bytes, server, fmt, keyid, extension_id)
+    sign_req = make_signing_req(
+        input_bytes, server, fmt, keyid, extension_id, autograph_method
+    )
 
     log.debug("signing data with format %s with %s", fmt, autograph_method)
 
-    url = f"{server.server}/sign/{autograph_method}"
+    def call(s):
+        url = f"{s.server}/sign/{autograph_method}"
+        return _call_autograph_limited(s, fmt, url, sign_req, len(input_bytes))
 
     sign_resp = await retry_async(
-        call_autograph,
-        args=(url, server.user, server.password, sign_req),
+        latency.hedge,
+        args=(autograph_method, [server, *hedge_servers], call, len(input_bytes)),
         attempts=3,
         sleeptime_kwargs={"delay_factor": 2.0},
     )
@@ -1020,6 +1780,22 @@ async def sign_with_autograph(
         return sign_resp[0]["signature"]
 
 
+# How many times its size an upload holds in memory while it's signed. A
+# /sign/file upload holds the file, its base64 encoding, the json request
+# body as str and bytes, and the response, its json and the decoded signed
+# file. A /sign/data upload maps the file, and holds the request copies.
+_AUTOGRAPH_FILE_FOOTPRINT = 8
+_AUTOGRAPH_DATA_FOOTPRINT = 4
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        # Opening it will raise a better error
+        return 0
+
+
 async def sign_file_with_autograph(context, from_, fmt, to=None, extension_id=None):
     """Signs file with autograph and writes the results to a file.
 
@@ -1036,26 +1812,25 @@ async def sign_file_with_autograph(context, from_, fmt, to=None, extension_id=No
         SigningScriptError: when no suitable signing server is found for fmt
 
     Returns:
-        str: the path to the signed file
+        ArtifactHandle: the path to the signed file
 
     """
     if not utils.is_autograph_signing_format(fmt):
         raise SigningScriptError(f"Not an autograph format: {fmt}")
-    cert_type = task.task_cert_type(context)
-    servers = get_suitable_signing_servers(
-        context.signing_servers, cert_type, [fmt], raise_on_empty_list=True
-    )
-    s = servers[0]
+    s = task.get_signing_servers(context, fmt, raise_on_empty_list=True)[0]
     to = to or from_
-    input_bytes = open(from_, "rb").read()
-    signed_bytes = base64.b64decode(
-        await sign_with_autograph(
-            s, input_bytes, fmt, "file", extension_id=extension_id
+    async with concurrency.reserve_memory(
+        _file_size(from_) * _AUTOGRAPH_FILE_FOOTPRINT
+    ):
+        with open(from_, "rb") as fh:
+            input_bytes = fh.read()
+        signed_bytes = base64.b64decode(
+            await sign_with_autograph(
+                s, input_bytes, fmt, "file", extension_id=extension_id
+            )
         )
-    )
-    with open(to, "wb") as fout:
-        fout.write(signed_bytes)
-    return to
+        del input_bytes
+        return utils.write_artifact(to, signed_bytes)
 
 
 async def sign_gpg_with_autograph(context, from_, fmt):
@@ -1076,19 +1851,61 @@ async def sign_gpg_with_autograph(context, from_, fmt):
     """
     if not utils.is_autograph_signing_format(fmt):
         raise SigningScriptError(f"Not an autograph format: {fmt}")
-    cert_type = task.task_cert_type(context)
-    servers = get_suitable_signing_servers(
-        context.signing_servers, cert_type, [fmt], raise_on_empty_list=True
-    )
-    s = servers[0]
+    if context.config.get("gpg_hash_signing_keyid"):
+        return await sign_gpg_hash_with_autograph(context, from_, fmt)
+    s, *others = task.get_signing_servers(context, fmt, raise_on_empty_list=True)
     to = f"{from_}.asc"
-    input_bytes = open(from_, "rb").read()
-    signature = await sign_with_autograph(s, input_bytes, fmt, "data")
+    # Map the file rather than reading it, to avoid another in-memory copy
+    async with concurrency.reserve_memory(
+        _file_size(from_) * _AUTOGRAPH_DATA_FOOTPRINT
+    ):
+        with utils.as_artifact(from_).mmap() as input_bytes:
+            signature = await sign_with_autograph(
+                s, input_bytes, fmt, "data", hedge_servers=others
+            )
     with open(to, "w") as fout:
         fout.write(signature)
     return [from_, to]
 
 
+async def sign_gpg_hash_with_autograph(context, from_, fmt):
+    """Make a detached OpenPGP signature, sending only its hash to autograph.
+
+    The v4 signature hash (the file digest followed by the signature
+    trailer) is computed locally and signed by the autograph RSA key
+    `gpg_hash_signing_keyid`, which must hold the same key as `gpg_pubkey`.
+    The ``.asc`` is then assembled locally.
+
+    Args:
+        context (Context): the signing context
+        from_ (str): the source file to sign
+        fmt (str): the format to sign with
+
+    Raises:
+        Requests.RequestException: on failure
+        SigningScriptError: when no suitable signing server is found for fmt
+
+    Returns:
+        list: the path to the signed file, and sig.
+
+    """
+    key = pgp.load_public_key(context.config["gpg_pubkey"])
+    trailer = pgp.make_signature_trailer(key, "sha512", int(time.time()))
+    # The artifact's running sha512 is reused, so the file is read at most
+    # once. Reading it blocks, so it's done in the thread pool, which keeps
+    # the cached digest in this process.
+    h = await executor.run_io(utils.as_artifact(from_).hash, "sha512")
+    h.update(trailer)
+    digest = h.digest()
+    signature = await sign_hash_with_autograph(
+        context, digest, fmt, keyid=context.config["gpg_hash_signing_keyid"]
+    )
+    to = f"{from_}.asc"
+    with open(to, "w") as fout:
+        fout.write(pgp.make_detached_signature(key, trailer, digest, signature))
+    return [from_, to]
+
+
 async def sign_hash_with_autograph(context, hash_, fmt, keyid=None):
     """Signs hash with autograph and returns the result.
 
@@ -1108,13 +1925,9 @@ async def sign_hash_with_autograph(context, hash_, fmt, keyid=None):
     """
     if not utils.is_autograph_signing_format(fmt):
         raise SigningScriptError(f"Not an autograph format: {fmt}")
-    cert_type = task.task_cert_type(context)
-    servers = get_suitable_signing_servers(
-        context.signing_servers, cert_type, [fmt], raise_on_empty_list=True
-    )
-    s = servers[0]
+    s, *others = task.get_signing_servers(context, fmt, raise_on_empty_list=True)
     signature = base64.b64decode(
-        await sign_with_autograph(s, hash_, fmt, "hash", keyid)
+        await sign_with_autograph(s, hash_, fmt, "hash", keyid, hedge_servers=others)
     )
     return signature
 
@@ -1194,13 +2007,11 @@ async def sign_mar384_with_autograph_hash(context, from_, fmt, to=None):
         str: the path to the signed file
 
     """
-    cert_type = task.task_cert_type(context)
+    cert_type = task.get_cert_type(context)
     # Get any key id that the task may have specified
     fmt, keyid = utils.split_autograph_format(fmt)
     # Call to check that we have a server available
-    get_suitable_signing_servers(
-        context.signing_servers, cert_type, [fmt], raise_on_empty_list=True
-    )
+    task.get_signing_servers(context, fmt, raise_on_empty_list=True)
 
     hash_algo, expected_signature_length = "sha384", 512
 
@@ -1231,8 +2042,7 @@ async def sign_mar384_with_autograph_hash(context, from_, fmt, to=None):
         with open(from_, "rb") as src:
             add_signature_block(src, dst, hash_algo, signature)
 
-    to = to or from_
-    shutil.copyfile(tmp_dst.name, to)
+    to = utils.copy_artifact(tmp_dst.name, to or from_)
     os.unlink(tmp_dst.name)
 
     verify_mar_signature(cert_type, fmt, to, keyid)
@@ -1267,17 +2077,24 @@ async def sign_widevine_with_autograph(context, from_, blessed, to=None):
     flags = 1 if blessed else 0
     fmt = "autograph_widevine"
 
-    h = widevine.generate_widevine_hash(from_, flags)
+    # Hashing reads the whole binary and holds the GIL, so hash in the
+    # process pool to hash the binaries in an archive in parallel
+    h = await executor.run_cpu(_generate_widevine_hash, from_, flags)
 
     signature = await sign_hash_with_autograph(context, h, fmt)
 
+    with open(context.config["widevine_cert"], "rb") as fh:
+        certificate = fh.read()
     with open(to, "wb") as fout:
-        certificate = open(context.config["widevine_cert"], "rb").read()
         sig = widevine.generate_widevine_signature(signature, certificate, flags)
         fout.write(sig)
     return to
 
 
+def _generate_widevine_hash(from_, flags):
+    return widevine.generate_widevine_hash(from_, flags)
+
+
 async def sign_omnija_with_autograph(context, from_):
     """Sign the omnija file specified using autograph.
 
@@ -1297,28 +2114,59 @@ async def sign_omnija_with_autograph(context, from_):
         str: the path to the signature file
 
     """
-    signed_out = tempfile.mkstemp(
-        prefix="oj_signed", suffix=".ja", dir=context.config["work_dir"]
-    )[1]
     merged_out = tempfile.mkstemp(
         prefix="oj_merged", suffix=".ja", dir=context.config["work_dir"]
     )[1]
 
-    await sign_file_with_autograph(
-        context,
-        from_,
-        "autograph_omnija",
-        to=signed_out,
-        extension_id="omni.ja@mozilla.org",
-    )
-    await merge_omnija_files(orig=from_, signed=signed_out, to=merged_out)
-    with open(from_, "wb") as fout:
-        with open(merged_out, "rb") as fin:
-            fout.write(fin.read())
+    if _use_xpi_hash_signing(context, "autograph_omnija"):
+        metafiles = await sign_jar_metafiles_with_autograph(
+            context, from_, "autograph_omnija", extension_id="omni.ja@mozilla.org"
+        )
+        await executor.run_io(
+            _write_jar_with_metafiles,
+            from_,
+            metafiles,
+            merged_out,
+            workers=_compress_workers(context),
+        )
+    else:
+        signed_out = tempfile.mkstemp(
+            prefix="oj_signed", suffix=".ja", dir=context.config["work_dir"]
+        )[1]
+        await sign_file_with_autograph(
+            context,
+            from_,
+            "autograph_omnija",
+            to=signed_out,
+            extension_id="omni.ja@mozilla.org",
+        )
+        await merge_omnija_files(
+            orig=from_,
+            signed=signed_out,
+            to=merged_out,
+            workers=_compress_workers(context),
+        )
+    await executor.run_io(_replace_file, merged_out, from_)
     return from_
 
 
-async def merge_omnija_files(orig, signed, to):
+def _replace_file(src, dst):
+    """Replace `dst` with `src`, keeping `dst`'s permissions.
+
+    `src` is renamed over `dst` if they're on the same filesystem, and
+    otherwise streamed into it and removed.
+
+    """
+    shutil.copymode(dst, src)
+    if os.stat(src).st_dev == os.stat(os.path.dirname(os.path.abspath(dst))).st_dev:
+        os.replace(src, dst)
+        return
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+    os.remove(src)
+
+
+async def merge_omnija_files(orig, signed, to, workers=1):
     """Merge multiple omnijar files together.
 
     This takes the original file, and reads it in, including performance
@@ -1331,38 +2179,316 @@ async def merge_omnija_files(orig, signed, to):
         orig (str): the source file to sign
         signed (str): the signed file, without optimizations
         to (str): the output path for the merge
+        workers (int, optional): the number of entries to compress at once.
+            Defaults to 1.
 
     Returns:
         bool: always True if function succeeded.
 
     """
-    orig_jarreader = mozjar.JarReader(orig)
-    with mozjar.JarWriter(to, compress=orig_jarreader.compression) as to_writer:
+    # Use ZipFile here because JarReader can't read the signed copies
+    def merge():
+        signed_zip = zipfile.ZipFile(signed, "r")
+        metafiles = {
+            fname: signed_zip.read(fname)
+            for fname in signed_zip.namelist()
+            if fname.startswith("META-INF")
+        }
+        _write_jar_with_metafiles(orig, metafiles, to, workers=workers)
+
+    await executor.run_io(merge)
+    return True
+
+
+def _write_jar_with_metafiles(orig, metafiles, to, workers=1):
+    """Write the entries of the omnijar `orig` to `to`, adding signature metafiles.
+
+    The original compression and preload ordering are kept. Any signature
+    files already in `orig` are replaced.
+
+    Args:
+        orig (str): the jar to copy
+        metafiles (dict): path in the jar to the contents of each metafile
+        to (str): the output path
+        workers (int, optional): the number of entries to compress at once.
+            Entries that keep their compression are copied as is. Defaults
+            to 1.
+
+    """
+    # Preloaded entries are a prefix of the original entries, which are
+    # written in their original order
+    with JarReader(orig) as orig_jarreader, StreamingJarWriter(
+        to,
+        compress=orig_jarreader.compression,
+        last_preloaded=orig_jarreader.last_preloaded,
+        workers=workers,
+    ) as to_writer:
         for origjarfile in orig_jarreader:
+            if _is_jar_signature_file(origjarfile.filename):
+                continue
             to_writer.add(
                 origjarfile.filename, origjarfile, compress=origjarfile.compress
             )
-        # Use ZipFile here because mozjar can't read the signed copies
-        signed_zip = zipfile.ZipFile(signed, "r")
-        for fname in signed_zip.namelist():
-            if fname.startswith("META-INF"):
-                to_writer.add(fname, signed_zip.open(fname, "r"))
-        if orig_jarreader.last_preloaded:
-            jarlog = list(orig_jarreader.entries.keys())
-            preloads = jarlog[: jarlog.index(orig_jarreader.last_preloaded) + 1]
-            to_writer.preload(preloads)
+        for fname, data in metafiles.items():
+            to_writer.add(fname, data)
+
+
+def _write_zip_with_metafiles(orig, metafiles, to):
+    """Write the entries of the zip `orig` to `to`, with signature metafiles first.
+
+    Entries are streamed across, keeping their compression and attributes.
+    Any signature files already in `orig` are replaced.
+
+    Args:
+        orig (str): the zip to copy
+        metafiles (dict): path in the zip to the contents of each metafile
+        to (str): the output path
+
+    """
+    with zipfile.ZipFile(orig, "r") as orig_zip, zipfile.ZipFile(
+        to, "w", compression=zipfile.ZIP_DEFLATED
+    ) as to_zip:
+        for fname, data in metafiles.items():
+            to_zip.writestr(fname, data)
+        for info in orig_zip.infolist():
+            if _is_jar_signature_file(info.filename):
+                continue
+            to_info = zipfile.ZipInfo(info.filename, info.date_time)
+            to_info.compress_type = info.compress_type
+            to_info.external_attr = info.external_attr
+            to_info.file_size = info.file_size
+            with orig_zip.open(info) as fsrc, to_zip.open(to_info, "w") as fdst:
+                shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+
+def _iter_jar_entries(path):
+    """Yield the name and contents of each file in a jar.
+
+    Omnijars with preloaded entries can't be read by `zipfile`, and
+    `JarReader` can't read every zip, so fall back from one to the other.
+
+    """
+    try:
+        with zipfile.ZipFile(path, "r") as z:
+            for info in z.infolist():
+                if not info.is_dir():
+                    yield info.filename, z.read(info)
+    except zipfile.BadZipFile:
+        with JarReader(path) as reader:
+            for jarfile in reader:
+                yield jarfile.filename, jarfile.read()
+
+
+def _is_jar_signature_file(filename):
+    return bool(_JAR_SIGNATURE_FILE_RE.match(filename))
+
+
+def _b64digest(hash_type, data):
+    return base64.b64encode(hashlib.new(hash_type, data).digest()).decode("ascii")
+
+
+# make_jar_manifest {{{1
+def make_jar_manifest(path):
+    """Build the v1 JAR manifest (`META-INF/manifest.mf`) for a jar.
+
+    This lists the SHA1 and SHA256 digests of every entry, in the same format
+    autograph's xpi signer uses.
+
+    Args:
+        path (str): the jar to build the manifest for
+
+    Returns:
+        bytes: the manifest
+
+    """
+    manifest = [b"Manifest-Version: 1.0\n\n"]
+    for name, data in _iter_jar_entries(path):
+        if name.endswith("/") or _is_jar_signature_file(name):
+            continue
+        manifest.append(
+            _jar_manifest_line("Name: {}".format(name).encode("utf-8"))
+            + "Digest-Algorithms: SHA1 SHA256\n"
+            "SHA1-Digest: {}\nSHA256-Digest: {}\n\n".format(
+                _b64digest("sha1", data), _b64digest("sha256", data)
+            ).encode("utf-8")
+        )
+    return b"".join(manifest)
+
+
+def _jar_manifest_line(line, newline=b"\n"):
+    # Manifest lines are at most 72 bytes including the newline, and are
+    # continued on lines starting with a space. The limit is in bytes, so a
+    # multibyte character can be split across lines, and the line is never
+    # decoded.
+    width = 72 - len(newline)
+    chunks = [line[:width]]
+    line = line[width:]
+    width -= 1
+    while line:
+        chunks.append(b" " + line[:width])
+        line = line[width:]
+    return newline.join(chunks) + newline
+
+
+# make_jar_signature_file {{{1
+def make_jar_signature_file(manifest):
+    """Build the v1 JAR signature file (`META-INF/mozilla.sf`) for a manifest.
+
+    Args:
+        manifest (bytes): the manifest, from `make_jar_manifest`
+
+    Returns:
+        bytes: the signature file
+
+    """
+    return (
+        "Signature-Version: 1.0\n"
+        "SHA1-Digest-Manifest: {}\n"
+        "SHA256-Digest-Manifest: {}\n\n".format(
+            _b64digest("sha1", manifest), _b64digest("sha256", manifest)
+        )
+    ).encode("utf-8")
+
+
+# make_apk_v1_signature_files {{{1
+def make_apk_v1_signature_files(path, hash_type="sha256"):
+    """Build the v1 (JAR) manifest and signature file for an apk.
+
+    Entries are hashed as they're streamed out of the apk, so large entries
+    aren't held in memory.
+
+    Args:
+        path (str): the apk to build the signature files for
+        hash_type (str, optional): `sha1` or `sha256`. Defaults to `sha256`.
+
+    Returns:
+        tuple: the manifest and signature file, as bytes
+
+    """
+    digest_name = {"sha1": "SHA1", "sha256": "SHA-256"}[hash_type]
+    header = "Manifest-Version: 1.0\r\nCreated-By: signingscript\r\n\r\n"
+    manifest = [header.encode("utf-8")]
+    sigfile_sections = []
+    with zipfile.ZipFile(path, "r") as z:
+        for info in z.infolist():
+            if info.is_dir() or _is_jar_signature_file(info.filename):
+                continue
+            h = hashlib.new(hash_type)
+            with z.open(info) as f:
+                for chunk in iter(functools.partial(f.read, 1024 * 1024), b""):
+                    h.update(chunk)
+            name_line = _jar_manifest_line(
+                "Name: {}".format(info.filename).encode("utf-8"), b"\r\n"
+            )
+            section = name_line + "{}-Digest: {}\r\n\r\n".format(
+                digest_name, base64.b64encode(h.digest()).decode("ascii")
+            ).encode("utf-8")
+            manifest.append(section)
+            sigfile_sections.append(
+                name_line
+                + "{}-Digest: {}\r\n\r\n".format(
+                    digest_name, _b64digest(hash_type, section)
+                ).encode("utf-8")
+            )
+    manifest = b"".join(manifest)
+    sigfile_header = (
+        "Signature-Version: 1.0\r\n"
+        "Created-By: signingscript\r\n"
+        "{digest_name}-Digest-Manifest: {manifest_digest}\r\n"
+        "{digest_name}-Digest-Manifest-Main-Attributes: {header_digest}\r\n\r\n"
+    ).format(
+        digest_name=digest_name,
+        manifest_digest=_b64digest(hash_type, manifest),
+        header_digest=_b64digest(hash_type, header.encode("utf-8")),
+    )
+    return manifest, sigfile_header.encode("utf-8") + b"".join(sigfile_sections)
+
+
+# sign_jar_metafiles_with_autograph {{{1
+def _use_xpi_hash_signing(context, fmt):
+    """Whether to sign an xpi format by building its metafiles locally.
+
+    Locally built metafiles only carry a PKCS7 signature, so this is refused
+    for the formats in ``xpi_cose_formats``, which need COSE signatures too.
+
+    Args:
+        context (Context): the signing context
+        fmt (str): the format to sign with
+
+    Raises:
+        SigningScriptError: if ``xpi_hash_signing`` is set, but `fmt` needs
+            COSE signatures
+
+    Returns:
+        bool: True to use `sign_jar_metafiles_with_autograph`
+
+    """
+    if not context.config.get("xpi_hash_signing"):
+        return False
+    if fmt in context.config.get("xpi_cose_formats", ()):
+        raise SigningScriptError(
+            "xpi_hash_signing can't make the COSE signatures {} needs; remove it "
+            "from xpi_cose_formats to sign it without them".format(fmt)
+        )
     return True
 
 
+async def sign_jar_metafiles_with_autograph(context, from_, fmt, extension_id):
+    """Build a jar's signature metafiles, with only the signature file sent to autograph.
+
+    The manifest and signature file are built locally, and autograph's
+    `/sign/data` endpoint returns the PKCS7 signature of the signature file.
+    COSE signatures are only available from `/sign/file`, so the metafiles
+    only carry the PKCS7 signature.
+
+    Args:
+        context (Context): the signing context
+        from_ (str): the jar to sign
+        fmt (str): the format to sign with
+        extension_id (str): the extension id to use when signing
+
+    Raises:
+        Requests.RequestException: on failure
+        SigningScriptError: when no suitable signing server is found for fmt
+
+    Returns:
+        dict: path in the jar to the contents of each metafile
+
+    """
+    if not utils.is_autograph_signing_format(fmt):
+        raise SigningScriptError(f"Not an autograph format: {fmt}")
+    s, *others = task.get_signing_servers(context, fmt, raise_on_empty_list=True)
+    manifest = make_jar_manifest(from_)
+    sigfile = make_jar_signature_file(manifest)
+    signature = base64.b64decode(
+        await sign_with_autograph(
+            s, sigfile, fmt, "data", extension_id=extension_id, hedge_servers=others
+        )
+    )
+    return {
+        "META-INF/manifest.mf": manifest,
+        "META-INF/mozilla.sf": sigfile,
+        "META-INF/mozilla.rsa": signature,
+    }
+
+
 # sign_authenticode_file {{{1
 async def sign_authenticode_file(context, orig_path, fmt):
     """Sign a file in-place with authenticode, using autograph as a backend.
 
+    winsign runs in an executor thread, which can't be interrupted. If this
+    is cancelled, the thread's autograph request is cancelled, and it's
+    stopped before its next one, and waited for, so the file is left as it
+    was.
+
     Args:
         context (Context): the signing context
         orig_path (str): the source file to sign
         fmt (str): the format to sign with
 
+    Raises:
+        SigningScriptError: if signing was aborted by cancelling this
+
     Returns:
         True on success, False otherwise
 
@@ -1373,17 +2499,35 @@ async def sign_authenticode_file(context, orig_path, fmt):
         log.info("%s is already signed", orig_path)
         return True
 
+    abort = threading.Event()
+    # The thread's autograph request, so it can be cancelled
+    in_flight = [None]
+
+    def check_abort():
+        if abort.is_set():
+            raise SigningScriptError(f"Signing {orig_path} with {fmt} was aborted")
+
     def signer(digest, digest_algo):
-        thread_loop = asyncio.new_event_loop()
+        # winsign calls this from the executor thread. Sign on the task's
+        # loop, whose concurrency limits the requests have to share.
+        check_abort()
+        request = in_flight[0] = asyncio.run_coroutine_threadsafe(
+            sign_hash_with_autograph(context, digest, fmt), loop
+        )
         try:
-            return thread_loop.run_until_complete(
-                sign_hash_with_autograph(context, digest, fmt)
-            )
+            # In case this was aborted before the request could be cancelled
+            if abort.is_set():
+                request.cancel()
+            return request.result()
         except Exception:
+            check_abort()
             log.exception("Error signing authenticode hash with autograph")
             raise
+        finally:
+            in_flight[0] = None
 
     def sign_file():
+        check_abort()
         infile = orig_path
         outfile = orig_path + "-new"
         digest_algo = "sha1"
@@ -1395,7 +2539,7 @@ async def sign_authenticode_file(context, orig_path, fmt):
         else:
             crosscert = None
 
-        if not winsign.sign.sign_file(
+        signed = winsign.sign.sign_file(
             infile,
             outfile,
             digest_algo,
@@ -1404,11 +2548,28 @@ async def sign_authenticode_file(context, orig_path, fmt):
             url=url,
             crosscert=crosscert,
             timestamp_style=timestamp_style,
-        ):
+        )
+        if abort.is_set():
+            # winsign may have caught the signer's error, and finished
+            if os.path.exists(outfile):
+                os.remove(outfile)
+            check_abort()
+        if not signed:
             raise IOError(f"Couldn't sign {orig_path}")
         os.rename(outfile, infile)
 
-    return await loop.run_in_executor(None, sign_file)
+    signing = loop.run_in_executor(None, sign_file)
+    try:
+        return await asyncio.shield(signing)
+    except asyncio.CancelledError:
+        abort.set()
+        request = in_flight[0]
+        if request is not None:
+            request.cancel()
+        await asyncio.wait({signing})
+        # Its failure is the abort
+        signing.exception()
+        raise
 
 
 # sign_authenticode_zip {{{1
@@ -1446,7 +2607,7 @@ async def sign_authenticode_zip(context, orig_path, fmt):
 
     # Sign the appropriate inner files
     tasks = [sign_authenticode_file(context, file_, fmt) for file_ in files_to_sign]
-    await asyncio.gather(*tasks)
+    await utils.run_concurrently(tasks)
     if file_extension == ".zip":
         # Recreate the zipfile
         await _create_zipfile(context, orig_path, files, tmp_dir=tmp_dir)
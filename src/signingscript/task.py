@@ -2,65 +2,41 @@
 """Signingscript task functions.
 
 Attributes:
-    FORMAT_TO_SIGNING_FUNCTION (frozendict): a mapping between signing format
-        and signing function. If not specified, use the `default` signing
-        function.
+    SigningPlan (namedtuple): the task-invariant data the signing functions
+        need, precomputed once per task by `build_signing_plan`.
+        ``cert_type`` (str): the task cert type.
+        ``formats`` (frozendict): format name to `SigningFormat`.
+        ``signing_functions`` (frozendict): format name to signing function.
+        ``servers`` (frozendict): format name to a tuple of suitable
+            `SigningServer`s.
+        ``paths`` (frozendict): relative path to its ordered tuple of formats.
 
 """
 import aiohttp
 import asyncio
+from collections import namedtuple
 from frozendict import frozendict
 import logging
 import os
 import random
-import re
 
 from scriptworker.exceptions import ScriptWorkerException, TaskVerificationError
 from scriptworker.utils import retry_request, get_single_item_from_sequence
 
-from signingscript.sign import (
-    get_suitable_signing_servers,
-    sign_gpg,
-    sign_jar,
-    sign_macapp,
-    sign_signcode,
-    sign_widevine,
-    sign_file,
-    sign_mar384_with_autograph_hash,
-    sign_gpg_with_autograph,
-    sign_omnija,
-    sign_langpack,
-    sign_authenticode_zip,
-)
+import signingscript.sign
+from signingscript.sign import get_suitable_signing_servers
 from signingscript.exceptions import SigningServerError
-from signingscript.utils import is_autograph_signing_format
+from signingscript.formats import format_sort_key, get_signing_format
+from signingscript.utils import (
+    as_artifact,
+    is_autograph_signing_format,
+    split_autograph_format,
+)
 
 log = logging.getLogger(__name__)
 
-FORMAT_TO_SIGNING_FUNCTION = frozendict(
-    {
-        # TODO: Remove the next item (in favor of the regex one), once Focus is migrated
-        "autograph_focus": sign_jar,
-        "autograph_apk_.+": sign_jar,
-        "autograph_hash_only_mar384(:\\w+)?": sign_mar384_with_autograph_hash,
-        "autograph_stage_mar384(:\\w+)?": sign_mar384_with_autograph_hash,
-        "gpg": sign_gpg,
-        "autograph_gpg": sign_gpg_with_autograph,
-        "jar": sign_jar,
-        "focus-jar": sign_jar,
-        "macapp": sign_macapp,
-        "osslsigncode": sign_signcode,
-        "sha2signcode": sign_signcode,
-        # sha2signcodestub uses a generic sign_file
-        "signcode": sign_signcode,
-        "widevine": sign_widevine,
-        "autograph_widevine": sign_widevine,
-        "autograph_omnija": sign_omnija,
-        "autograph_langpack": sign_langpack,
-        "autograph_authenticode": sign_authenticode_zip,
-        "autograph_authenticode_stub": sign_authenticode_zip,
-        "default": sign_file,
-    }
+SigningPlan = namedtuple(
+    "SigningPlan", ["cert_type", "formats", "signing_functions", "servers", "paths"]
 )
 
 
@@ -208,12 +184,20 @@ async def sign(context, path, signing_formats):
             there are detached sigfiles.
 
     """
-    output = path
+    # Pass an ArtifactHandle along the chain, so that digests computed by one
+    # format's signing function can be reused by the next
+    output = as_artifact(path)
+    plan = getattr(context, "signing_plan", None)
     # Loop through the formats and sign one by one.
     for fmt in signing_formats:
-        signing_func = _get_signing_function_from_format(fmt)
+        if plan is not None and fmt in plan.signing_functions:
+            signing_func = plan.signing_functions[fmt]
+        else:
+            signing_func = _get_signing_function_from_format(fmt)
         log.info("sign(): Signing {} with {}...".format(output, fmt))
         output = await signing_func(context, output, fmt)
+        if isinstance(output, str):
+            output = as_artifact(output)
     # We want to return a list
     if not isinstance(output, (tuple, list)):
         output = [output]
@@ -221,18 +205,7 @@ async def sign(context, path, signing_formats):
 
 
 def _get_signing_function_from_format(format):
-    try:
-        _, signing_function = get_single_item_from_sequence(
-            FORMAT_TO_SIGNING_FUNCTION.items(),
-            condition=lambda item: re.match(item[0], format) is not None,
-        )
-        return signing_function
-    except ValueError:
-        # Regex may catch several candidate. If so, we fall back to the exact match.
-        # If nothing matches, then we fall back to default
-        return FORMAT_TO_SIGNING_FUNCTION.get(
-            format, FORMAT_TO_SIGNING_FUNCTION["default"]
-        )
+    return getattr(signingscript.sign, get_signing_format(format).signing_function)
 
 
 # _sort_formats {{{1
@@ -240,7 +213,8 @@ def _sort_formats(formats):
     """Order the signing formats.
 
     Certain formats need to happen before or after others, e.g. gpg after
-    any format that modifies the binary.
+    any format that modifies the binary. The order is derived from the
+    traits declared in `signingscript.formats`.
 
     Args:
         formats (list): the formats to order.
@@ -249,19 +223,7 @@ def _sort_formats(formats):
         list: the ordered formats.
 
     """
-    # Widevine formats must be after other formats other than macapp; GPG must
-    # be last.
-    for fmt in (
-        "widevine",
-        "autograph_widevine",
-        "autograph_omnija",
-        "macapp",
-        "gpg",
-        "autograph_gpg",
-    ):
-        if fmt in formats:
-            formats.remove(fmt)
-            formats.append(fmt)
+    formats.sort(key=format_sort_key)
     return formats
 
 
@@ -300,3 +262,95 @@ def build_filelist_dict(context):
     if messages:
         raise TaskVerificationError(messages)
     return filelist_dict
+
+
+# build_signing_plan {{{1
+def build_signing_plan(context, filelist_dict):
+    """Precompute the task-invariant data the signing functions need.
+
+    Args:
+        context (Context): the signing context
+        filelist_dict (dict of dicts): the output of `build_filelist_dict`
+
+    Raises:
+        TaskVerificationError: if the number of cert scopes is not 1.
+
+    Returns:
+        SigningPlan: the plan for this task.
+
+    """
+    cert_type = task_cert_type(context)
+    formats = set()
+    for path_dict in filelist_dict.values():
+        formats.update(path_dict["formats"])
+    # Servers are also looked up by the plain format (without keyid), and by
+    # the inner format that widevine archives sign their blessed files with.
+    server_formats = set(formats)
+    for fmt in formats:
+        server_formats.add(split_autograph_format(fmt)[0])
+        if fmt == "widevine":
+            server_formats.add("widevine_blessed")
+    return SigningPlan(
+        cert_type=cert_type,
+        formats=frozendict({fmt: get_signing_format(fmt) for fmt in formats}),
+        signing_functions=frozendict(
+            {fmt: _get_signing_function_from_format(fmt) for fmt in formats}
+        ),
+        servers=frozendict(
+            {
+                fmt: tuple(
+                    get_suitable_signing_servers(
+                        context.signing_servers, cert_type, [fmt]
+                    )
+                )
+                for fmt in server_formats
+            }
+        ),
+        paths=frozendict(
+            {path: tuple(d["formats"]) for path, d in filelist_dict.items()}
+        ),
+    )
+
+
+# get_cert_type {{{1
+def get_cert_type(context):
+    """Return the task cert type, from the signing plan if there is one.
+
+    Args:
+        context (Context): the signing context.
+
+    Returns:
+        str: the cert type.
+
+    """
+    plan = getattr(context, "signing_plan", None)
+    if plan is None:
+        return task_cert_type(context)
+    return plan.cert_type
+
+
+# get_signing_servers {{{1
+def get_signing_servers(context, fmt, raise_on_empty_list=False):
+    """Return the signing servers for `fmt`, from the signing plan if there is one.
+
+    Args:
+        context (Context): the signing context.
+        fmt (str): the signing format the servers need to support.
+        raise_on_empty_list (bool): flag to raise errors. Optional. Defaults to False.
+
+    Raises:
+        SigningScriptError: when no suitable signing server is found
+
+    Returns:
+        list: the suitable `SigningServer`s.
+
+    """
+    plan = getattr(context, "signing_plan", None)
+    if plan is not None and plan.servers.get(fmt):
+        return list(plan.servers[fmt])
+    return get_suitable_signing_servers(
+        context.signing_servers,
+        get_cert_type(context),
+        [fmt],
+        raise_on_empty_list=raise_on_empty_list,
+    )
@@ -1,15 +1,22 @@
 """Signingscript general utility functions."""
 import asyncio
 from asyncio.subprocess import PIPE, STDOUT
+from contextlib import contextmanager
 import functools
 import hashlib
 import json
 import logging
+import mmap
 import os
 from shutil import copyfile
 from collections import namedtuple
 
-from signingscript.exceptions import FailedSubprocess, SigningServerError
+from signingscript.exceptions import (
+    FailedSubprocess,
+    MultipleSigningErrors,
+    SigningServerError,
+)
+from signingscript.formats import get_signing_format
 
 log = logging.getLogger(__name__)
 
@@ -18,6 +25,160 @@ SigningServer = namedtuple(
     "SigningServer", ["server", "user", "password", "formats", "server_type"]
 )
 
+# Digests computed while an artifact is written, so that later signing steps
+# in the format chain don't need to read it back to hash it.
+ARTIFACT_HASH_TYPES = ("sha1", "sha512")
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class ArtifactHandle(str):
+    """The path to an artifact, carrying what's already known about its contents.
+
+    This is a `str`, so it can be passed wherever a path is expected. Cached
+    digests are tied to the file's size and mtime, and are recomputed if the
+    file has changed since.
+
+    """
+
+    def __new__(cls, path, hashes=None):
+        """Create an ArtifactHandle.
+
+        Args:
+            path (str): the path to the artifact
+            hashes (dict, optional): hash type to hashlib object, for the
+                current contents of `path`. Defaults to None.
+
+        """
+        handle = super().__new__(cls, path)
+        handle._hashes = {}
+        handle._stat = _stat_key(path) if hashes else None
+        if handle._stat is not None:
+            handle._hashes = dict(hashes)
+        return handle
+
+    @property
+    def size(self):
+        """int: the size of the artifact, in bytes."""
+        return os.path.getsize(self)
+
+    def hash(self, hash_type="sha512"):
+        """Return a hashlib object for the artifact's current contents.
+
+        The object is a copy, so callers can keep updating it.
+
+        Args:
+            hash_type (str, optional): the algorithm to use. Defaults to `sha512`
+
+        Returns:
+            hashlib object: the hash of the artifact
+
+        """
+        stat = _stat_key(self)
+        if stat is None or stat != self._stat:
+            self._hashes = {}
+            self._stat = stat
+        if hash_type not in self._hashes:
+            h = hashlib.new(hash_type)
+            with open(self, "rb") as f:
+                for chunk in iter(functools.partial(f.read, 1024 * 1024), b""):
+                    h.update(chunk)
+            self._hashes[hash_type] = h
+        return self._hashes[hash_type].copy()
+
+    def hexdigest(self, hash_type="sha512"):
+        """Return the hexdigest of the artifact's current contents.
+
+        Args:
+            hash_type (str, optional): the algorithm to use. Defaults to `sha512`
+
+        Returns:
+            str: the hexdigest of the hash
+
+        """
+        return self.hash(hash_type).hexdigest()
+
+    @contextmanager
+    def mmap(self):
+        """Map the artifact's contents into memory, read-only.
+
+        Yields:
+            mmap or bytes: the contents of the artifact
+
+        """
+        with open(self, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    yield m
+
+
+def as_artifact(path):
+    """Return `path` as an ArtifactHandle, keeping any digests it already carries.
+
+    Args:
+        path (str): the path to the artifact
+
+    Returns:
+        ArtifactHandle: the handle
+
+    """
+    if isinstance(path, ArtifactHandle):
+        return path
+    return ArtifactHandle(path)
+
+
+def write_artifact(path, chunks, hash_types=ARTIFACT_HASH_TYPES):
+    """Write an artifact, hashing it on the way.
+
+    Args:
+        path (str): the path to write to
+        chunks (bytes or iterable of bytes): the contents to write
+        hash_types (tuple, optional): the digests to compute. Defaults to
+            `ARTIFACT_HASH_TYPES`
+
+    Returns:
+        ArtifactHandle: the handle to the written artifact
+
+    """
+    if isinstance(chunks, bytes):
+        chunks = [chunks]
+    hashes = {hash_type: hashlib.new(hash_type) for hash_type in hash_types}
+    with open(path, "wb") as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+            for h in hashes.values():
+                h.update(chunk)
+    return ArtifactHandle(path, hashes)
+
+
+def copy_artifact(source, target, hash_types=ARTIFACT_HASH_TYPES):
+    """Copy `source` to `target`, hashing it on the way.
+
+    Args:
+        source (str): the path to copy from
+        target (str): the path to copy to
+        hash_types (tuple, optional): the digests to compute. Defaults to
+            `ARTIFACT_HASH_TYPES`
+
+    Returns:
+        ArtifactHandle: the handle to `target`
+
+    """
+    with open(source, "rb") as fh:
+        return write_artifact(
+            target,
+            iter(functools.partial(fh.read, 1024 * 1024), b""),
+            hash_types=hash_types,
+        )
+
 
 def mkdir(path):
     """Equivalent to `mkdir -p`.
@@ -66,9 +227,16 @@ def load_json(path):
         return json.load(fh)
 
 
+# Parsed signing server configs by path, with the stat key they were read at,
+# so a long-running daemon doesn't re-read them for every task.
+_signing_server_configs = {}
+
+
 def load_signing_server_config(context):
     """Build a specialized signing server config from the `signing_server_config`.
 
+    The parsed config is cached until the file changes.
+
     Args:
         context (Context): the signing context
 
@@ -77,6 +245,12 @@ def load_signing_server_config(context):
 
     """
     path = context.config["signing_server_config"]
+    key = (os.path.abspath(path), _stat_key(path))
+    cached = _signing_server_configs.get(key[0])
+    if cached is not None and key[1] is not None and cached[0] == key[1]:
+        log.info("Using the cached signing server config from {}".format(path))
+        return cached[1]
+
     log.info("Loading signing server config from {}".format(path))
     with open(path) as f:
         raw_cfg = json.load(f)
@@ -84,6 +258,7 @@ def load_signing_server_config(context):
     cfg = {}
     for signing_type, server_data in raw_cfg.items():
         cfg[signing_type] = [SigningServer(*s) for s in server_data]
+    _signing_server_configs[key[0]] = (key[1], cfg)
     log.info("Signing server config loaded from {}".format(path))
     return cfg
 
@@ -152,15 +327,72 @@ async def execute_subprocess(command, log_level=logging.INFO, **kwargs):
     subprocess = await asyncio.create_subprocess_exec(
         *command, stdout=PIPE, stderr=STDOUT, **kwargs
     )
-    log.log(log_level, "COMMAND OUTPUT: ")
-    await log_output(subprocess.stdout, log_level=log_level)
-    exitcode = await subprocess.wait()
+    try:
+        log.log(log_level, "COMMAND OUTPUT: ")
+        await log_output(subprocess.stdout, log_level=log_level)
+        exitcode = await subprocess.wait()
+    except asyncio.CancelledError:
+        # Don't leave the command running after whatever needed it is gone
+        if subprocess.returncode is None:
+            log.warning('Killing "%s"', " ".join(command))
+            subprocess.kill()
+            await subprocess.wait()
+        raise
     log.info("exitcode {}".format(exitcode))
 
     if exitcode != 0:
         raise FailedSubprocess("Command `{}` failed".format(" ".join(command)))
 
 
+async def run_concurrently(coros):
+    """Run coroutines concurrently, cancelling the rest if one fails.
+
+    Unlike `asyncio.gather`, or scriptworker's `raise_future_exceptions`,
+    the first failure doesn't leave the others running to finish work that
+    will be thrown away. They're cancelled, which aborts their pending
+    requests and kills their subprocesses, and waited for, so nothing is
+    still running once this returns. If this is cancelled, they're
+    cancelled too.
+
+    Args:
+        coros (iterable): the coroutines to run
+
+    Raises:
+        Exception: what the coroutine raised, if only one failed
+        MultipleSigningErrors: if several failed before the rest were
+            cancelled, listing each failure
+
+    Returns:
+        list: the results, in the order of `coros`
+
+    """
+    futures = [asyncio.ensure_future(coro) for coro in coros]
+    if not futures:
+        return []
+    try:
+        _, pending = await asyncio.wait(futures, return_when=asyncio.FIRST_EXCEPTION)
+    except asyncio.CancelledError:
+        pending = futures
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+        if pending:
+            await asyncio.wait(pending)
+    errors = [
+        future.exception()
+        for future in futures
+        if not future.cancelled() and future.exception() is not None
+    ]
+    if len(errors) == 1:
+        raise errors[0]
+    if errors:
+        for error in errors:
+            log.error("%s: %s", type(error).__name__, error)
+        raise MultipleSigningErrors(errors)
+    return [future.result() for future in futures]
+
+
 def is_autograph_signing_format(format_):
     """Return bool of whether a signing format is for autograph.
 
@@ -168,7 +400,7 @@ def is_autograph_signing_format(format_):
         format_ (str): the format to check
 
     """
-    return format_ and format_.startswith("autograph_")
+    return bool(format_) and get_signing_format(format_).autograph
 
 
 def is_apk_autograph_signing_format(format_):
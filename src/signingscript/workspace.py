@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""Signingscript workspace tracking.
+
+The archive helpers extract into a temporary directory, signing adds files
+next to the extracted ones, and the archive is repacked from the resulting
+file list. A `Workspace` is that file list, so it's known without rescanning
+the directory. Signers that create other files in a workspace, like partial
+downloads, `record` them, so they can be cleaned up without rescanning it
+either.
+
+"""
+import os
+import threading
+import weakref
+
+# The scratch files recorded in each workspace directory, shared by the
+# `Workspace`s for it, and dropped with them
+_scratch = weakref.WeakValueDictionary()
+_scratch_lock = threading.Lock()
+
+
+# record {{{1
+def record(path):
+    """Record a file that a signer is about to create, but that isn't packed.
+
+    This is a no-op unless `path` is in a `Workspace`. It's safe to call
+    from any thread.
+
+    Args:
+        path (str): the path of the file
+
+    """
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    with _scratch_lock:
+        while True:
+            scratch = _scratch.get(parent)
+            if scratch is not None:
+                scratch.add(path)
+                return
+            parent, child = os.path.dirname(parent), parent
+            if parent == child:
+                return
+
+
+# Workspace {{{1
+class Workspace(list):
+    """The files materialized in a directory while signing an archive.
+
+    The extract helpers return a `Workspace` listing the files they
+    extracted, and callers append the files that signing adds. It's a list
+    of paths, so it can be used wherever one is expected. The extracted
+    directories are kept in `dirs`; they aren't packed, but `precomplete`
+    lists them.
+
+    Args:
+        top_dir (str): the directory the files are in
+        files (iterable, optional): the paths of the files so far
+        dirs (iterable, optional): the paths of the directories so far,
+            including symlinks to directories
+
+    """
+
+    def __init__(self, top_dir, files=(), dirs=()):
+        """Track `files` and `dirs` in `top_dir`."""
+        super().__init__(files)
+        self.top_dir = top_dir
+        self.dirs = list(dirs)
+        with _scratch_lock:
+            self._scratch = _scratch.setdefault(os.path.abspath(top_dir), set())
+
+    def relpath(self, path):
+        """Return the archive member name of `path`.
+
+        Args:
+            path (str): a path in `top_dir`
+
+        Returns:
+            str: `path` relative to `top_dir`, with ``/`` separators
+
+        """
+        return os.path.relpath(path, self.top_dir).replace(os.sep, "/")
+
+    def members(self, dirs=False):
+        """Return the archive member names of the tracked files.
+
+        Args:
+            dirs (bool, optional): whether to include the tracked
+                directories, whose names end in ``/``. Defaults to False.
+
+        Returns:
+            list: the member names, in order, then the directories'
+
+        """
+        names = [self.relpath(path) for path in self]
+        if dirs:
+            names.extend(self.relpath(path) + "/" for path in self.dirs)
+        return names
+
+    def extra_files(self):
+        """Find the files `record`ed in `top_dir` that aren't tracked.
+
+        Only recorded files are checked, so `top_dir` isn't rescanned. As
+        before, anything that isn't a regular file, like a dangling symlink,
+        is left alone.
+
+        Returns:
+            list: the real paths of the untracked files
+
+        """
+        tracked = {os.path.abspath(path) for path in self}
+        with _scratch_lock:
+            scratch = sorted(self._scratch)
+        return [
+            os.path.realpath(path)
+            for path in scratch
+            if path not in tracked and os.path.isfile(path)
+        ]
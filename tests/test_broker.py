@@ -0,0 +1,210 @@
+import asyncio
+import os
+import time
+
+import pytest
+import requests
+
+import signingscript.broker as broker
+import signingscript.latency as latency
+import signingscript.sign as sign
+
+
+# helper constants, fixtures, functions {{{1
+URL = "https://autograph.example.com"
+
+
+@pytest.fixture
+def posts(mocker):
+    posts = []
+
+    def fake_post_autograph(url, user, password, request_json):
+        posts.append((url, [item["input"] for item in request_json]))
+        for bad, status in (("bad", 503), ("invalid", 400)):
+            if any(item["input"] == bad for item in request_json):
+                response = requests.Response()
+                response.status_code = status
+                raise requests.HTTPError(
+                    "{} Server Error".format(status), response=response
+                )
+        if url.endswith("/sign/file"):
+            return [{"signed_file": item["input"]} for item in request_json]
+        return [{"signature": item["input"]} for item in request_json]
+
+    mocker.patch.object(sign, "post_autograph", new=fake_post_autograph)
+    return posts
+
+
+@pytest.fixture
+async def running_broker(tmp_path, posts):
+    socket_path = str(tmp_path / "broker.sock")
+    b = broker.Broker(socket_path, batch_size=3, batch_window=0.05)
+    await b.start()
+    broker.configure({"autograph_broker_socket": socket_path})
+    yield b
+    broker.configure({})
+    await b.close()
+
+
+def _call(method, *inputs, user="alice"):
+    return broker.call(
+        f"{URL}/sign/{method}",
+        user,
+        "password",
+        [{"input": i, "keyid": "key"} for i in inputs],
+    )
+
+
+# call {{{1
+@pytest.mark.asyncio
+async def test_call_without_broker(tmp_path):
+    broker.configure({})
+    assert not broker.is_configured()
+    assert await _call("hash", "a") is None
+    broker.configure({"autograph_broker_socket": str(tmp_path / "missing.sock")})
+    assert broker.is_configured()
+    assert await _call("hash", "a") is None
+    broker.configure({})
+
+
+@pytest.mark.asyncio
+async def test_call_batches(running_broker, posts):
+    responses = await asyncio.gather(
+        _call("hash", "a"), _call("hash", "b", "c"), _call("hash", "d", user="bob")
+    )
+    assert responses == [
+        [{"signature": "a"}],
+        [{"signature": "b"}, {"signature": "c"}],
+        [{"signature": "d"}],
+    ]
+    # alice's requests are batched together, and bob's are sent separately
+    assert sorted(posts) == [
+        (f"{URL}/sign/hash", ["a", "b", "c"]),
+        (f"{URL}/sign/hash", ["d"]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_call_batch_size(running_broker, posts):
+    await asyncio.gather(*(_call("data", i) for i in "abcd"))
+    assert sorted(len(inputs) for _, inputs in posts) == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_call_memo(running_broker, posts):
+    assert await _call("hash", "a") == [{"signature": "a"}]
+    assert await asyncio.gather(_call("hash", "a"), _call("hash", "a")) == [
+        [{"signature": "a"}],
+        [{"signature": "a"}],
+    ]
+    assert len(posts) == 1
+    # Different credentials aren't answered from the memo
+    await _call("hash", "a", user="bob")
+    assert len(posts) == 2
+
+
+@pytest.mark.asyncio
+async def test_call_file(running_broker, posts):
+    await asyncio.gather(_call("file", "a"), _call("file", "a"))
+    assert posts == [(f"{URL}/sign/file", ["a"])] * 2
+
+
+@pytest.mark.asyncio
+async def test_call_error(running_broker, posts):
+    with pytest.raises(requests.HTTPError) as excinfo:
+        await _call("hash", "bad")
+    assert "503" in str(excinfo.value)
+    # Failures aren't remembered
+    with pytest.raises(requests.HTTPError):
+        await _call("hash", "bad")
+    assert len(posts) == 2
+
+
+@pytest.mark.asyncio
+async def test_call_batch_error(running_broker, posts):
+    a, invalid, b = await asyncio.gather(
+        _call("hash", "a"),
+        _call("hash", "invalid"),
+        _call("hash", "b"),
+        return_exceptions=True,
+    )
+    # The other tasks' requests in the batch still get signed
+    assert a == [{"signature": "a"}]
+    assert b == [{"signature": "b"}]
+    assert isinstance(invalid, requests.HTTPError)
+    assert sorted(inputs for _, inputs in posts) == [
+        ["a"],
+        ["a", "invalid", "b"],
+        ["b"],
+        ["invalid"],
+    ]
+
+    # Throttling fails the whole batch, rather than sending more requests
+    del posts[:]
+    results = await asyncio.gather(
+        _call("hash", "c"), _call("hash", "bad"), return_exceptions=True
+    )
+    assert all(isinstance(r, requests.HTTPError) for r in results)
+    assert len(posts) == 1
+
+
+@pytest.mark.asyncio
+async def test_start(tmp_path, mocker):
+    socket_path = str(tmp_path / "broker.sock")
+    # The socket is created private, not only restricted afterwards
+    mocker.patch.object(broker.os, "chmod")
+    b = broker.Broker(socket_path)
+    await b.start()
+    try:
+        assert os.stat(socket_path).st_mode & 0o777 == 0o600
+    finally:
+        await b.close()
+
+
+@pytest.mark.asyncio
+async def test_call_cancelled(running_broker, mocker):
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def slow_sign(*args):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    mocker.patch.object(running_broker, "sign", new=slow_sign)
+    calling = asyncio.ensure_future(_call("file", "a"))
+    await asyncio.wait_for(started.wait(), 1)
+    calling.cancel()
+    # The broker drops the request of a task that's gone
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_call_queued(running_broker, posts, mocker):
+    fake_post_autograph = sign.post_autograph
+
+    def slow_post_autograph(*args):
+        time.sleep(0.1)
+        return fake_post_autograph(*args)
+
+    mocker.patch.object(sign, "post_autograph", new=slow_post_autograph)
+    running_broker.max_connections = 1
+    # Waiting behind the other tasks' requests doesn't count against the
+    # autograph deadlines
+    latency.configure({"autograph_connect_timeout": 0, "autograph_read_timeout": 0.15})
+    try:
+        responses = await asyncio.gather(*(_call("file", i) for i in "abc"))
+    finally:
+        latency.configure({})
+    assert responses == [[{"signed_file": i}] for i in "abc"]
+
+
+@pytest.mark.asyncio
+async def test_call_autograph_uses_broker(running_broker, posts):
+    assert await sign.call_autograph(
+        f"{URL}/sign/hash", "alice", "password", [{"input": "a"}]
+    ) == [{"signature": "a"}]
+    assert len(running_broker.memo) == 1
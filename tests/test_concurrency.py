@@ -0,0 +1,213 @@
+import asyncio
+
+import pytest
+import requests
+
+import signingscript.concurrency as concurrency
+
+
+# helper constants, fixtures, functions {{{1
+@pytest.fixture
+def limits():
+    concurrency.configure({"concurrency_limits": {"autograph": 4}})
+    yield
+    concurrency.configure({})
+
+
+def _throttled(status=429):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError("throttled", response=response)
+
+
+# AdaptiveLimit {{{1
+@pytest.mark.asyncio
+async def test_adaptive_limit_caps_in_flight():
+    limit = concurrency.AdaptiveLimit("test", 2, 2)
+    running = []
+    peak = []
+
+    async def request():
+        started = await limit.acquire()
+        running.append(started)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(started)
+        limit.release(started)
+
+    await asyncio.gather(*(request() for _ in range(6)))
+    assert max(peak) == 2
+    assert limit.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limit_grows_when_saturated():
+    limit = concurrency.AdaptiveLimit("test", 2, 3)
+    started = await limit.acquire()
+    limit.release(started)
+    # Not every slot was in use
+    assert limit.limit == 2
+
+    for _ in range(10):
+        started = [await limit.acquire() for _ in range(int(limit.limit))]
+        for s in started:
+            limit.release(s)
+    assert limit.limit == 3
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limit_halves_once_per_window():
+    limit = concurrency.AdaptiveLimit("test", 8, 8)
+    started = [await limit.acquire() for _ in range(3)]
+    limit.release(started[0], throttled=True)
+    limit.release(started[1], throttled=True)
+    assert limit.limit == 4
+    # Failures other than throttling don't change the limit
+    limit.release(started[2], succeeded=False)
+    assert limit.limit == 4
+
+    started = await limit.acquire()
+    limit.release(started, throttled=True)
+    assert limit.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limit_latency():
+    limit = concurrency.AdaptiveLimit("test", 8, 8, tolerance=3.0)
+    started = await limit.acquire()
+    limit.release(started)
+    assert limit.min_latency is not None
+    # Much slower than the fastest so far
+    started = await limit.acquire()
+    limit.release(started - limit.min_latency * 4 - 1)
+    assert limit.limit == 4
+
+    # Nor for requests whose latency isn't comparable
+    limit.release(await limit.acquire() - 100, timed=False)
+    assert limit.limit == 4
+
+    # Without a tolerance, latency is ignored
+    limit = concurrency.AdaptiveLimit("test", 8, 8)
+    started = await limit.acquire()
+    limit.release(started)
+    limit.release(await limit.acquire() - 100)
+    assert limit.limit == 8
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limit_cancelled_waiter():
+    limit = concurrency.AdaptiveLimit("test", 1, 1)
+    started = await limit.acquire()
+    cancelled = asyncio.ensure_future(limit.acquire())
+    waiting = asyncio.ensure_future(limit.acquire())
+    await asyncio.sleep(0)
+    limit.release(started)
+    cancelled.cancel()
+    assert await asyncio.wait_for(waiting, 1)
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    assert limit.in_flight == 1
+
+
+# limit {{{1
+@pytest.mark.asyncio
+async def test_limit(limits):
+    async with concurrency.limit("autograph", "server", "fmt"):
+        server_limit = concurrency._limits[("server",)]
+        format_limit = concurrency._limits[("server", "fmt")]
+        assert server_limit.in_flight == format_limit.in_flight == 1
+    assert server_limit.limit == format_limit.limit == 4
+    assert format_limit.tolerance == 3.0
+    assert server_limit.tolerance is None
+
+    with pytest.raises(requests.HTTPError):
+        async with concurrency.limit("autograph", "server", "fmt"):
+            raise _throttled(503)
+    assert server_limit.limit == format_limit.limit == 2
+    assert server_limit.in_flight == format_limit.in_flight == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fixed_size,expected", ((False, 4), (True, 2)))
+async def test_limit_latency(limits, mocker, fixed_size, expected):
+    clock = mocker.patch.object(concurrency.time, "monotonic", return_value=0)
+    for latency in (1, 100):
+        async with concurrency.limit("autograph", "server", "fmt", fixed_size):
+            clock.return_value += latency
+    # Only fixed-size requests are slowed down by their latency
+    assert concurrency._limits[("server", "fmt")].limit == expected
+
+
+def test_configure(limits):
+    concurrency._get_limit(("server",), "server", 4)
+    concurrency.configure({"concurrency_limits": {"autograph": 4}})
+    assert ("server",) in concurrency._limits
+    concurrency.configure({"concurrency_limits": {"autograph": 2}})
+    assert concurrency._limits == {}
+
+
+def test_is_throttled():
+    assert concurrency.is_throttled(_throttled())
+    assert not concurrency.is_throttled(_throttled(500))
+    assert not concurrency.is_throttled(ValueError())
+    assert not concurrency.is_throttled(None)
+
+
+# MemoryBudget {{{1
+@pytest.mark.asyncio
+async def test_memory_budget_small_pass_large():
+    budget = concurrency.MemoryBudget(100)
+    first = await budget.acquire(60)
+    large = asyncio.ensure_future(budget.acquire(50))
+    await asyncio.sleep(0)
+    assert not large.done()
+    # Small work that leaves room for the waiting work isn't held up...
+    assert await asyncio.wait_for(budget.acquire(10), 1) == 10
+    # ...but work that would delay it waits
+    medium = asyncio.ensure_future(budget.acquire(35))
+    await asyncio.sleep(0)
+    assert not medium.done()
+
+    budget.release(first)
+    assert await asyncio.wait_for(large, 1) == 50
+    assert await asyncio.wait_for(medium, 1) == 35
+    assert budget.used == 95
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_oversized():
+    budget = concurrency.MemoryBudget(100)
+    small = await budget.acquire(1)
+    oversized = asyncio.ensure_future(budget.acquire(500))
+    await asyncio.sleep(0)
+    assert not oversized.done()
+    budget.release(small)
+    assert await asyncio.wait_for(oversized, 1) == 100
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_cancelled():
+    budget = concurrency.MemoryBudget(100)
+    first = await budget.acquire(100)
+    cancelled = asyncio.ensure_future(budget.acquire(100))
+    waiting = asyncio.ensure_future(budget.acquire(50))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    budget.release(first)
+    assert await asyncio.wait_for(waiting, 1) == 50
+    assert budget.used == 50
+
+
+@pytest.mark.asyncio
+async def test_reserve_memory():
+    concurrency.configure({"autograph_memory_budget": 100})
+    try:
+        async with concurrency.reserve_memory(60):
+            assert concurrency._budget.used == 60
+        assert concurrency._budget.used == 0
+    finally:
+        concurrency.configure({})
+    assert concurrency._budget is None
+    async with concurrency.reserve_memory(60):
+        pass
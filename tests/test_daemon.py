@@ -0,0 +1,242 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import scriptworker.client
+from scriptworker.context import Context
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+import signingscript.daemon as daemon
+import signingscript.script as script
+
+
+# helper constants, fixtures, functions {{{1
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "signingscript.sock")
+
+
+@pytest.fixture
+def config_path(tmp_path, socket_path):
+    path = tmp_path / "script_config.json"
+    path.write_text(json.dumps({"daemon_socket": socket_path}))
+    return str(path)
+
+
+@pytest.fixture
+async def running_daemon(socket_path, mocker):
+    mocker.patch.object(scriptworker.client, "validate_task_schema")
+    d = daemon.Daemon(socket_path)
+    await d.start()
+    yield d
+    await d.close()
+
+
+def _fake_load_context(config_path, default_config):
+    context = Context()
+    context.config = dict(default_config, config_path=config_path)
+    return context
+
+
+async def _run_task(config_path):
+    stream = io.StringIO()
+    loop = asyncio.get_event_loop()
+    exit_code = await loop.run_in_executor(None, daemon.run_task, config_path, stream)
+    return exit_code, stream.getvalue()
+
+
+# run_task {{{1
+def test_run_task_no_daemon_socket(tmp_path):
+    path = tmp_path / "script_config.json"
+    path.write_text(json.dumps({"work_dir": str(tmp_path)}))
+    assert daemon.run_task(str(path)) is None
+    assert daemon.run_task(str(tmp_path / "missing.json")) is None
+
+
+def test_run_task_not_listening(config_path):
+    stream = io.StringIO()
+    assert daemon.run_task(config_path, stream) is None
+    assert "signing in-process" in stream.getvalue()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "error,expected",
+    ((None, 0), (ScriptWorkerTaskException("boom", exit_code=3), 3), (OSError(), 1)),
+)
+async def test_run_task(running_daemon, config_path, mocker, error, expected):
+    contexts = []
+    connectors = []
+
+    async def fake_async_main(context, connector=None):
+        contexts.append(context)
+        connectors.append(connector)
+        logging.getLogger("signingscript.sign").info("signing %s", "path1")
+        if error:
+            raise error
+
+    mocker.patch.object(daemon, "_load_context", new=_fake_load_context)
+    mocker.patch.object(script, "async_main", new=fake_async_main)
+
+    exit_code, output = await _run_task(config_path)
+    assert exit_code == expected
+    assert "signingscript.sign - INFO - signing path1" in output
+    assert contexts[0].config["config_path"] == config_path
+    assert "work_dir" in contexts[0].config
+
+    # The connector is kept for the next task
+    await _run_task(config_path)
+    assert connectors[0] is connectors[1]
+    assert not connectors[0].closed
+
+
+@pytest.mark.asyncio
+async def test_run_task_one_at_a_time(running_daemon, config_path, mocker):
+    running = []
+    overlapped = []
+
+    async def fake_async_main(context, connector=None):
+        overlapped.append(bool(running))
+        running.append(context)
+        await asyncio.sleep(0.05)
+        running.remove(context)
+
+    mocker.patch.object(daemon, "_load_context", new=_fake_load_context)
+    mocker.patch.object(script, "async_main", new=fake_async_main)
+
+    results = await asyncio.gather(_run_task(config_path), _run_task(config_path))
+    assert [exit_code for exit_code, _ in results] == [0, 0]
+    assert overlapped == [False, False]
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels(running_daemon, socket_path, mocker):
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def fake_async_main(context, connector=None):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    mocker.patch.object(daemon, "_load_context", new=_fake_load_context)
+    mocker.patch.object(script, "async_main", new=fake_async_main)
+
+    _, writer = await asyncio.open_unix_connection(socket_path)
+    writer.write(
+        json.dumps({"config_path": "config.json", "cwd": os.getcwd()}).encode() + b"\n"
+    )
+    await asyncio.wait_for(started.wait(), 5)
+    writer.close()
+    await asyncio.wait_for(cancelled.wait(), 5)
+
+
+def test_load_context(tmp_path, mocker):
+    path = tmp_path / "script_config.json"
+    path.write_text(json.dumps({"work_dir": str(tmp_path)}))
+    task = {"scopes": []}
+    (tmp_path / "task.json").write_text(json.dumps(task))
+    context = daemon._load_context(str(path), {"verbose": True, "work_dir": "w"})
+    assert context.config == {"verbose": True, "work_dir": str(tmp_path)}
+    assert context.task == task
+
+
+@pytest.mark.asyncio
+async def test_other_users_refused(running_daemon, config_path, mocker):
+    mocker.patch.object(daemon, "_peer_uid", return_value=os.getuid() + 1)
+    run = mocker.patch.object(running_daemon, "run")
+    exit_code, _ = await _run_task(config_path)
+    assert exit_code == 1
+    run.assert_not_called()
+
+
+# Daemon.start {{{1
+@pytest.mark.asyncio
+async def test_start(running_daemon, socket_path):
+    # Only this user can connect
+    assert os.stat(socket_path).st_mode & 0o777 == 0o600
+    with pytest.raises(OSError):
+        await daemon.Daemon(socket_path).start()
+
+    await running_daemon.close()
+    assert not os.path.exists(socket_path)
+    # A stale socket is replaced
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(socket_path)
+    sock.close()
+    await running_daemon.start()
+    assert os.path.exists(socket_path)
+
+
+# client_main {{{1
+# Hands the task in argv to the daemon, and reports what was imported
+CLIENT_MAIN = """
+import json, sys
+from signingscript import daemon
+try:
+    daemon.client_main()
+except SystemExit as exc:
+    print(json.dumps({"exit_code": exc.code, "modules": sorted(sys.modules)}))
+"""
+
+
+def test_client_main_imports(config_path, socket_path):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+
+    def answer():
+        conn, _ = server.accept()
+        with conn, conn.makefile("rwb") as fh:
+            fh.readline()
+            fh.write(b'{"exit_code": 3}\n')
+
+    thread = threading.Thread(target=answer)
+    thread.start()
+    try:
+        output = subprocess.run(
+            [sys.executable, "-c", CLIENT_MAIN, config_path],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=60,
+        ).stdout
+    finally:
+        thread.join(5)
+        server.close()
+    result = json.loads(output)
+    assert result["exit_code"] == 3
+    # Tasks handed to the daemon don't pay for signingscript's imports
+    for name in ("signingscript.sign", "signingscript.script", "aiohttp"):
+        assert name not in result["modules"]
+    assert not [m for m in result["modules"] if m.split(".")[0] == "scriptworker"]
+
+
+def test_client_main_in_process(mocker):
+    mocker.patch.object(daemon.sys, "argv", ["signingscript", "config.json"])
+    mocker.patch.object(daemon, "run_task", return_value=None)
+    mocker.patch.object(script, "run_in_process", return_value=0)
+    assert daemon.client_main() == 0
+    daemon.run_task.assert_called_once_with("config.json")
+
+
+# main {{{1
+def test_main_usage(mocker, tmp_path):
+    mocker.patch.object(daemon.sys, "argv", ["signingscript-daemon"])
+    with pytest.raises(SystemExit):
+        daemon.main()
+    path = tmp_path / "script_config.json"
+    path.write_text("{}")
+    with pytest.raises(SystemExit):
+        daemon.main(str(path))
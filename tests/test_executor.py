@@ -0,0 +1,67 @@
+import os
+import threading
+
+import pytest
+
+import signingscript.executor as executor
+
+
+def _pid():
+    return os.getpid()
+
+
+def _raise(message):
+    raise ValueError(message)
+
+
+@pytest.fixture
+def pools():
+    executor.configure({"io_workers": 2, "cpu_workers": 1})
+    yield
+    executor.configure({})
+
+
+# run_io {{{1
+@pytest.mark.asyncio
+async def test_run_io(pools):
+    def run(a, b=None):
+        return threading.current_thread().name, a, b
+
+    name, a, b = await executor.run_io(run, 1, b=2)
+    assert name.startswith("signingscript-io")
+    assert (a, b) == (1, 2)
+
+
+# run_cpu {{{1
+@pytest.mark.asyncio
+async def test_run_cpu(pools):
+    assert await executor.run_cpu(_pid) != os.getpid()
+    with pytest.raises(ValueError):
+        await executor.run_cpu(_raise, "boom")
+    # The workers aren't forked from this process
+    assert executor._pools["cpu"]._mp_context.get_start_method() in (
+        "forkserver",
+        "spawn",
+    )
+
+
+# configure {{{1
+@pytest.mark.asyncio
+async def test_configure_restarts_pools(pools):
+    await executor.run_io(_pid)
+    pool = executor._pools["io"]
+    assert pool._max_workers == 2
+    executor.configure({"io_workers": 3})
+    assert executor._pools == {}
+    await executor.run_io(_pid)
+    assert executor._pools["io"]._max_workers == 3
+    executor.shutdown()
+    assert executor._pools == {}
+
+
+@pytest.mark.asyncio
+async def test_configure_keeps_pools(pools):
+    await executor.run_io(_pid)
+    pool = executor._pools["io"]
+    executor.configure({"io_workers": 2, "cpu_workers": 1, "work_dir": "work"})
+    assert executor._pools["io"] is pool
@@ -0,0 +1,140 @@
+import os
+import zipfile
+
+import pytest
+
+from signingscript.exceptions import SigningScriptError
+import signingscript.explain as explain
+import signingscript.sign as sign
+from conftest import TEST_DATA_DIR
+
+
+@pytest.fixture(scope="function")
+def windows_zip(tmpdir):
+    path = os.path.join(tmpdir, "target.zip")
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("firefox/firefox.exe", b"0" * 100)
+        z.writestr("firefox/xul.dll", b"0" * 1000)
+        z.writestr("firefox/msvcp140.dll", b"0" * 10)
+        z.writestr("firefox/omni.ja", b"0" * 300)
+        z.writestr("firefox/precomplete", b"0" * 10)
+    return path
+
+
+# get_archive_members {{{1
+def test_get_archive_members(tmpdir):
+    expected = [("a", 2), ("b", 2), ("c/d", 2), ("c/e/f", 2)]
+    assert (
+        explain.get_archive_members(os.path.join(TEST_DATA_DIR, "test.zip")) == expected
+    )
+    assert explain.get_archive_members(os.path.join(TEST_DATA_DIR, "test.tar.gz")) == [
+        ("./{}".format(name), size) for name, size in expected
+    ]
+    assert (
+        explain.get_archive_members(os.path.join(TEST_DATA_DIR, "id_rsa.pub")) is None
+    )
+    bad_zip = os.path.join(tmpdir, "bad.zip")
+    with open(bad_zip, "w") as fh:
+        fh.write("not a zip")
+    assert explain.get_archive_members(bad_zip) is None
+
+
+# explain_path {{{1
+def test_explain_path(windows_zip):
+    size = os.path.getsize(windows_zip)
+    explanation = explain.explain_path(
+        "target.zip",
+        windows_zip,
+        ["autograph_authenticode", "autograph_widevine", "autograph_omnija", "gpg"],
+    )
+    assert explanation["inner_files"] == {
+        "autograph_authenticode": ["firefox/firefox.exe", "firefox/xul.dll"],
+        "autograph_widevine": ["firefox/firefox.exe", "firefox/xul.dll"],
+        "autograph_omnija": ["firefox/omni.ja"],
+    }
+    assert explanation["remote_calls"] == 2 + 2 + 1 + 1
+    assert explanation["signing_server_upload_bytes"] == size
+    assert explanation["autograph_upload_bytes"] == 4 * 88 + 400
+    assert explanation["repack_bytes"] == 3 * 1420
+
+
+def test_explain_path_single_file(tmpdir):
+    path = os.path.join(tmpdir, "target.mar")
+    with open(path, "wb") as fh:
+        fh.write(b"0" * 1000)
+    explanation = explain.explain_path(
+        "target.mar", path, ["autograph_hash_only_mar384", "autograph_gpg"]
+    )
+    assert explanation["remote_calls"] == 2
+    assert explanation["autograph_upload_bytes"] == 88 + 1336
+    assert explanation["repack_bytes"] == 0
+
+
+def test_explain_path_unknown_archive(tmpdir):
+    path = os.path.join(tmpdir, "target.dmg")
+    with open(path, "wb") as fh:
+        fh.write(b"0" * 10)
+    explanation = explain.explain_path("target.dmg", path, ["autograph_widevine"])
+    assert explanation["inner_files"] == {"autograph_widevine": None}
+    assert explanation["remote_calls"] == 0
+
+
+@pytest.mark.parametrize(
+    "fmt,name,config",
+    (
+        ("autograph_gpg", "target.zip", {"gpg_hash_signing_keyid": "gpg_rsa"}),
+        (
+            "autograph_langpack",
+            "target.xpi",
+            {"xpi_hash_signing": True, "xpi_cose_formats": []},
+        ),
+        (
+            "autograph_omnija",
+            "target.zip",
+            {"xpi_hash_signing": True, "xpi_cose_formats": []},
+        ),
+        ("autograph_apk_fennec_sha1", "target.apk", {"apk_hash_signing": True}),
+    ),
+)
+def test_explain_path_hash_modes(context, windows_zip, fmt, name, config):
+    path = os.path.join(os.path.dirname(windows_zip), name)
+    os.rename(windows_zip, path)
+    whole = explain.explain_path(name, path, [fmt], context)
+    context.config.update(config)
+    explanation = explain.explain_path(name, path, [fmt], context)
+    assert explanation["remote_calls"] == whole["remote_calls"] == 1
+    # Only the digest or signature file is sent
+    if fmt == "autograph_apk_fennec_sha1":
+        _, sigfile = sign.make_apk_v1_signature_files(path, "sha1")
+        upload = explain._apk_sigfile_size(explain.get_archive_members(path))
+        assert len(sigfile) <= upload
+    elif fmt == "autograph_gpg":
+        upload = explain._DIGEST_BYTES
+    else:
+        upload = explain._XPI_SIGFILE_BYTES
+    assert explanation["autograph_upload_bytes"] == explain._b64_size(upload)
+    assert explanation["autograph_upload_bytes"] < whole["autograph_upload_bytes"]
+
+
+def test_explain_path_xpi_hash_signing_needs_cose(context, windows_zip):
+    context.config.update({"xpi_hash_signing": True})
+    with pytest.raises(SigningScriptError):
+        explain.explain_path("target.zip", windows_zip, ["autograph_omnija"], context)
+
+
+# explain_task {{{1
+def test_explain_task(context, windows_zip):
+    context.task = {
+        "payload": {
+            "upstreamArtifacts": [
+                {"taskId": "task1", "paths": ["target.zip"], "formats": ["gpg"]}
+            ]
+        }
+    }
+    full_path = os.path.join(context.config["work_dir"], "cot", "task1", "target.zip")
+    os.makedirs(os.path.dirname(full_path))
+    os.rename(windows_zip, full_path)
+    report = explain.explain_task(context)
+    assert list(report["paths"]) == ["target.zip"]
+    assert report["total"]["remote_calls"] == 1
+    assert report["total"]["signing_server_upload_bytes"] == os.path.getsize(full_path)
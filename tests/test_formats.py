@@ -0,0 +1,47 @@
+import pytest
+
+import signingscript.formats as formats
+
+
+# get_signing_format {{{1
+@pytest.mark.parametrize(
+    "format,signing_function,autograph,hash_only",
+    (
+        ("autograph_authenticode", "sign_authenticode_zip", True, True),
+        ("autograph_authenticode_stub", "sign_authenticode_zip", True, True),
+        ("autograph_gpg", "sign_gpg_with_autograph", True, False),
+        (
+            "autograph_hash_only_mar384:firefox_20190321_dev",
+            "sign_mar384_with_autograph_hash",
+            True,
+            True,
+        ),
+        ("gpg", "sign_gpg", False, False),
+        ("widevine_blessed", "sign_widevine", False, False),
+        ("sha2signcodestub", "sign_signcode", False, False),
+        ("autograph_mar", "sign_file", True, False),
+        ("mar", "sign_file", False, False),
+    ),
+)
+def test_get_signing_format(format, signing_function, autograph, hash_only):
+    signing_format = formats.get_signing_format(format)
+    assert signing_format.signing_function == signing_function
+    assert signing_format.autograph == autograph
+    assert signing_format.hash_only == hash_only
+
+
+def test_get_signing_format_is_cached():
+    formats.get_signing_format.cache_clear()
+    formats.get_signing_format("autograph_apk_fenix")
+    formats.get_signing_format("autograph_apk_fenix")
+    assert formats.get_signing_format.cache_info().hits == 1
+
+
+# format_sort_key {{{1
+def test_format_sort_key():
+    assert (
+        formats.format_sort_key("sha2signcode")
+        < formats.format_sort_key("widevine")
+        < formats.format_sort_key("macapp")
+        < formats.format_sort_key("gpg")
+    )
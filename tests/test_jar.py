@@ -0,0 +1,209 @@
+import io
+import os
+import sys
+import time
+import warnings
+import zipfile
+
+import pytest
+
+import signingscript
+import signingscript.jar as jar
+from signingscript.jar import (
+    JAR_BROTLI,
+    JAR_DEFLATED,
+    JAR_STORED,
+    JarReader,
+    JarReaderError,
+    JarWriterError,
+    StreamingJarWriter,
+)
+
+from conftest import TEST_DATA_DIR
+
+# The vendored mozjar is the reference implementation
+sys.path.append(
+    os.path.join(os.path.dirname(signingscript.__file__), "vendored", "mozbuild")
+)
+with warnings.catch_warnings():
+    # mozbuild predates collections.abc
+    warnings.simplefilter("ignore", DeprecationWarning)
+    from mozpack import mozjar
+
+ENTRIES = (
+    ("chrome.manifest", b"content global jar:toolkit.jar!/content/\n" * 50, {}),
+    ("random.bin", os.urandom(5000), {}),
+    ("stored.txt", b"a" * 1000, {"compress": False}),
+    ("bin/run.sh", b"#!/bin/sh\n", {"mode": 0o755}),
+    ("empty", b"", {}),
+)
+
+
+def _write_both(tmpdir, entries, preload=None, **kwargs):
+    expected = os.path.join(tmpdir, "expected.ja")
+    actual = os.path.join(tmpdir, "actual.ja")
+    with mozjar.JarWriter(expected, **kwargs) as writer:
+        for name, data, add_kwargs in entries:
+            writer.add(name, data, **add_kwargs)
+        if preload:
+            writer.preload(preload)
+    with StreamingJarWriter(
+        actual, last_preloaded=preload[-1] if preload else None, **kwargs
+    ) as writer:
+        for name, data, add_kwargs in entries:
+            writer.add(name, data, **add_kwargs)
+    with open(expected, "rb") as e, open(actual, "rb") as a:
+        return e.read(), a.read()
+
+
+# StreamingJarWriter {{{1
+@pytest.mark.parametrize("compress", (True, False))
+def test_streaming_jar_writer_matches_mozjar(tmpdir, compress):
+    expected, actual = _write_both(tmpdir, ENTRIES, compress=compress)
+    assert actual == expected
+
+
+def test_streaming_jar_writer_preload_matches_mozjar(tmpdir):
+    expected, actual = _write_both(
+        tmpdir, ENTRIES, preload=["chrome.manifest", "random.bin"]
+    )
+    assert actual == expected
+    reader = mozjar.JarReader(os.path.join(tmpdir, "actual.ja"))
+    assert reader.is_optimized
+    assert reader.last_preloaded == b"random.bin"
+    assert [f.read() for f in reader] == [data for _, data, _ in ENTRIES]
+
+
+def test_streaming_jar_writer_fileobj(tmpdir):
+    entries = [("bytes.txt", b"x" * 3000, {}), ("random.bin", os.urandom(3000), {})]
+    expected, _ = _write_both(tmpdir, entries)
+    actual = os.path.join(tmpdir, "fileobj.ja")
+    with StreamingJarWriter(actual) as writer:
+        for name, data, _ in entries:
+            writer.add(name, io.BytesIO(data))
+    with open(actual, "rb") as fh:
+        assert fh.read() == expected
+
+
+def test_streaming_jar_writer_copies_jar_entries(tmpdir):
+    # Modes aren't available from mozjar entries, so aren't copied
+    entries = [e for e in ENTRIES if "mode" not in e[2]]
+    orig = os.path.join(tmpdir, "orig.ja")
+    with mozjar.JarWriter(orig) as writer:
+        for name, data, add_kwargs in entries:
+            writer.add(name, data, **add_kwargs)
+    copy = os.path.join(tmpdir, "copy.ja")
+    with StreamingJarWriter(copy) as writer:
+        for entry in mozjar.JarReader(orig):
+            writer.add(entry.filename, entry, compress=entry.compress)
+    recompressed = os.path.join(tmpdir, "recompressed.ja")
+    with StreamingJarWriter(recompressed, compress=False) as writer:
+        for entry in mozjar.JarReader(orig):
+            writer.add(entry.filename, entry)
+    with open(orig, "rb") as o, open(copy, "rb") as c:
+        assert o.read() == c.read()
+    reader = mozjar.JarReader(recompressed)
+    assert reader.compression == JAR_STORED
+    assert [f.read() for f in reader] == [data for _, data, _ in entries]
+
+
+@pytest.mark.parametrize("preload", (None, "1/random.bin"))
+def test_streaming_jar_writer_parallel(tmpdir, mocker, preload):
+    compress_entry = jar._compress_entry
+
+    def slow_compress_entry(*args):
+        # Still compressing when the writer finishes
+        time.sleep(0.01)
+        return compress_entry(*args)
+
+    mocker.patch.object(jar, "_compress_entry", new=slow_compress_entry)
+    entries = list(ENTRIES) * 4
+    paths = []
+    for workers in (1, 3):
+        path = os.path.join(tmpdir, "{}.ja".format(workers))
+        with StreamingJarWriter(
+            path, compress_level=6, last_preloaded=preload, workers=workers
+        ) as writer:
+            for i, (name, data, add_kwargs) in enumerate(entries):
+                writer.add("{}/{}".format(i, name), io.BytesIO(data), **add_kwargs)
+            writer.add("dir/", b"", compress=False, date_time=(2020, 5, 6, 7, 8, 10))
+        paths.append(path)
+    with open(paths[0], "rb") as serial, open(paths[1], "rb") as parallel:
+        assert serial.read() == parallel.read()
+    if preload:
+        return
+    with zipfile.ZipFile(paths[1]) as z:
+        assert [z.read(i) for i in z.infolist()[:-1]] == [d for _, d, _ in entries]
+        info = z.getinfo("dir/")
+        assert info.is_dir()
+        assert info.date_time == (2020, 5, 6, 7, 8, 10)
+
+
+def test_streaming_jar_writer_errors(tmpdir):
+    with StreamingJarWriter(os.path.join(tmpdir, "a.ja")) as writer:
+        writer.add("foo", b"foo")
+        with pytest.raises(JarWriterError):
+            writer.add("foo", b"bar")
+        with pytest.raises(JarWriterError):
+            writer.add("bar", 1)
+        with pytest.raises(JarWriterError):
+            writer.add("baz", b"baz", compress=JAR_BROTLI)
+    writer = StreamingJarWriter(os.path.join(tmpdir, "b.ja"), last_preloaded="foo")
+    writer.add("bar", b"bar", compress=JAR_DEFLATED)
+    with pytest.raises(JarWriterError):
+        writer.finish()
+
+
+# JarReader {{{1
+@pytest.mark.parametrize(
+    "filename", ("no_preload_unsigned_omni.ja", "preload_unsigned_omni.ja")
+)
+def test_jar_reader_matches_mozjar(filename):
+    path = os.path.join(TEST_DATA_DIR, filename)
+    with JarReader(path) as reader:
+        expected = mozjar.JarReader(path)
+        assert reader.names == [name.decode() for name in expected.entries]
+        assert len(reader) == len(expected.entries)
+        assert reader.compression == expected.compression
+        assert reader.last_preloaded == (
+            expected.last_preloaded.decode() if expected.last_preloaded else None
+        )
+        assert list(reader.offsets) == [e["offset"] for e in expected.entries.values()]
+        for entry in reader:
+            expected_entry = expected[entry.filename.encode()]
+            assert entry.compress == expected_entry.compress
+            assert entry.crc32 == expected_entry.crc32
+            assert entry.read() == expected_entry.read()
+
+
+# mozjar can't read these, as their local headers don't match their central
+# directory entries
+@pytest.mark.parametrize("filename", ("no_preload_signed_omni.ja", "en-CA.xpi"))
+def test_jar_reader_matches_zipfile(filename):
+    path = os.path.join(TEST_DATA_DIR, filename)
+    with JarReader(path) as reader, zipfile.ZipFile(path) as expected:
+        infos = [i for i in expected.infolist() if not i.is_dir()]
+        assert reader.names == [i.filename for i in infos]
+        for entry, info in zip(reader, infos):
+            assert entry.crc32 == info.CRC
+            assert entry.read() == expected.read(info)
+
+
+def test_jar_reader_comment_and_directories(tmpdir):
+    path = os.path.join(tmpdir, "test.zip")
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("dir/", b"")
+        z.writestr("dir/file", b"contents")
+        z.comment = b"PK\x05\x06 isn't an end record" * 10
+    with JarReader(path) as reader:
+        assert reader.names == ["dir/file"]
+        assert [e.read() for e in reader] == [b"contents"]
+
+
+@pytest.mark.parametrize("contents", (b"", b"not a jar" * 100))
+def test_jar_reader_not_a_jar(tmpdir, contents):
+    path = os.path.join(tmpdir, "not.ja")
+    with open(path, "wb") as fh:
+        fh.write(contents)
+    with pytest.raises(JarReaderError):
+        JarReader(path)
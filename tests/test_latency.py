@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+import signingscript.latency as latency
+from signingscript.utils import SigningServer
+
+
+# helper constants, fixtures, functions {{{1
+SERVERS = [
+    SigningServer("https://primary", "user", "pass", ["fmt"], "autograph"),
+    SigningServer("https://backup", "user", "pass", ["fmt"], "autograph"),
+]
+
+
+@pytest.fixture
+def hedging():
+    latency.configure({"autograph_hedging": True, "autograph_hedge_min_samples": 2})
+    latency._windows.clear()
+    for method in ("hash", "data", "file"):
+        for _ in range(2):
+            latency.record("https://primary", method, 0.01)
+    yield
+    latency.configure({})
+    latency._windows.clear()
+
+
+def _server(delays, calls, errors={}):
+    async def call(server):
+        calls.append(server.server)
+        await asyncio.sleep(delays[server.server])
+        if server.server in errors:
+            raise errors[server.server]
+        return server.server
+
+    return call
+
+
+# configure {{{1
+def test_configure():
+    latency.configure({"autograph_connect_timeout": 1, "autograph_read_timeout": 2})
+    assert latency.timeouts() == (1, 2)
+    latency.configure({})
+    assert latency.timeouts() == (10, 300)
+
+
+# percentile {{{1
+def test_percentile():
+    latency._windows.clear()
+    assert latency.percentile("server", "hash") is None
+    for i in range(100):
+        latency.record("server", "hash", i)
+    assert latency.percentile("server", "hash") == 95
+    assert latency.percentile("server", "data") is None
+    # Requests of a different size are timed separately
+    assert latency.percentile("server", "hash", 4096) is None
+    for i in range(100):
+        latency.record("server", "hash", i + 100, 4096 + i)
+    assert latency.percentile("server", "hash", 5000) == 195
+    assert latency.percentile("server", "hash", 16384) is None
+    latency._windows.clear()
+
+
+@pytest.mark.asyncio
+async def test_timed():
+    latency._windows.clear()
+
+    async def fail():
+        raise ValueError()
+
+    assert await latency.timed("server", "hash", asyncio.sleep(0, "done")) == "done"
+    with pytest.raises(ValueError):
+        await latency.timed("server", "hash", fail())
+    # Only successes are recorded
+    assert len(latency._windows[("server", "hash", 0)]) == 1
+    latency._windows.clear()
+
+
+# hedge {{{1
+@pytest.mark.asyncio
+async def test_hedge_fast(hedging):
+    calls = []
+    call = _server({"https://primary": 0, "https://backup": 0}, calls)
+    assert await latency.hedge("hash", SERVERS, call) == "https://primary"
+    assert calls == ["https://primary"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("errors", ({}, {"https://primary": ValueError()}))
+async def test_hedge_slow(hedging, errors):
+    calls = []
+    # A failing primary fails after the hedge was sent
+    delays = {"https://primary": 0.03 if errors else 1, "https://backup": 0.05}
+    call = _server(delays, calls, errors)
+    assert await latency.hedge("data", SERVERS, call) == "https://backup"
+    assert calls == ["https://primary", "https://backup"]
+
+
+@pytest.mark.asyncio
+async def test_hedge_both_fail(hedging):
+    calls = []
+    errors = {"https://primary": ValueError(), "https://backup": KeyError()}
+    call = _server({"https://primary": 0.05, "https://backup": 0}, calls, errors)
+    # The primary's failure is reported
+    with pytest.raises(ValueError):
+        await latency.hedge("hash", SERVERS, call)
+    assert calls == ["https://primary", "https://backup"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "method,servers,config,size",
+    (
+        ("file", SERVERS, {}, 0),
+        ("hash", SERVERS[:1], {}, 0),
+        ("hash", SERVERS, {"autograph_hedging": False}, 0),
+        ("hash", SERVERS, {"autograph_hedge_min_samples": 3}, 0),
+        # No latencies for requests this size have been seen
+        ("data", SERVERS, {}, 4096),
+    ),
+)
+async def test_hedge_off(hedging, method, servers, config, size):
+    latency.configure(
+        {"autograph_hedging": True, "autograph_hedge_min_samples": 2, **config}
+    )
+    calls = []
+    call = _server({"https://primary": 0.05, "https://backup": 0}, calls)
+    assert await latency.hedge(method, servers, call, size) == "https://primary"
+    assert calls == ["https://primary"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_size,hedged", ((4096, True), (1024, False)))
+async def test_hedge_max_size(hedging, max_size, hedged):
+    latency.configure(
+        {
+            "autograph_hedging": True,
+            "autograph_hedge_min_samples": 2,
+            "autograph_hedge_max_size": max_size,
+        }
+    )
+    for _ in range(2):
+        latency.record("https://primary", "data", 0.01, 4096)
+    calls = []
+    call = _server({"https://primary": 0.05, "https://backup": 0}, calls)
+    await latency.hedge("data", SERVERS, call, 4096)
+    assert (calls == ["https://primary", "https://backup"]) == hedged
+
+
+@pytest.mark.asyncio
+async def test_hedge_cancelled(hedging):
+    started = asyncio.Event()
+    cancelled = []
+
+    async def call(server):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(server.server)
+            raise
+
+    hedging_task = asyncio.ensure_future(latency.hedge("hash", SERVERS, call))
+    await started.wait()
+    # Cancelled while waiting to hedge, the primary request is cancelled too
+    hedging_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await hedging_task
+    await asyncio.sleep(0)
+    assert cancelled == ["https://primary"]
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+import pytest
+
+from signingscript.exceptions import SigningScriptError
+import signingscript.pgp as pgp
+
+
+def _mpi(value):
+    return struct.pack(">H", value.bit_length()) + value.to_bytes(
+        (value.bit_length() + 7) // 8, "big"
+    )
+
+
+@pytest.fixture(scope="module")
+def rsa_key():
+    return rsa.generate_private_key(65537, 2048, default_backend())
+
+
+@pytest.fixture
+def pubkey_path(tmpdir, rsa_key):
+    numbers = rsa_key.public_key().public_numbers()
+    body = b"\x04" + struct.pack(">I", 1500000000) + b"\x01"
+    body += _mpi(numbers.n) + _mpi(numbers.e)
+    key_packet = b"\x99" + struct.pack(">H", len(body)) + body
+    uid = b"test"
+    # A positive certification of the user id, with a creation time and
+    # signing key flags
+    hashed_subpackets = b"\x05\x02" + struct.pack(">I", 1500000000) + b"\x02\x1b\x03"
+    hashed = b"\x04\x13\x01\x0a" + struct.pack(">H", len(hashed_subpackets))
+    hashed += hashed_subpackets
+    digest = hashlib.sha512(
+        key_packet
+        + b"\xb4"
+        + struct.pack(">I", len(uid))
+        + uid
+        + hashed
+        + b"\x04\xff"
+        + struct.pack(">I", len(hashed))
+    ).digest()
+    signature = rsa_key.sign(digest, padding.PKCS1v15(), Prehashed(hashes.SHA512()))
+    key_id = hashlib.sha1(key_packet).digest()[-8:]
+    sig_body = hashed + b"\x00\x0a\x09\x10" + key_id + digest[:2]
+    sig_body += _mpi(int.from_bytes(signature, "big"))
+    packet = (
+        key_packet
+        + b"\xb4"
+        + bytes([len(uid)])
+        + uid
+        + b"\x89"
+        + struct.pack(">H", len(sig_body))
+        + sig_body
+    )
+    path = os.path.join(tmpdir, "KEY")
+    with open(path, "w") as fh:
+        fh.write(pgp.armor(packet, "PUBLIC KEY BLOCK"))
+    pgp._load_public_key.cache_clear()
+    return path
+
+
+# armor {{{1
+def test_armor_roundtrip():
+    data = bytes(range(256)) * 3
+    armored = pgp.armor(data)
+    assert armored.startswith("-----BEGIN PGP SIGNATURE-----\n\n")
+    assert armored.endswith("-----END PGP SIGNATURE-----\n")
+    assert all(len(line) <= 64 for line in armored.splitlines())
+    assert pgp.dearmor(armored) == data
+    # Armor headers are skipped
+    with_header = armored.replace("-----\n\n", "-----\nVersion: GnuPG\n\n", 1)
+    assert pgp.dearmor(with_header) == data
+
+
+@pytest.mark.parametrize(
+    "text",
+    (
+        "not armored",
+        pgp.armor(b"some data").replace("=", "=AAAA", 1),
+        "-----BEGIN PGP SIGNATURE-----\nno blank line\n-----END PGP SIGNATURE-----",
+    ),
+)
+def test_dearmor_raises(text):
+    with pytest.raises(SigningScriptError):
+        pgp.dearmor(text)
+
+
+# load_public_key {{{1
+def test_load_public_key(pubkey_path):
+    key = pgp.load_public_key(pubkey_path)
+    assert key.algorithm == pgp.PUBKEY_ALGORITHM_RSA
+    assert len(key.fingerprint) == 20
+    assert key.key_id == key.fingerprint[-8:]
+
+
+def test_load_public_key_reread(pubkey_path):
+    assert pgp.load_public_key(pubkey_path) is pgp.load_public_key(pubkey_path)
+    # A changed key file is reread
+    with open(pubkey_path, "w") as fh:
+        fh.write(pgp.armor(b"\xc2\x01\x04"))
+    os.utime(pubkey_path, ns=(0, 0))
+    with pytest.raises(SigningScriptError):
+        pgp.load_public_key(pubkey_path)
+
+
+def test_load_public_key_not_a_key(tmpdir):
+    path = os.path.join(tmpdir, "KEY")
+    with open(path, "w") as fh:
+        fh.write(pgp.armor(b"\xc2\x01\x04"))
+    with pytest.raises(SigningScriptError):
+        pgp.load_public_key(path)
+
+
+def test_make_signature_trailer_unsupported_algorithm():
+    key = pgp.PGPKey(b"\x00" * 20, b"\x00" * 8, 17)
+    with pytest.raises(SigningScriptError):
+        pgp.make_signature_trailer(key, "sha512", 0)
+
+
+# make_detached_signature {{{1
+def _sign(rsa_key, path, key):
+    trailer = pgp.make_signature_trailer(key, "sha512", 1600000000)
+    with open(path, "rb") as fh:
+        digest = hashlib.sha512(fh.read() + trailer).digest()
+    signature = rsa_key.sign(digest, padding.PKCS1v15(), Prehashed(hashes.SHA512()))
+    return pgp.make_detached_signature(key, trailer, digest, signature), signature
+
+
+def test_make_detached_signature(tmpdir, rsa_key, pubkey_path):
+    key = pgp.load_public_key(pubkey_path)
+    path = os.path.join(tmpdir, "target.bin")
+    with open(path, "wb") as fh:
+        fh.write(b"some installer")
+    armored, signature = _sign(rsa_key, path, key)
+    packet = pgp.dearmor(armored)
+    tag, body = pgp._read_packet(packet)
+    assert tag == 2
+    # v4, binary document, RSA, SHA512
+    assert body[:4] == b"\x04\x00\x01\x0a"
+    assert key.fingerprint in body
+    assert body.endswith(signature.lstrip(b"\x00"))
+
+
+@pytest.mark.skipif(not shutil.which("gpg"), reason="gpg isn't installed")
+def test_make_detached_signature_gpg_verify(tmpdir, rsa_key, pubkey_path):
+    key = pgp.load_public_key(pubkey_path)
+    path = os.path.join(tmpdir, "target.bin")
+    with open(path, "wb") as fh:
+        fh.write(os.urandom(100000))
+    armored, _ = _sign(rsa_key, path, key)
+    with open(f"{path}.asc", "w") as fh:
+        fh.write(armored)
+    gnupghome = os.path.join(tmpdir, "gnupg")
+    os.mkdir(gnupghome, 0o700)
+    gpg = ["gpg", "--homedir", gnupghome, "--batch"]
+    subprocess.run(gpg + ["--import", pubkey_path], check=True)
+    result = subprocess.run(
+        gpg + ["--verify", f"{path}.asc", path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    output = result.stdout.decode()
+    assert result.returncode == 0, output
+    assert "Good signature" in output
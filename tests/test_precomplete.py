@@ -0,0 +1,109 @@
+import difflib
+import os
+
+import pytest
+
+from signingscript.createprecomplete import generate_precomplete
+from signingscript.exceptions import SigningScriptError
+import signingscript.precomplete as precomplete
+
+MEMBERS = (
+    "firefox/",
+    "firefox/firefox",
+    "firefox/libxul.so",
+    "firefox/defaults/pref/channel-prefs.js",
+    "firefox/update-settings.ini",
+    "firefox/distribution/extensions/foo.xpi",
+    "firefox/browser/",
+    "firefox/browser/features/",
+    "firefox/browser/omni.ja",
+    "firefox/empty dir/",
+    "firefox/foo",
+    "firefox/foo bar",
+    "firefox/foo!",
+)
+
+
+def _generate(tmpdir, members, name):
+    """Extract `members` to `tmpdir`, and run createprecomplete on them."""
+    for member in members + (name,):
+        path = os.path.join(tmpdir, member)
+        if member.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "w").close()
+    generate_precomplete(os.path.dirname(os.path.join(tmpdir, name)))
+    with open(os.path.join(tmpdir, name)) as fh:
+        return fh.readlines()
+
+
+# find_precomplete {{{1
+@pytest.mark.parametrize(
+    "members,raises",
+    (
+        (["a/precomplete", "a/b"], False),
+        (["a/b", "precomplete/"], False),
+        (["a/b"], True),
+        (["a/precomplete", "b/precomplete"], True),
+    ),
+)
+def test_find_precomplete(members, raises):
+    if raises:
+        with pytest.raises(SigningScriptError):
+            precomplete.find_precomplete(members)
+    else:
+        assert precomplete.find_precomplete(members).rstrip("/").endswith("precomplete")
+
+
+# Precomplete {{{1
+@pytest.mark.parametrize(
+    "prefix,name",
+    (
+        ("firefox/", "firefox/precomplete"),
+        ("./firefox/", "./firefox/precomplete"),
+        ("", "precomplete"),
+        ("Firefox.app/Contents/", "Firefox.app/Contents/Resources/precomplete"),
+    ),
+)
+def test_precomplete_matches_createprecomplete(tmpdir, prefix, name):
+    members = tuple(
+        prefix + m.replace("firefox/", "", 1) for m in MEMBERS if m != "firefox/"
+    )
+    expected = _generate(tmpdir, members, name)
+    assert precomplete.Precomplete(name, members + (name,)).lines() == expected
+
+
+def test_precomplete_add(tmpdir):
+    name = "firefox/precomplete"
+    sigs = ("firefox/firefox.sig", "firefox/new/libclearkey.so.sig")
+    expected = _generate(tmpdir, MEMBERS + sigs, name)
+    result = precomplete.Precomplete(name, MEMBERS + (name,))
+    # Members outside the precomplete directory are ignored
+    result.add("other/file")
+    for sig in sigs:
+        result.add(sig)
+    assert result.lines() == expected
+
+
+# diff {{{1
+def test_diff():
+    before = precomplete.Precomplete("precomplete", MEMBERS + ("gone",)).lines()
+    after = precomplete.Precomplete(
+        "precomplete", MEMBERS + ("firefox/firefox.sig", "firefox/foo.sig")
+    ).lines()
+    result = list(precomplete.diff(before, after))
+    assert result == [
+        line for line in difflib.ndiff(before, after) if not line.startswith("?")
+    ]
+    assert [line[0] for line in result].count("+") == 2
+    assert [line[0] for line in result].count("-") == 1
+
+
+@pytest.mark.parametrize(
+    "before",
+    (['remove "a"\n', 'remove "b"\n'], ["unknown\n"], ['rmdir "a/"\n', 'remove "a"\n']),
+)
+def test_diff_unsorted(before):
+    after = ['remove "b"\n']
+    assert list(precomplete.diff(before, after)) == list(difflib.ndiff(before, after))
@@ -0,0 +1,165 @@
+import os
+import shutil
+import zipfile
+
+import pytest
+from scriptworker.exceptions import TaskVerificationError
+
+import signingscript.preflight as preflight
+from conftest import TEST_DATA_DIR
+from signingscript.utils import SigningServer
+
+
+# helper constants, fixtures, functions {{{1
+AUTOGRAPH_FORMATS = [
+    "autograph_langpack",
+    "autograph_widevine",
+    "autograph_omnija",
+    "autograph_hash_only_mar384",
+    "autograph_authenticode",
+    "autograph_authenticode_stub",
+]
+
+
+@pytest.fixture
+def signing_context(context, tmpdir):
+    context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    context.signing_servers = {
+        "project:releng:signing:cert:dep-signing": [
+            SigningServer(
+                "https://autograph", "user", "pass", AUTOGRAPH_FORMATS, "autograph"
+            ),
+            SigningServer("server", "user", "pass", ["sha2signcode"], "signing_server"),
+        ]
+    }
+    cert = os.path.join(tmpdir, "authenticode.crt")
+    with open(cert, "w") as fh:
+        fh.write("cert")
+    context.config["authenticode_cert"] = cert
+    return context
+
+
+def _zip(tmpdir, name, members):
+    path = os.path.join(tmpdir, name)
+    with zipfile.ZipFile(path, "w") as z:
+        for member, data in members.items():
+            z.writestr(member, data)
+    return path
+
+
+# check_path {{{1
+def test_check_path(signing_context, tmpdir):
+    windows_zip = _zip(tmpdir, "target.zip", {"firefox/firefox.exe": b"0"})
+    langpack = os.path.join(TEST_DATA_DIR, "en-CA.xpi")
+    for path, full_path, formats in (
+        (
+            "target.zip",
+            windows_zip,
+            ["sha2signcode", "autograph_authenticode", "autograph_widevine"],
+        ),
+        ("target.xpi", langpack, ["autograph_langpack"]),
+        ("target.mar", "target.mar", ["autograph_hash_only_mar384"]),
+        ("target.mar", "target.mar", ["autograph_hash_only_mar384:dep2"]),
+        ("target.exe", "target.exe", ["sha2signcode"]),
+        # The later formats see the tarball the dmg is converted to
+        ("target.dmg", "target.dmg", ["autograph_widevine", "autograph_omnija"]),
+        ("target.bin", "target.bin", ["gpg", "f1"]),
+    ):
+        assert preflight.check_path(signing_context, path, full_path, formats) == []
+
+
+@pytest.mark.parametrize(
+    "path,members,formats,message",
+    (
+        (
+            "target.xpi",
+            {"manifest.json": b'{"languages": {}}'},
+            ["autograph_langpack"],
+            "is not a valid langpack",
+        ),
+        ("target.xpi", {}, ["autograph_langpack"], "Can't read the langpack manifest"),
+        ("target.zip", {}, ["autograph_langpack"], "Expected a .xpi"),
+        ("target.exe", None, ["autograph_widevine"], "Unknown widevine file format"),
+        ("target.exe", None, ["autograph_omnija"], "Unknown omnija file format"),
+        (
+            "target.zip",
+            {"firefox/omni.ja": b"0"},
+            ["sha2signcode"],
+            "Did not find any files to sign",
+        ),
+        ("target.zip", None, ["sha2signcode"], "Can't read the zip index"),
+        (
+            "target.dmg",
+            None,
+            ["autograph_widevine", "sha2signcode"],
+            "Did not find any files to sign",
+        ),
+        (
+            "target.mar",
+            None,
+            ["autograph_hash_only_mar384:missing"],
+            "Can't find mar verify key",
+        ),
+        ("target.apk", None, ["autograph_apk_foo"], "No signing servers found"),
+        (
+            "target.exe",
+            None,
+            ["autograph_authenticode_stub"],
+            "authenticode_cross_cert is not defined",
+        ),
+    ),
+)
+def test_check_path_problems(signing_context, tmpdir, path, members, formats, message):
+    full_path = os.path.join(tmpdir, path)
+    if members is not None:
+        full_path = _zip(tmpdir, path, members)
+    problems = preflight.check_path(signing_context, path, full_path, formats)
+    assert len(problems) == 1
+    assert problems[0].startswith(path)
+    assert message in problems[0]
+
+
+def test_check_path_missing_cert(signing_context):
+    signing_context.config["authenticode_cert"] = "missing.crt"
+    problems = preflight.check_path(
+        signing_context, "target.exe", "target.exe", ["autograph_authenticode"]
+    )
+    assert problems == [
+        "target.exe (autograph_authenticode): authenticode_cert (missing.crt) doesn't exist!"
+    ]
+
+
+def test_check_path_xpi_hash_signing(signing_context):
+    signing_context.config["xpi_hash_signing"] = True
+    signing_context.config["xpi_cose_formats"] = ["autograph_omnija"]
+    problems = preflight.check_path(
+        signing_context, "target.zip", None, ["autograph_omnija", "autograph_langpack"]
+    )
+    assert len(problems) == 2
+    assert "can't make the COSE signatures autograph_omnija" in problems[0]
+    assert "Expected a .xpi" in problems[1]
+
+
+# preflight {{{1
+@pytest.mark.asyncio
+async def test_preflight(signing_context, tmpdir):
+    langpack = os.path.join(tmpdir, "good.xpi")
+    shutil.copyfile(os.path.join(TEST_DATA_DIR, "en-CA.xpi"), langpack)
+    filelist_dict = {
+        "good.xpi": {"full_path": langpack, "formats": ["autograph_langpack"]},
+        "bad.xpi": {
+            "full_path": _zip(tmpdir, "bad.xpi", {}),
+            "formats": ["autograph_langpack"],
+        },
+        "bad.exe": {"full_path": "bad.exe", "formats": ["autograph_widevine"]},
+    }
+    with pytest.raises(TaskVerificationError) as excinfo:
+        await preflight.preflight(signing_context, filelist_dict)
+    # Every problem is reported
+    message = str(excinfo.value)
+    assert "bad.xpi" in message
+    assert "bad.exe" in message
+    assert "good.xpi" not in message
+
+    del filelist_dict["bad.xpi"], filelist_dict["bad.exe"]
+    await preflight.preflight(signing_context, filelist_dict)
@@ -1,20 +1,30 @@
+import json
 import mock
 import os
 import pytest
+import subprocess
+import sys
+import time
 
 import scriptworker.client
 from scriptworker.context import Context
-from conftest import (
-    noop_async,
-    noop_sync,
-    BASE_DIR,
-)
+from conftest import noop_async, noop_sync, BASE_DIR
+from signingscript.exceptions import SigningServerError
 import signingscript.script as script
 from unittest.mock import MagicMock
 
 # helper constants, fixtures, functions {{{1
 EXAMPLE_CONFIG = os.path.join(BASE_DIR, "config_example.json")
 SSL_CERT = os.path.join(BASE_DIR, "src", "signingscript", "data", "host.cert")
+# Format backends, which should only be imported when a task needs them
+LAZY_BACKENDS = (
+    "mardor",
+    "winsign",
+    "requests_hawk",
+    "widevine",
+    "signtool",
+    "mozpack",
+)
 
 
 # async_main {{{1
@@ -28,7 +38,8 @@ async def async_main_helper(
         return [val]
 
     mocker.patch.object(script, "load_signing_server_config", new=noop_sync)
-    mocker.patch.object(script, "task_cert_type", new=noop_sync)
+    mocker.patch.object(script, "build_signing_plan")
+    mocker.patch.object(script, "preflight", new=noop_async)
     mocker.patch.object(script, "task_signing_formats", return_value=formats)
     mocker.patch.object(script, "get_token", new=noop_async)
     mocker.patch.object(script, "build_filelist_dict", new=fake_filelist_dict)
@@ -88,6 +99,86 @@ async def test_async_main_autograph(tmpdir, mocker):
     await async_main_helper(tmpdir, mocker, formats, {}, "autograph")
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "formats,token", ((["autograph_mar"], False), (["autograph_mar", "gpg"], True))
+)
+async def test_set_up(tmpdir, mocker, formats, token):
+    started = []
+    gate = script.asyncio.Event()
+
+    async def fake_get_token(*args):
+        started.append("token")
+        await gate.wait()
+
+    async def fake_warm(servers):
+        started.append(sorted(s.server for s in servers))
+        await gate.wait()
+
+    def fake_copy_to_dir(source, parent_dir, target=None):
+        started.append(target)
+
+    mocker.patch.object(script, "get_token", new=fake_get_token)
+    mocker.patch.object(script, "warm_autograph_connections", new=fake_warm)
+    mocker.patch.object(script, "copy_to_dir", new=fake_copy_to_dir)
+    context = mock.MagicMock()
+    context.config = {"work_dir": tmpdir}
+    server = mock.MagicMock(server="https://autograph")
+    context.signing_plan.servers = {"autograph_mar": (server,)}
+    filelist_dict = {
+        "path1": {"full_path": "full_path1"},
+        "path2": {"full_path": "full_path2"},
+    }
+    set_up = script.asyncio.ensure_future(
+        script._set_up(context, filelist_dict, formats)
+    )
+    # Everything starts before anything finishes
+    for _ in range(10):
+        await script.asyncio.sleep(0.01)
+        if len(started) == 3 + token:
+            break
+    assert not set_up.done()
+    gate.set()
+    await set_up
+    assert sorted(map(str, started)) == sorted(
+        ["['https://autograph']", "path1", "path2"] + (["token"] if token else [])
+    )
+
+
+@pytest.mark.asyncio
+async def test_set_up_failure(tmpdir, mocker):
+    cancelled = []
+
+    async def fake_warm(servers):
+        try:
+            await script.asyncio.sleep(10)
+        except script.asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    copied = []
+
+    def fake_copy_to_dir(source, parent_dir, target=None):
+        if target == "path1":
+            raise SigningServerError("Can't copy")
+        time.sleep(0.1)
+        copied.append(target)
+
+    mocker.patch.object(script, "warm_autograph_connections", new=fake_warm)
+    mocker.patch.object(script, "copy_to_dir", new=fake_copy_to_dir)
+    context = mock.MagicMock()
+    context.config = {"work_dir": tmpdir}
+    filelist_dict = {
+        "path1": {"full_path": "full_path1"},
+        "path2": {"full_path": "full_path2"},
+    }
+    with pytest.raises(SigningServerError):
+        await script._set_up(context, filelist_dict, ["autograph_mar"])
+    assert cancelled == [True]
+    # The other copy had started, so it's finished rather than left running
+    assert copied == ["path2"]
+
+
 @pytest.mark.asyncio
 async def test_craft_aiohttp_connector():
     context = Context()
@@ -115,6 +206,24 @@ def test_main(monkeypatch):
     )
 
 
+def test_main_daemon(monkeypatch):
+    sync_main_mock = MagicMock()
+    monkeypatch.setattr(scriptworker.client, "sync_main", sync_main_mock)
+    monkeypatch.setattr(sys, "argv", ["signingscript", "config.json"])
+    monkeypatch.setattr(script.daemon, "run_task", MagicMock(return_value=3))
+    with pytest.raises(SystemExit) as exc:
+        script.main()
+    assert exc.value.code == 3
+    script.daemon.run_task.assert_called_once_with("config.json")
+    sync_main_mock.assert_not_called()
+
+    script.daemon.run_task.return_value = None
+    script.main()
+    sync_main_mock.assert_called_once_with(
+        script.async_main, default_config=script.get_default_config()
+    )
+
+
 @pytest.mark.asyncio
 async def test_async_main_widevine_no_cert_defined(tmpdir, mocker):
     formats = ["autograph_widevine"]
@@ -131,3 +240,48 @@ async def test_async_main_widevine(tmp_path, mocker):
     tmp_cert = tmp_path / "widevine.crt"
     formats = ["autograph_widevine"]
     await async_main_helper(tmp_path, mocker, formats, {"widevine_cert": tmp_cert})
+
+
+# async_explain {{{1
+@pytest.mark.asyncio
+async def test_async_explain(mocker, capsys):
+    report = {
+        "paths": {
+            "path1": {
+                "formats": ["gpg"],
+                "remote_calls": 1,
+                "autograph_upload_bytes": 0,
+                "repack_bytes": 0,
+            }
+        },
+        "total": {},
+    }
+    mocker.patch.object(script, "explain_task", return_value=report)
+    await script.async_explain(mock.MagicMock())
+    assert '"remote_calls": 1' in capsys.readouterr().out
+
+
+def test_explain_main(monkeypatch):
+    sync_main_mock = MagicMock()
+    monkeypatch.setattr(scriptworker.client, "sync_main", sync_main_mock)
+    script.explain_main()
+    sync_main_mock.assert_called_once_with(
+        script.async_explain, default_config=script.get_default_config()
+    )
+
+
+# lazy imports {{{1
+def test_lazy_imports():
+    code = (
+        "import json, sys, signingscript.script; print(json.dumps(list(sys.modules)))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    modules = json.loads(output)
+    assert "signingscript.script" in modules
+    for name in modules:
+        assert name.split(".")[0] not in LAZY_BACKENDS
@@ -1,20 +1,25 @@
 import asyncio
 import base64
 from contextlib import contextmanager
-from hashlib import sha256
+import hashlib
+from hashlib import sha1, sha256
 import os
 import os.path
 import pytest
 import shutil
 import subprocess
 import tarfile
+import threading
+import time
 import zipfile
 
 import winsign.sign
 
 from scriptworker.utils import makedirs
 
-from signingscript.exceptions import SigningScriptError
+from signingscript.createprecomplete import generate_precomplete
+from signingscript.exceptions import SigningScriptError, SigningServerError
+from signingscript.jar import JarReader
 from signingscript.utils import get_hash, SigningServer
 import signingscript.sign as sign
 import signingscript.utils as utils
@@ -183,11 +188,120 @@ def test_build_signtool_cmd(context, signtool, from_, to, fmt):
 @pytest.mark.parametrize("to,expected", ((None, "from"), ("to", "to")))
 async def test_sign_file_cert_signing_server(context, mocker, to, expected):
     context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    context.config["signtool_in_process"] = False
     mocker.patch.object(sign, "build_signtool_cmd", new=noop_sync)
     mocker.patch.object(utils, "execute_subprocess", new=noop_async)
     assert await sign.sign_file(context, "from", "blah", to=to) == expected
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("to,expected", ((None, "from"), ("to", "to")))
+async def test_sign_file_cert_signing_server_in_process(context, mocker, to, expected):
+    context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    mocker.patch.object(sign, "build_signtool_cmd", new=die)
+    mocker.patch.object(sign, "sign_file_with_signtool", new=noop_async)
+    assert await sign.sign_file(context, "from", "blah", to=to) == expected
+
+
+# sign_file_with_signtool {{{1
+def _write_signtool_token(context):
+    with open(os.path.join(context.config["work_dir"], "token"), "wb") as fh:
+        fh.write(b"token")
+
+
+@pytest.mark.asyncio
+async def test_sign_file_with_signtool(context, mocker, tmpdir):
+    context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    _write_signtool_token(context)
+    from_ = os.path.join(tmpdir, "from")
+    to = os.path.join(tmpdir, "to")
+    with open(from_, "wb") as fh:
+        fh.write(b"unsigned")
+    signed_hash = sha1(b"signed").hexdigest()
+
+    pending = mocker.MagicMock()
+    pending.raise_for_status.side_effect = sign.requests.HTTPError
+    pending.headers = {}
+    done = mocker.MagicMock()
+    done.headers = {"X-SHA1-Digest": signed_hash}
+    done.iter_content.return_value = [b"signed"]
+    uploaded = mocker.MagicMock()
+    uploaded.headers = {"X-Nonce": "nonce2"}
+    session = mocker.MagicMock()
+    session.get.side_effect = [pending, done]
+    session.post.return_value = uploaded
+    context.signtool_session = session
+    mocker.patch.object(sign, "_SIGNTOOL_ERROR_SLEEP", new=0)
+
+    assert await sign.sign_file_with_signtool(context, from_, "gpg", to=to) == to
+    with open(to, "rb") as fh:
+        assert fh.read() == b"signed"
+    with open(os.path.join(context.config["work_dir"], "nonce"), "rb") as fh:
+        assert fh.read() == b"nonce2"
+    assert session.get.call_args[0][0] == "https://127.0.0.1:9110/sign/gpg/{}".format(
+        sha1(b"unsigned").hexdigest()
+    )
+    assert session.post.call_args[1]["data"]["token"] == b"token"
+
+
+@pytest.mark.asyncio
+async def test_sign_file_with_signtool_gives_up(context, mocker, tmpdir):
+    context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    _write_signtool_token(context)
+    from_ = os.path.join(tmpdir, "from")
+    with open(from_, "wb") as fh:
+        fh.write(b"unsigned")
+    session = mocker.MagicMock()
+    session.get.side_effect = sign.requests.ConnectionError
+    context.signtool_session = session
+    mocker.patch.object(sign, "_SIGNTOOL_ERROR_SLEEP", new=0)
+
+    with pytest.raises(SigningServerError):
+        await sign.sign_file_with_signtool(context, from_, "gpg")
+    assert session.get.call_count == sign._SIGNTOOL_MAX_ERRORS
+
+
+@pytest.mark.asyncio
+async def test_sign_file_with_signtool_cancelled(context, mocker, tmpdir):
+    context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    _write_signtool_token(context)
+    from_ = os.path.join(tmpdir, "from")
+    with open(from_, "wb") as fh:
+        fh.write(b"unsigned")
+    session = mocker.MagicMock()
+    session.get.side_effect = sign.requests.ConnectionError
+    context.signtool_session = session
+    mocker.patch.object(sign, "_SIGNTOOL_ERROR_SLEEP", new=30)
+    aborts = []
+    remote_signfile = sign._signtool_remote_signfile
+
+    def fake_remote_signfile(*args, abort):
+        aborts.append(abort)
+        return remote_signfile(*args, abort=abort)
+
+    mocker.patch.object(sign, "_signtool_remote_signfile", new=fake_remote_signfile)
+
+    signing = asyncio.ensure_future(sign.sign_file_with_signtool(context, from_, "gpg"))
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if session.get.called:
+            break
+    signing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await signing
+    assert aborts[0].is_set()
+    # The thread stops waiting to retry, and doesn't try again
+    await asyncio.sleep(0.05)
+    assert session.get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_sign_file_with_signtool_no_servers(context):
+    context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    with pytest.raises(SigningScriptError):
+        await sign.sign_file_with_signtool(context, "from", "invalid")
+
+
 # sign_file {{{1
 @pytest.mark.asyncio
 @pytest.mark.parametrize("to,expected", ((None, "from"), ("to", "to")))
@@ -206,7 +320,13 @@ async def test_sign_file_autograph(context, mocker, to, expected):
             )
         ]
     }
-    mocker.patch.object(sign, "sign_file_with_autograph", new=noop_async)
+
+    async def fake_sign_file_with_autograph(context, from_, fmt, to=None):
+        return to or from_
+
+    mocker.patch.object(
+        sign, "sign_file_with_autograph", new=fake_sign_file_with_autograph
+    )
 
     assert await sign.sign_file(context, "from", "autograph_mar", to=to) == expected
 
@@ -260,7 +380,10 @@ async def test_sign_file_with_autograph(context, mocker, to, expected, format, o
     if options:
         kwargs["options"] = options
     session_mock.post.assert_called_with(
-        "https://autograph-hsm.dev.mozaws.net/sign/file", auth=mocker.ANY, json=[kwargs]
+        "https://autograph-hsm.dev.mozaws.net/sign/file",
+        auth=mocker.ANY,
+        json=[kwargs],
+        timeout=(10, 300),
     )
 
 
@@ -446,6 +569,7 @@ async def test_sign_mar384_with_autograph_hash(context, mocker, to, expected):
         "https://autograph-hsm.dev.mozaws.net/sign/hash",
         auth=mocker.ANY,
         json=[{"input": "YjY0bWFyaGFzaA=="}],
+        timeout=(10, 300),
     )
 
 
@@ -567,6 +691,7 @@ async def test_sign_mar384_with_autograph_hash_returns_invalid_signature_length(
         "https://autograph-hsm.dev.mozaws.net/sign/hash",
         auth=mocker.ANY,
         json=[{"input": "YjY0bWFyaGFzaA=="}],
+        timeout=(10, 300),
     )
 
 
@@ -591,6 +716,107 @@ async def test_sign_jar(context, mocker):
     assert len(counter) == 1
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "fmt,apk_hash_signing,expected",
+    (
+        ("autograph_apk_fennec_sha1", True, "sign_apk_v1_with_autograph"),
+        ("autograph_apk_fennec_sha1", False, "sign_file"),
+        ("jar", True, "sign_file"),
+    ),
+)
+async def test_sign_jar_apk_hash_signing(
+    context, mocker, fmt, apk_hash_signing, expected
+):
+    context.config["apk_hash_signing"] = apk_hash_signing
+    called = []
+
+    def fake_signer(name):
+        async def signer(context, from_, fmt):
+            called.append(name)
+
+        return signer
+
+    mocker.patch.object(sign, "sign_file", new=fake_signer("sign_file"))
+    mocker.patch.object(
+        sign,
+        "sign_apk_v1_with_autograph",
+        new=fake_signer("sign_apk_v1_with_autograph"),
+    )
+    mocker.patch.object(sign, "zip_align_apk", new=noop_async)
+    assert await sign.sign_jar(context, "from", fmt) == "from"
+    assert called == [expected]
+
+
+# sign_apk_v1_with_autograph {{{1
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "fmt,hash_type,digest_name",
+    (("autograph_apk", sha256, "SHA-256"), ("autograph_apk_fennec_sha1", sha1, "SHA1")),
+)
+async def test_sign_apk_v1_with_autograph(
+    tmpdir, mocker, context, fmt, hash_type, digest_name
+):
+    _autograph_context(context, fmt)
+    long_name = "res/{}.xml".format("x" * 100)
+    apk = os.path.join(tmpdir, "app.apk")
+    with zipfile.ZipFile(apk, "w") as z:
+        z.writestr("AndroidManifest.xml", b"manifest", zipfile.ZIP_STORED)
+        z.writestr(long_name, b"resource" * 100, zipfile.ZIP_DEFLATED)
+        z.writestr("META-INF/CERT.SF", b"old signature")
+
+    sigfiles = []
+
+    async def mocked_sign_with_autograph(s, input_bytes, fmt, method, **kwargs):
+        assert method == "data"
+        sigfiles.append(input_bytes)
+        return base64.b64encode(b"pkcs7")
+
+    mocker.patch.object(sign, "sign_with_autograph", mocked_sign_with_autograph)
+    assert await sign.sign_apk_v1_with_autograph(context, apk, fmt) == apk
+
+    def b64digest(data):
+        return base64.b64encode(hash_type(data).digest()).decode()
+
+    with zipfile.ZipFile(apk) as z:
+        assert z.namelist() == [
+            "META-INF/MANIFEST.MF",
+            "META-INF/SIGNATURE.SF",
+            "META-INF/SIGNATURE.RSA",
+            "AndroidManifest.xml",
+            long_name,
+        ]
+        assert z.getinfo("AndroidManifest.xml").compress_type == zipfile.ZIP_STORED
+        assert z.getinfo(long_name).compress_type == zipfile.ZIP_DEFLATED
+        assert z.read(long_name) == b"resource" * 100
+        assert z.read("META-INF/SIGNATURE.RSA") == b"pkcs7"
+        manifest = z.read("META-INF/MANIFEST.MF").decode()
+        sigfile = z.read("META-INF/SIGNATURE.SF").decode()
+    assert sigfiles == [sigfile.encode()]
+
+    sections = manifest.split("\r\n\r\n")
+    assert sections[0] == "Manifest-Version: 1.0\r\nCreated-By: signingscript"
+    assert sections[1] == "Name: AndroidManifest.xml\r\n{}-Digest: {}".format(
+        digest_name, b64digest(b"manifest")
+    )
+    name_lines, digest_line = sections[2].rsplit("\r\n", 1)
+    assert all(len(line) <= 70 for line in name_lines.split("\r\n"))
+    assert name_lines.replace("\r\n ", "") == "Name: " + long_name
+    assert digest_line == "{}-Digest: {}".format(
+        digest_name, b64digest(b"resource" * 100)
+    )
+    assert (
+        "{}-Digest-Manifest: {}\r\n".format(digest_name, b64digest(manifest.encode()))
+        in sigfile
+    )
+    assert (
+        "Name: AndroidManifest.xml\r\n{}-Digest: {}\r\n\r\n".format(
+            digest_name, b64digest((sections[1] + "\r\n\r\n").encode())
+        )
+        in sigfile
+    )
+
+
 # sign_macapp {{{1
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
@@ -703,7 +929,7 @@ async def test_sign_widevine(
 
     async def fake_untar(_, f, comp, **kwargs):
         assert f.endswith(".tar.{}".format(comp.lstrip(".")))
-        return files
+        return sign.Workspace(kwargs["tmp_dir"], files)
 
     async def fake_undmg(_, f):
         assert f.endswith(".dmg")
@@ -729,7 +955,6 @@ async def test_sign_widevine(
     mocker.patch.object(sign, "sign_file", new=noop_async)
     mocker.patch.object(sign, "sign_widevine_with_autograph", new=noop_async)
     mocker.patch.object(sign, "makedirs", new=noop_sync)
-    mocker.patch.object(sign, "generate_precomplete", new=noop_sync)
     mocker.patch.object(sign, "_create_tarfile", new=noop_async)
     mocker.patch.object(sign, "_create_zipfile", new=noop_async)
     mocker.patch.object(sign, "_run_generate_precomplete", new=noop_sync)
@@ -742,6 +967,55 @@ async def test_sign_widevine(
         await sign.sign_widevine(context, filename, fmt)
 
 
+@pytest.mark.asyncio
+async def test_sign_widevine_zip_selective(context, mocker, tmpdir):
+    orig = os.path.join(tmpdir, "target.zip")
+    with zipfile.ZipFile(orig, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr("firefox/", b"")
+        z.writestr("firefox/firefox", b"firefox")
+        z.writestr("firefox/plugin-container", b"plugin-container")
+        z.writestr("firefox/omni.ja", b"omni" * 1000)
+        z.writestr(
+            "firefox/precomplete",
+            'remove "plugin-container"\nremove "omni.ja"\nremove "firefox"\n',
+        )
+    extracted = []
+
+    async def fake_sign(_, from_, fmt, to=None):
+        extracted.extend(os.listdir(os.path.dirname(from_)))
+        with open(to, "w") as fh:
+            fh.write(fmt)
+
+    mocker.patch.object(sign, "sign_file", new=fake_sign)
+    await sign.sign_widevine_zip(context, orig, "widevine")
+    # Only the files to sign and precomplete are extracted
+    assert "precomplete" in extracted
+    assert "omni.ja" not in extracted
+    with zipfile.ZipFile(orig) as z:
+        assert z.namelist() == [
+            "firefox/",
+            "firefox/firefox",
+            "firefox/plugin-container",
+            "firefox/omni.ja",
+            "firefox/precomplete",
+            "firefox/firefox.sig",
+            "firefox/plugin-container.sig",
+        ]
+        assert z.read("firefox/omni.ja") == b"omni" * 1000
+        assert z.read("firefox/plugin-container.sig") == b"widevine_blessed"
+        assert z.read("firefox/precomplete").decode() == "".join(
+            'remove "{}"\n'.format(name)
+            for name in (
+                "precomplete",
+                "plugin-container.sig",
+                "plugin-container",
+                "omni.ja",
+                "firefox.sig",
+                "firefox",
+            )
+        )
+
+
 # _should_sign_windows {{{1
 @pytest.mark.parametrize(
     "filenames,expected",
@@ -797,19 +1071,26 @@ def test_get_widevine_signing_files(filenames, expected):
 
 # _run_generate_precomplete {{{1
 @pytest.mark.parametrize("num_precomplete,raises", ((1, False), (0, True), (2, True)))
-def test_run_generate_precomplete(context, num_precomplete, raises, mocker):
-    mocker.patch.object(sign, "generate_precomplete", new=noop_sync)
+def test_run_generate_precomplete(context, num_precomplete, raises):
     work_dir = context.config["work_dir"]
+    members = ["foo/", "foo/bar", "foo/bar.sig"]
     for i in range(0, num_precomplete):
         path = os.path.join(work_dir, "foo", str(i))
         makedirs(path)
         with open(os.path.join(path, "precomplete"), "w") as fh:
-            fh.write("blah")
+            fh.write('remove "precomplete"\nremove "bar"\n')
+        members.append("foo/{}/precomplete".format(i))
     if raises:
         with pytest.raises(SigningScriptError):
-            sign._run_generate_precomplete(context, work_dir)
+            sign._run_generate_precomplete(context, work_dir, members)
     else:
-        sign._run_generate_precomplete(context, work_dir)
+        sign._run_generate_precomplete(context, work_dir, members)
+        with open(os.path.join(work_dir, "foo", "0", "precomplete")) as fh:
+            assert fh.read() == 'remove "precomplete"\n'
+        with open(
+            os.path.join(context.config["artifact_dir"], "public/logs/precomplete.diff")
+        ) as fh:
+            assert fh.read() == '  remove "precomplete"\n- remove "bar"\n'
 
 
 # remove_extra_files {{{1
@@ -817,10 +1098,11 @@ def test_remove_extra_files(context):
     extra = ["a", "b/c"]
     good = ["d", "e/f"]
     work_dir = context.config["work_dir"]
-    all_files = []
+    all_files = sign.Workspace(work_dir)
     for f in extra + good:
         path = os.path.join(work_dir, f)
         makedirs(os.path.dirname(path))
+        sign.workspace.record(path)
         with open(path, "w") as fh:
             fh.write("x")
         if f in good:
@@ -919,11 +1201,110 @@ async def test_working_zipfile(context):
         assert os.path.exists(f)
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", (1, 3))
+async def test_extract_zipfile_all(context, tmpdir, workers):
+    context.config["compress_workers"] = workers
+    path = os.path.join(TEST_DATA_DIR, "test.zip")
+    files = await sign._extract_zipfile(context, path, tmp_dir=tmpdir)
+    with zipfile.ZipFile(path) as z:
+        assert files == [os.path.join(tmpdir, name) for name in z.namelist()]
+        for name in z.namelist():
+            if name.endswith("/"):
+                assert os.path.isdir(os.path.join(tmpdir, name))
+            else:
+                with open(os.path.join(tmpdir, name), "rb") as fh:
+                    assert fh.read() == z.read(name)
+
+
+@pytest.mark.asyncio
+async def test_extract_zipfile_predicate(context, tmpdir):
+    path = os.path.join(TEST_DATA_DIR, "test.zip")
+    files = await sign._extract_zipfile(
+        context, path, tmp_dir=tmpdir, predicate=lambda name: name.startswith("c/e")
+    )
+    assert files == [os.path.join(tmpdir, "c/e/"), os.path.join(tmpdir, "c/e/f")]
+    assert sorted(os.listdir(tmpdir)) == ["c"]
+    assert os.listdir(os.path.join(tmpdir, "c")) == ["e"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("zip64", (False, True))
+async def test_create_zipfile_orig(context, tmpdir, mocker, zip64):
+    if zip64:
+        # Too many entries for StreamingJarWriter, which can't write zip64
+        mocker.patch.object(zipfile, "ZIP_FILECOUNT_LIMIT", 2)
+        mocker.patch.object(sign, "StreamingJarWriter", new=context_die)
+    orig = os.path.join(tmpdir, "orig.zip")
+    shutil.copyfile(os.path.join(TEST_DATA_DIR, "test.zip"), orig)
+    with zipfile.ZipFile(orig) as z:
+        orig_infos = z.infolist()
+        orig_data = {i.filename: z.read(i) for i in orig_infos}
+    tmp_dir = os.path.join(tmpdir, "unzipped")
+    files = await sign._extract_zipfile(
+        context, orig, tmp_dir=tmp_dir, predicate=lambda name: name == "c/d"
+    )
+    with open(files[0], "wb") as fh:
+        fh.write(b"signed")
+    new = os.path.join(tmp_dir, "c", "d.sig")
+    with open(new, "wb") as fh:
+        fh.write(b"sig")
+    await sign._create_zipfile(context, orig, files + [new], tmp_dir=tmp_dir, orig=orig)
+    orig_data["c/d"] = b"signed"
+    orig_data["c/d.sig"] = b"sig"
+    with zipfile.ZipFile(orig) as z:
+        infos = z.infolist()
+        assert [i.filename for i in infos] == [i.filename for i in orig_infos] + [
+            "c/d.sig"
+        ]
+        for info, orig_info in zip(infos, orig_infos):
+            assert info.date_time == orig_info.date_time
+            assert info.compress_type == orig_info.compress_type
+        assert {i.filename: z.read(i) for i in infos} == orig_data
+
+
 @pytest.mark.asyncio
 async def test_bad_create_zipfile(context, mocker):
     mocker.patch.object(zipfile, "ZipFile", new=context_die)
+    mocker.patch.object(sign, "StreamingJarWriter", new=context_die)
     with pytest.raises(SigningScriptError):
         await sign._create_zipfile(context, "foo.zip", [])
+    with pytest.raises(SigningScriptError):
+        await sign._create_zipfile(context, "foo.zip", [], mode="a")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers,zip64", ((1, False), (4, False), (1, True)))
+async def test_create_zipfile_matches_zipfile(context, tmpdir, mocker, workers, zip64):
+    context.config["compress_workers"] = workers
+    if zip64:
+        # Too large for StreamingJarWriter, which can't write zip64
+        mocker.patch.object(zipfile, "ZIP64_LIMIT", 1000)
+        mocker.patch.object(sign, "StreamingJarWriter", new=context_die)
+    top_dir = os.path.join(tmpdir, "top")
+    files = ["a", "b/c", "b/d/e"]
+    abs_files = [os.path.join(top_dir, "b")]
+    for f in files:
+        path = os.path.join(top_dir, f)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(f.encode() * 1000 + os.urandom(100))
+        abs_files.append(path)
+    os.chmod(abs_files[1], 0o755)
+    expected = os.path.join(tmpdir, "expected.zip")
+    with zipfile.ZipFile(expected, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for path in abs_files:
+            z.write(path, arcname=os.path.relpath(path, top_dir))
+    to = os.path.join(tmpdir, "to.zip")
+    await sign._create_zipfile(context, to, abs_files, tmp_dir=top_dir)
+    with zipfile.ZipFile(to) as z, zipfile.ZipFile(expected) as e:
+        assert [i.filename for i in z.infolist()] == ["b/"] + files
+        for info, expected_info in zip(z.infolist(), e.infolist()):
+            assert info.filename == expected_info.filename
+            assert info.date_time == expected_info.date_time
+            assert info.external_attr == expected_info.external_attr
+            assert info.CRC == expected_info.CRC
+            assert z.read(info) == e.read(expected_info)
 
 
 @pytest.mark.asyncio
@@ -997,10 +1378,70 @@ async def test_working_tarfile(context):
 
 
 @pytest.mark.asyncio
-async def test_bad_create_tarfile(context, mocker):
-    mocker.patch.object(tarfile, "open", new=context_die)
+async def test_extract_tarfile_files(context, tmpdir):
+    src = os.path.join(tmpdir, "src")
+    os.makedirs(os.path.join(src, "dir"))
+    with open(os.path.join(src, "file"), "w") as fh:
+        fh.write("x")
+    os.symlink("file", os.path.join(src, "file-link"))
+    os.symlink("dir", os.path.join(src, "dir-link"))
+    path = os.path.join(tmpdir, "test.tar.gz")
+    with tarfile.open(path, "w:gz") as t:
+        for name in ("dir", "dir-link", "file", "file-link"):
+            t.add(os.path.join(src, name), arcname="./{}".format(name))
+    tmp_dir = os.path.join(tmpdir, "untarred")
+    files = await sign._extract_tarfile(context, path, "gz", tmp_dir=tmp_dir)
+    assert files.members() == ["file", "file-link"]
+    assert files.members(dirs=True) == ["file", "file-link", "dir/", "dir-link/"]
+    assert sign.remove_extra_files(tmp_dir, files) == []
+
+
+@pytest.mark.asyncio
+async def test_sign_widevine_tar_precomplete(context, mocker, tmpdir):
+    src = os.path.join(tmpdir, "src")
+    for name in ("firefox/firefox", "firefox/plugin-container", "firefox/precomplete"):
+        makedirs(os.path.dirname(os.path.join(src, name)))
+        with open(os.path.join(src, name), "w") as fh:
+            fh.write("x")
+    makedirs(os.path.join(src, "firefox/browser/features"))
+    os.symlink("browser", os.path.join(src, "firefox/browser-link"))
+    orig = os.path.join(tmpdir, "target.tar.gz")
+    with tarfile.open(orig, "w:gz") as t:
+        t.add(os.path.join(src, "firefox"), arcname="firefox")
+
+    async def fake_sign(_, from_, fmt, to=None):
+        with open(to, "w") as fh:
+            fh.write(fmt)
+
+    mocker.patch.object(sign, "sign_file", new=fake_sign)
+    await sign.sign_widevine_tar(context, orig, "widevine")
+    with tarfile.open(orig) as t:
+        names = t.getnames()
+        precomplete = t.extractfile("firefox/precomplete").read().decode("utf-8")
+    # The same as createprecomplete's, run on the tree with the sigfiles
+    for name in names:
+        if name.endswith(".sig"):
+            open(os.path.join(src, name), "w").close()
+    generate_precomplete(os.path.join(src, "firefox"))
+    with open(os.path.join(src, "firefox/precomplete")) as fh:
+        expected = fh.read()
+    assert 'rmdir "browser/features/"\n' in expected
+    assert 'rmdir "browser-link/"\n' in expected
+    assert precomplete == expected
+
+
+@pytest.mark.asyncio
+async def test_bad_create_tarfile(context, tmpdir):
+    # Tarfiles are written in another process, so fail for real there
     with pytest.raises(SigningScriptError):
-        await sign._create_tarfile(context, "foo.tar.gz", [], ".bz2")
+        await sign._create_tarfile(
+            context,
+            os.path.join(tmpdir, "foo.tar.gz"),
+            [os.path.join(tmpdir, "missing")],
+            ".bz2",
+        )
+    with pytest.raises(SigningScriptError):
+        await sign._create_tarfile(context, "foo.tar.gz", [], ".xz")
 
 
 @pytest.mark.asyncio
@@ -1077,12 +1518,122 @@ def test_signreq_task_langpack():
     assert req[0]["options"]["pkcs7_digest"] == "SHA256"
 
 
+def test_signreq_task_langpack_data():
+    fmt = "autograph_langpack"
+    s = SigningServer(
+        "https://autograph-hsm.dev.mozaws.net", "alice", "bob", [fmt], "autograph"
+    )
+    req = sign.make_signing_req(
+        b"hello world", s, fmt, extension_id="langpack", autograph_method="data"
+    )
+    # /sign/data can't make COSE signatures
+    assert "cose_algorithms" not in req[0]["options"]
+    assert req[0]["options"]["pkcs7_digest"] == "SHA256"
+
+
 @pytest.mark.asyncio
 async def test_bad_autograph_method():
     with pytest.raises(SigningScriptError):
         await sign.sign_with_autograph(None, None, None, "badformat")
 
 
+@pytest.mark.asyncio
+async def test_sign_hash_with_autograph_hedges(context, mocker):
+    urls = []
+
+    async def fake_call_autograph(url, user, password, request_json):
+        urls.append(url)
+        if url.startswith("https://slow"):
+            await asyncio.sleep(1)
+        return [{"signature": base64.b64encode(url.encode()).decode()}]
+
+    mocker.patch.object(sign, "call_autograph", new=fake_call_autograph)
+    fmt = "autograph_hash_only_mar384"
+    context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    context.signing_servers = {
+        "project:releng:signing:cert:dep-signing": [
+            SigningServer("https://slow", "user", "pass", [fmt], "autograph"),
+            SigningServer("https://fast", "user", "pass", [fmt], "autograph"),
+        ]
+    }
+    sign.latency.configure(
+        {"autograph_hedging": True, "autograph_hedge_min_samples": 1}
+    )
+    sign.latency.record("https://slow", "hash", 0.01, len(b"hash"))
+    try:
+        signature = await sign.sign_hash_with_autograph(context, b"hash", fmt)
+    finally:
+        sign.latency.configure({})
+        sign.latency._windows.clear()
+    assert signature == b"https://fast/sign/hash"
+    assert urls == ["https://slow/sign/hash", "https://fast/sign/hash"]
+
+
+@pytest.mark.asyncio
+async def test_call_autograph_cancelled_holds_slot(mocker):
+    events = []
+
+    def slow_post_autograph(url, user, password, request_json):
+        name = request_json[0]["input"]
+        events.append(name + " started")
+        if name == "a":
+            time.sleep(0.2)
+        events.append(name + " finished")
+        return [{"signature": name}]
+
+    mocker.patch.object(sign, "post_autograph", new=slow_post_autograph)
+    server = SigningServer("https://autograph", "user", "pass", ["fmt"], "autograph")
+    url = "https://autograph/sign/file"
+    sign.concurrency.configure({"concurrency_limits": {"autograph": 1}})
+    try:
+        first = asyncio.ensure_future(
+            sign._call_autograph_limited(server, "fmt", url, [{"input": "a"}])
+        )
+        while not events:
+            await asyncio.sleep(0.01)
+        first.cancel()
+        second = asyncio.ensure_future(
+            sign._call_autograph_limited(server, "fmt", url, [{"input": "b"}])
+        )
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == [{"signature": "b"}]
+    finally:
+        sign.concurrency.configure({})
+    # The cancelled upload kept its slot until its thread was done
+    assert events == ["a started", "a finished", "b started", "b finished"]
+
+
+@pytest.mark.asyncio
+async def test_warm_autograph_connections(mocker):
+    session_mock = mocker.MagicMock()
+    session_mock.get.side_effect = [None, sign.requests.ConnectionError("down")]
+    Session_mock = mocker.Mock()
+    Session_mock.return_value.__enter__ = mocker.Mock(return_value=session_mock)
+    Session_mock.return_value.__exit__ = mocker.Mock()
+    mocker.patch("signingscript.sign.requests.Session", Session_mock, create=True)
+
+    servers = [
+        SigningServer("https://a", "user", "pass", ["autograph_mar"], "autograph"),
+        SigningServer("https://a", "user", "pass", ["autograph_apk"], "autograph"),
+        SigningServer("https://b", "user", "pass", ["autograph_mar"], "autograph"),
+        SigningServer("c", "user", "pass", ["gpg"], "signing_server"),
+    ]
+    # A server that's down doesn't fail the task here
+    await sign.warm_autograph_connections(servers)
+    assert sorted(c[0][0] for c in session_mock.get.call_args_list) == [
+        "https://a/__lbheartbeat__",
+        "https://b/__lbheartbeat__",
+    ]
+    for c in session_mock.get.call_args_list:
+        assert c[1]["timeout"] == sign.WARM_UP_TIMEOUT
+
+    session_mock.get.reset_mock()
+    mocker.patch.object(sign.broker, "is_configured", return_value=True)
+    await sign.warm_autograph_connections(servers)
+    session_mock.get.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_bad_autograph_format(context):
     with pytest.raises(SigningScriptError):
@@ -1107,6 +1658,15 @@ async def test_widevine_autograph(context, mocker, tmp_path, blessed):
 
     mocker.patch("signingscript.sign.sign_hash_with_autograph", fake_sign_hash)
 
+    run_cpu_calls = []
+
+    async def fake_run_cpu(func, *args):
+        # The mocked widevine module only exists in this process
+        run_cpu_calls.append(args)
+        return func(*args)
+
+    mocker.patch.object(sign.executor, "run_cpu", new=fake_run_cpu)
+
     cert = tmp_path / "widevine.crt"
     cert.write_bytes(b"TMPCERT")
     context.config["widevine_cert"] = cert
@@ -1116,6 +1676,8 @@ async def test_widevine_autograph(context, mocker, tmp_path, blessed):
 
     assert b"sigwidevinesig" == to.read_bytes()
     assert called_format == "autograph_widevine"
+    assert run_cpu_calls == [("from", 1 if blessed else 0)]
+    wv.generate_widevine_hash.assert_called_once_with("from", 1 if blessed else 0)
 
 
 @pytest.mark.asyncio
@@ -1160,6 +1722,49 @@ async def test_gpg_autograph(context, mocker, tmp_path):
         result = await sign.sign_gpg_with_autograph(context, tmp, "gpg")
 
 
+@pytest.mark.asyncio
+async def test_gpg_hash_autograph(context, mocker, tmp_path):
+    tmp = tmp_path / "file.txt"
+    tmp.write_text("hello world")
+    tmp = str(tmp)
+    _autograph_context(context, "autograph_gpg")
+    context.config["gpg_pubkey"] = "KEY"
+    context.config["gpg_hash_signing_keyid"] = "gpg_rsa"
+    key = sign.pgp.PGPKey(b"\x01" * 20, b"\x01" * 8, sign.pgp.PUBKEY_ALGORITHM_RSA)
+    mocker.patch.object(sign.pgp, "load_public_key", return_value=key)
+    mocker.patch.object(sign.time, "time", return_value=1600000000.5)
+    trailer = sign.pgp.make_signature_trailer(key, "sha512", 1600000000)
+    digest = hashlib.sha512(b"hello world" + trailer).digest()
+
+    async def mocked_sign_hash(context, hash_, fmt, keyid=None):
+        assert hash_ == digest
+        assert fmt == "autograph_gpg"
+        assert keyid == "gpg_rsa"
+        return b"\x00\x80signature"
+
+    mocker.patch.object(sign, "sign_hash_with_autograph", mocked_sign_hash)
+    mocked_sign = mocker.patch.object(sign, "sign_with_autograph")
+    hashed_in = []
+    hash_ = sign.utils.ArtifactHandle.hash
+
+    def spy_hash(self, *args):
+        hashed_in.append(threading.current_thread())
+        return hash_(self, *args)
+
+    mocker.patch.object(sign.utils.ArtifactHandle, "hash", new=spy_hash)
+
+    result = await sign.sign_gpg_with_autograph(context, tmp, "autograph_gpg")
+
+    assert result == [tmp, f"{tmp}.asc"]
+    mocked_sign.assert_not_called()
+    # The file is hashed off the event loop
+    assert threading.main_thread() not in hashed_in
+    with open(f"{tmp}.asc") as fh:
+        assert fh.read() == sign.pgp.make_detached_signature(
+            key, trailer, digest, b"\x80signature"
+        )
+
+
 # sign_omnija {{{1  -- 537
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
@@ -1221,6 +1826,43 @@ async def test_sign_omnija(context, mocker, filename, raises, nofiles):
         await sign.sign_omnija(context, filename, fmt)
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filename", ("foo.zip", "foo.tar.bz2"))
+async def test_sign_omnija_failure_cancels_siblings(context, mocker, filename):
+    files = ["a/omni.ja", "b/omni.ja", "c/omni.ja"]
+    cancelled = []
+
+    async def fake_filelist(*args, **kwargs):
+        return files
+
+    async def fake_extract(*args, **kwargs):
+        return files
+
+    async def fake_sign_omnija(context, from_):
+        if from_.endswith("b/omni.ja"):
+            raise SigningScriptError("bad omni.ja")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(from_)
+            raise
+
+    mocker.patch.object(sign, "_get_tarfile_files", new=fake_filelist)
+    mocker.patch.object(sign, "_extract_tarfile", new=fake_extract)
+    mocker.patch.object(sign, "_get_zipfile_files", new=fake_filelist)
+    mocker.patch.object(sign, "_extract_zipfile", new=fake_extract)
+    mocker.patch.object(sign, "sign_omnija_with_autograph", new=fake_sign_omnija)
+    mocker.patch.object(sign, "_create_tarfile", new=noop_async)
+    mocker.patch.object(sign, "_create_zipfile", new=noop_async)
+    mocker.patch.object(os.path, "isfile", return_value=True)
+
+    with pytest.raises(SigningScriptError, match="bad omni.ja"):
+        await asyncio.wait_for(
+            sign.sign_omnija(context, filename, "autograph_omnija"), 1
+        )
+    assert sorted(os.path.basename(os.path.dirname(f)) for f in cancelled) == ["a", "c"]
+
+
 # _get_omnija_signing_files {{{1  -- 621
 @pytest.mark.parametrize(
     "filenames,expected",
@@ -1294,6 +1936,190 @@ async def test_omnija_sign(tmpdir, mocker, context, orig, signed, sha256_expecte
     assert sha256_actual == sha256_expected
 
 
+@pytest.mark.parametrize("same_filesystem", (True, False))
+def test_replace_file(tmpdir, mocker, same_filesystem):
+    src = os.path.join(tmpdir, "merged")
+    dst_dir = os.path.join(tmpdir, "dst")
+    dst = os.path.join(dst_dir, "omni.ja")
+    os.mkdir(dst_dir)
+    with open(src, "wb") as fh:
+        fh.write(b"merged")
+    os.chmod(src, 0o600)
+    with open(dst, "wb") as fh:
+        fh.write(b"orig")
+    os.chmod(dst, 0o644)
+    real_stat = os.stat
+
+    def fake_stat(path, *args, **kwargs):
+        result = real_stat(path, *args, **kwargs)
+        if path == dst_dir and not same_filesystem:
+            return mocker.Mock(st_dev=result.st_dev + 1)
+        return result
+
+    mocker.patch.object(sign.os, "stat", new=fake_stat)
+    replace = mocker.spy(sign.os, "replace")
+    sign._replace_file(src, dst)
+    assert replace.called == same_filesystem
+    with open(dst, "rb") as fh:
+        assert fh.read() == b"merged"
+    assert real_stat(dst).st_mode & 0o777 == 0o644
+    assert not os.path.exists(src)
+
+
+def _jar_manifest_sections(manifest):
+    return {
+        section
+        for section in manifest.decode("utf-8").split("\n\n")
+        if section.startswith("Name: ") and not section.startswith("Name: META-INF/")
+    }
+
+
+@pytest.mark.parametrize(
+    "orig,signed",
+    (
+        ("no_preload_unsigned_omni.ja", "no_preload_signed_omni.ja"),
+        ("preload_unsigned_omni.ja", "preload_signed_omni.ja"),
+    ),
+)
+def test_make_jar_manifest(orig, signed):
+    manifest = sign.make_jar_manifest(os.path.join(TEST_DATA_DIR, orig))
+    assert manifest.startswith(b"Manifest-Version: 1.0\n\n")
+    with zipfile.ZipFile(os.path.join(TEST_DATA_DIR, signed)) as z:
+        expected = z.read("META-INF/manifest.mf")
+    assert _jar_manifest_sections(manifest) == _jar_manifest_sections(expected)
+    # Signature files in the input aren't listed
+    assert sign.make_jar_manifest(os.path.join(TEST_DATA_DIR, signed)).count(
+        b"Name: "
+    ) == manifest.count(b"Name: ")
+
+
+@pytest.mark.parametrize("newline", (b"\n", b"\r\n"))
+def test_jar_manifest_line_multibyte(newline):
+    # The multibyte character is split across the continuation
+    name = "Name: {}\u00e9{}".format("a" * (65 - len(newline)), "b" * 80)
+    line = sign._jar_manifest_line(name.encode("utf-8"), newline)
+    lines = line.split(newline)
+    assert lines[-1] == b""
+    assert all(len(l) + len(newline) <= 72 for l in lines)
+    assert all(l.startswith(b" ") for l in lines[1:-1])
+    assert (
+        b"".join(l[1:] for l in lines[1:]) == name.encode("utf-8")[72 - len(newline) :]
+    )
+    assert (lines[0] + b"".join(l[1:] for l in lines[1:])).decode("utf-8") == name
+
+
+def test_make_jar_signature_file():
+    manifest = b"Manifest-Version: 1.0\n\n"
+    assert (
+        sign.make_jar_signature_file(manifest)
+        == (
+            "Signature-Version: 1.0\n"
+            "SHA1-Digest-Manifest: {}\n"
+            "SHA256-Digest-Manifest: {}\n\n".format(
+                base64.b64encode(sha1(manifest).digest()).decode(),
+                base64.b64encode(sha256(manifest).digest()).decode(),
+            )
+        ).encode()
+    )
+
+
+def _autograph_context(context, fmt):
+    context.task = {"scopes": ["project:releng:signing:cert:dep-signing"]}
+    context.signing_servers = {
+        "project:releng:signing:cert:dep-signing": [
+            SigningServer(
+                "https://autograph-hsm.dev.mozaws.net",
+                "alice",
+                "bob",
+                [fmt],
+                "autograph",
+            )
+        ]
+    }
+    context.config["xpi_hash_signing"] = True
+    context.config["xpi_cose_formats"] = []
+
+
+def _mock_sign_jar_signature_file(mocker, extension_id):
+    sigfiles = []
+
+    async def mocked_sign_with_autograph(s, input_bytes, fmt, method, **kwargs):
+        assert method == "data"
+        assert kwargs["extension_id"] == extension_id
+        sigfiles.append(input_bytes)
+        return base64.b64encode(b"pkcs7")
+
+    mocker.patch.object(sign, "sign_with_autograph", mocked_sign_with_autograph)
+    return sigfiles
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "orig", ("no_preload_unsigned_omni.ja", "preload_unsigned_omni.ja")
+)
+async def test_omnija_sign_hash(tmpdir, mocker, context, orig):
+    _autograph_context(context, "autograph_omnija")
+    sigfiles = _mock_sign_jar_signature_file(mocker, "omni.ja@mozilla.org")
+    copy_from = os.path.join(tmpdir, "omni.ja")
+    shutil.copyfile(os.path.join(TEST_DATA_DIR, orig), copy_from)
+
+    await sign.sign_omnija_with_autograph(context, copy_from)
+
+    orig_reader = JarReader(os.path.join(TEST_DATA_DIR, orig))
+    signed_reader = JarReader(copy_from)
+    assert signed_reader.names == orig_reader.names + [
+        "META-INF/manifest.mf",
+        "META-INF/mozilla.sf",
+        "META-INF/mozilla.rsa",
+    ]
+    assert signed_reader.last_preloaded == orig_reader.last_preloaded
+    metafiles = {
+        f.filename: f.read() for f in signed_reader if "META-INF" in f.filename
+    }
+    assert metafiles["META-INF/mozilla.rsa"] == b"pkcs7"
+    assert sigfiles == [metafiles["META-INF/mozilla.sf"]]
+    assert metafiles["META-INF/manifest.mf"] == sign.make_jar_manifest(
+        os.path.join(TEST_DATA_DIR, orig)
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ("autograph_omnija", "autograph_langpack"))
+async def test_xpi_hash_signing_needs_cose(tmpdir, mocker, context, fmt):
+    _autograph_context(context, fmt)
+    context.config["xpi_cose_formats"] = [fmt]
+    copy_from = os.path.join(tmpdir, "en-CA.xpi")
+    shutil.copyfile(os.path.join(TEST_DATA_DIR, "en-CA.xpi"), copy_from)
+    mocker.patch.object(sign, "sign_with_autograph", side_effect=AssertionError())
+    with pytest.raises(SigningScriptError):
+        if fmt == "autograph_omnija":
+            await sign.sign_omnija_with_autograph(context, copy_from)
+        else:
+            await sign.sign_langpack(context, copy_from, fmt)
+
+
+@pytest.mark.asyncio
+async def test_sign_langpack_hash(tmpdir, mocker, context):
+    _autograph_context(context, "autograph_langpack")
+    _mock_sign_jar_signature_file(mocker, "langpack-en-CA@firefox.mozilla.org")
+    copy_from = os.path.join(tmpdir, "en-CA.xpi")
+    shutil.copyfile(os.path.join(TEST_DATA_DIR, "en-CA.xpi"), copy_from)
+
+    assert (
+        await sign.sign_langpack(context, copy_from, "autograph_langpack") == copy_from
+    )
+
+    with zipfile.ZipFile(copy_from) as z:
+        names = z.namelist()
+        assert names[:3] == [
+            "META-INF/manifest.mf",
+            "META-INF/mozilla.sf",
+            "META-INF/mozilla.rsa",
+        ]
+        assert "manifest.json" in names
+    assert sign._langpack_id(copy_from) == "langpack-en-CA@firefox.mozilla.org"
+
+
 def test_langpack_id_regex():
     assert sign.LANGPACK_RE.match("langpack-en-CA@firefox.mozilla.org") is not None
     assert (
@@ -1427,6 +2253,100 @@ async def test_authenticode_sign_zip(tmpdir, mocker, context, fmt):
     assert os.path.exists(result)
 
 
+@pytest.mark.asyncio
+async def test_authenticode_sign_files_share_limits(tmpdir, mocker, context):
+    fmt = "autograph_authenticode"
+    _autograph_context(context, fmt)
+    context.config["authenticode_cert"] = os.path.join(TEST_DATA_DIR, "windows.crt")
+    context.config["authenticode_url"] = "https://example.com"
+    context.config["authenticode_timestamp_style"] = None
+    sign.concurrency.configure({"concurrency_limits": {"autograph": 2}})
+    in_flight = []
+    peak = []
+
+    async def mocked_call_autograph(url, user, password, request_json):
+        in_flight.append(url)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.02)
+        in_flight.remove(url)
+        return [{"signature": base64.b64encode(b"sig").decode()}]
+
+    def mocked_winsign(infile, outfile, digest_algo, certs, signer, **kwargs):
+        assert signer(b"digest", digest_algo) == b"sig"
+        shutil.copyfile(infile, outfile)
+        return True
+
+    mocker.patch.object(sign, "call_autograph", mocked_call_autograph)
+    mocker.patch.object(winsign.sign, "sign_file", mocked_winsign)
+    mocker.patch.object(winsign.sign, "is_signed", return_value=False)
+    paths = []
+    for i in range(6):
+        paths.append(os.path.join(tmpdir, "{}.exe".format(i)))
+        with open(paths[-1], "wb") as fh:
+            fh.write(b"exe")
+    try:
+        # Each file signs its hashes from its own executor thread, and all of
+        # them share the task's limits
+        await asyncio.wait_for(
+            asyncio.gather(
+                *(sign.sign_authenticode_file(context, path, fmt) for path in paths)
+            ),
+            5,
+        )
+    finally:
+        sign.concurrency.configure({})
+    assert len(peak) == 6
+    assert max(peak) == 2
+
+
+@pytest.mark.asyncio
+async def test_authenticode_sign_file_cancelled(tmpdir, mocker, context):
+    fmt = "autograph_authenticode"
+    context.config["authenticode_cert"] = os.path.join(TEST_DATA_DIR, "windows.crt")
+    context.config["authenticode_url"] = "https://example.com"
+    context.config["authenticode_timestamp_style"] = None
+    started = asyncio.Event()
+    cancelled = []
+    signed = []
+
+    async def mocked_sign_hash(context, digest, fmt):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(digest)
+            raise
+
+    def mocked_winsign(infile, outfile, digest_algo, certs, signer, **kwargs):
+        shutil.copyfile(infile, outfile)
+        try:
+            signer(b"digest", digest_algo)
+        except Exception:
+            # winsign reports failures by returning False
+            return False
+        signed.append(infile)
+        return True
+
+    mocker.patch.object(sign, "sign_hash_with_autograph", mocked_sign_hash)
+    mocker.patch.object(winsign.sign, "sign_file", mocked_winsign)
+    mocker.patch.object(winsign.sign, "is_signed", return_value=False)
+    exe_dir = os.path.join(tmpdir, "exe")
+    os.mkdir(exe_dir)
+    path = os.path.join(exe_dir, "0.exe")
+    with open(path, "wb") as fh:
+        fh.write(b"exe")
+    signing = asyncio.ensure_future(sign.sign_authenticode_file(context, path, fmt))
+    await asyncio.wait_for(started.wait(), 5)
+    signing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(signing, 5)
+    # The autograph request was cancelled, and the thread finished without
+    # touching the file
+    assert cancelled == [b"digest"]
+    assert signed == []
+    assert os.listdir(exe_dir) == ["0.exe"]
+
+
 @pytest.mark.asyncio
 async def test_authenticode_sign_zip_nofiles(tmpdir, mocker, context):
     context.config["authenticode_cert"] = os.path.join(TEST_DATA_DIR, "windows.crt")
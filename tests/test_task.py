@@ -1,4 +1,5 @@
 import aiohttp
+from hashlib import sha1
 import os
 import pytest
 
@@ -6,9 +7,11 @@ from scriptworker.client import validate_task_schema
 from scriptworker.exceptions import ScriptWorkerTaskException, TaskVerificationError
 
 from signingscript.exceptions import SigningServerError
-from signingscript.utils import mkdir
+from signingscript.utils import ArtifactHandle, mkdir, write_artifact
+from signingscript.formats import get_signing_format
+import signingscript.sign as ssign
 import signingscript.task as stask
-from conftest import noop_sync, BASE_DIR
+from conftest import noop_sync, die, BASE_DIR
 
 # helper constants, fixtures, functions {{{1
 SERVER_CONFIG_PATH = os.path.join(BASE_DIR, "example_server_config.json")
@@ -154,49 +157,93 @@ async def test_sign(context, mocker, format, filename, post_files):
     async def fake_other(_, path, *kwargs):
         return path
 
-    fake_format_to = {"gpg": fake_gpg, "default": fake_other}
+    fake_format_to = {"sign_gpg": fake_gpg, "sign_signcode": fake_other}
 
-    def fake_log(context, new_files, *args):
-        assert new_files == post_files
+    mocker.patch.object(
+        stask,
+        "_get_signing_function_from_format",
+        new=lambda fmt: fake_format_to[get_signing_format(fmt).signing_function],
+    )
+    assert await stask.sign(context, filename, [format]) == post_files
+
+
+@pytest.mark.asyncio
+async def test_sign_passes_artifact_handles(context, mocker, tmpdir):
+    seen = []
 
-    mocker.patch.object(stask, "FORMAT_TO_SIGNING_FUNCTION", new=fake_format_to)
-    await stask.sign(context, filename, [format])
+    async def fake_write(_, path, fmt):
+        seen.append(path)
+        return write_artifact(path, b"signed")
+
+    async def fake_check(_, path, fmt):
+        seen.append(path)
+        assert path.hexdigest("sha1") == sha1(b"signed").hexdigest()
+        return path
+
+    mocker.patch.object(
+        stask,
+        "_get_signing_function_from_format",
+        new=lambda fmt: {"first": fake_write, "second": fake_check}[fmt],
+    )
+    path = os.path.join(tmpdir, "target")
+    assert await stask.sign(context, path, ["first", "second"]) == [path]
+    assert all(isinstance(p, ArtifactHandle) for p in seen)
+    assert seen[0] is not seen[1]
 
 
 @pytest.mark.parametrize(
     "format, expected",
     (
         # Hardcoded cases
-        ("autograph_focus", stask.sign_jar),
-        ("autograph_hash_only_mar384", stask.sign_mar384_with_autograph_hash),
-        ("gpg", stask.sign_gpg),
-        ("jar", stask.sign_jar),
-        ("focus-jar", stask.sign_jar),
-        ("macapp", stask.sign_macapp),
-        ("osslsigncode", stask.sign_signcode),
-        ("sha2signcode", stask.sign_signcode),
-        ("signcode", stask.sign_signcode),
-        ("widevine", stask.sign_widevine),
-        ("widevine_blessed", stask.sign_widevine),
-        ("default", stask.sign_file),
+        ("autograph_focus", ssign.sign_jar),
+        ("autograph_hash_only_mar384", ssign.sign_mar384_with_autograph_hash),
+        ("gpg", ssign.sign_gpg),
+        ("jar", ssign.sign_jar),
+        ("focus-jar", ssign.sign_jar),
+        ("macapp", ssign.sign_macapp),
+        ("osslsigncode", ssign.sign_signcode),
+        ("sha2signcode", ssign.sign_signcode),
+        ("signcode", ssign.sign_signcode),
+        ("widevine", ssign.sign_widevine),
+        ("widevine_blessed", ssign.sign_widevine),
+        ("default", ssign.sign_file),
         # Regex cases
-        ("autograph_apk_fenix", stask.sign_jar),
-        ("autograph_apk_fennec_sha1", stask.sign_jar),
-        ("autograph_apk_focus", stask.sign_jar),
-        ("autograph_apk_reference_browser", stask.sign_jar),
+        ("autograph_apk_fenix", ssign.sign_jar),
+        ("autograph_apk_fennec_sha1", ssign.sign_jar),
+        ("autograph_apk_focus", ssign.sign_jar),
+        ("autograph_apk_reference_browser", ssign.sign_jar),
         (
             "autograph_hash_only_mar384:firefox_20190321_dev",
-            stask.sign_mar384_with_autograph_hash,
+            ssign.sign_mar384_with_autograph_hash,
         ),
         # Default
-        ("autograph_apk_", stask.sign_file),
-        ("non-existing-format", stask.sign_file),
+        ("autograph_apk_", ssign.sign_file),
+        ("non-existing-format", ssign.sign_file),
     ),
 )
 def test_get_signing_function_from_format(format, expected):
     assert stask._get_signing_function_from_format(format) == expected
 
 
+# _sort_formats {{{1
+@pytest.mark.parametrize(
+    "formats,expected",
+    (
+        (["gpg", "mar"], ["mar", "gpg"]),
+        (
+            ["autograph_gpg", "macapp", "widevine", "sha2signcode"],
+            ["sha2signcode", "widevine", "macapp", "autograph_gpg"],
+        ),
+        (
+            ["autograph_widevine", "autograph_authenticode", "autograph_omnija"],
+            ["autograph_authenticode", "autograph_omnija", "autograph_widevine"],
+        ),
+    ),
+)
+def test_sort_formats(formats, expected):
+    assert stask._sort_formats(formats) == expected
+
+
 # build_filelist_dict {{{1
 def test_build_filelist_dict(context, task_defn):
     full_path = os.path.join(
@@ -222,3 +269,49 @@ def test_build_filelist_dict(context, task_defn):
         fh.write("foo")
 
     assert stask.build_filelist_dict(context) == expected
+
+
+# build_signing_plan {{{1
+def test_build_signing_plan(context):
+    context.task = {"scopes": [TEST_CERT_TYPE]}
+    filelist_dict = {
+        "target.exe": {"full_path": "full/target.exe", "formats": ["gpg", "widevine"]},
+        "target.mar": {
+            "full_path": "full/target.mar",
+            "formats": ["autograph_hash_only_mar384:keyid"],
+        },
+    }
+    plan = stask.build_signing_plan(context, filelist_dict)
+    assert plan.cert_type == TEST_CERT_TYPE
+    assert plan.paths == {
+        "target.exe": ("gpg", "widevine"),
+        "target.mar": ("autograph_hash_only_mar384:keyid",),
+    }
+    assert plan.signing_functions["gpg"] == ssign.sign_gpg
+    assert plan.formats["widevine"].detached_sig
+    assert [s.server for s in plan.servers["gpg"]] == ["127.0.0.1:9110"]
+    assert set(plan.servers) == {
+        "gpg",
+        "widevine",
+        "widevine_blessed",
+        "autograph_hash_only_mar384",
+        "autograph_hash_only_mar384:keyid",
+    }
+
+
+# get_cert_type get_signing_servers {{{1
+def test_plan_accessors(context, mocker):
+    context.task = {"scopes": [TEST_CERT_TYPE]}
+    assert stask.get_cert_type(context) == TEST_CERT_TYPE
+    assert stask.get_signing_servers(context, "gpg") == list(
+        context.signing_servers[TEST_CERT_TYPE]
+    )
+
+    filelist_dict = {"target": {"full_path": "full/target", "formats": ["gpg"]}}
+    context.signing_plan = stask.build_signing_plan(context, filelist_dict)
+    mocker.patch.object(stask, "task_cert_type", new=die)
+    mocker.patch.object(stask, "get_suitable_signing_servers", new=die)
+    assert stask.get_cert_type(context) == TEST_CERT_TYPE
+    assert [s.server for s in stask.get_signing_servers(context, "gpg")] == [
+        "127.0.0.1:9110"
+    ]
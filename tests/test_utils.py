@@ -1,10 +1,16 @@
+import asyncio
+import hashlib
 import json
 import mock
 import os
 import pytest
 
 from scriptworker.context import Context
-from signingscript.exceptions import FailedSubprocess, SigningServerError
+from signingscript.exceptions import (
+    FailedSubprocess,
+    MultipleSigningErrors,
+    SigningServerError,
+)
 from conftest import read_file
 import signingscript.utils as utils
 from conftest import PUB_KEY_PATH
@@ -73,6 +79,23 @@ def test_load_signing_server_config():
     assert cfg["notdep"][1].formats == ["f2", "f3"]
 
 
+def test_load_signing_server_config_cached(tmp_path):
+    path = tmp_path / "server_config.json"
+    path.write_text(
+        json.dumps({"dep": [["server1:9000", "user1", "pass1", ["f1"], "autograph"]]})
+    )
+    context = Context()
+    context.config = {"signing_server_config": str(path)}
+    cfg = utils.load_signing_server_config(context)
+    assert utils.load_signing_server_config(context) is cfg
+
+    path.write_text(
+        json.dumps({"dep": [["server2:9000", "user2", "pass2", ["f1"], "autograph"]]})
+    )
+    os.utime(str(path), ns=(0, 0))
+    assert utils.load_signing_server_config(context)["dep"][0].server == "server2:9000"
+
+
 # log_output {{{1
 @pytest.mark.asyncio
 async def test_log_output(tmpdir, mocker):
@@ -148,6 +171,88 @@ async def test_execute_subprocess(exit_code):
         await utils.execute_subprocess(command, cwd="/tmp")
 
 
+@pytest.mark.asyncio
+async def test_execute_subprocess_cancelled(tmpdir):
+    pid_file = os.path.join(tmpdir, "pid")
+    command = ["bash", "-c", "echo $$ > {}; exec sleep 30".format(pid_file)]
+    running = asyncio.ensure_future(utils.execute_subprocess(command))
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if os.path.exists(pid_file) and read_file(pid_file).strip():
+            break
+    pid = int(read_file(pid_file))
+    running.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await running
+    # The command was killed and reaped
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+# run_concurrently {{{1
+@pytest.mark.asyncio
+async def test_run_concurrently():
+    assert await utils.run_concurrently([]) == []
+    assert await utils.run_concurrently(
+        [asyncio.sleep(0.02, "a"), asyncio.sleep(0, "b")]
+    ) == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_run_concurrently_cancels_siblings():
+    cancelled = []
+
+    async def slow(name):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    async def fail():
+        raise SigningServerError("fail")
+
+    with pytest.raises(SigningServerError):
+        await asyncio.wait_for(
+            utils.run_concurrently([slow("a"), fail(), slow("b")]), 1
+        )
+    # The siblings were cancelled before it returned
+    assert sorted(cancelled) == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_run_concurrently_reports_every_failure():
+    async def fail(exc):
+        raise exc
+
+    with pytest.raises(MultipleSigningErrors) as excinfo:
+        await utils.run_concurrently(
+            [fail(SigningServerError("one")), fail(FailedSubprocess("two"))]
+        )
+    assert [str(e) for e in excinfo.value.errors] == ["one", "two"]
+    assert "SigningServerError: one" in str(excinfo.value)
+    assert "FailedSubprocess: two" in str(excinfo.value)
+
+
+@pytest.mark.asyncio
+async def test_run_concurrently_cancelled():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    running = asyncio.ensure_future(utils.run_concurrently([slow(), slow()]))
+    await asyncio.sleep(0.01)
+    running.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await running
+    assert cancelled == [True, True]
+
+
 # is_sha1_apk_autograph_signing_format {{{1
 @pytest.mark.parametrize(
     "format,expected",
@@ -160,3 +265,53 @@ async def test_execute_subprocess(exit_code):
 )
 def test_is_sha1_apk_autograph_signing_format(format, expected):
     assert utils.is_sha1_apk_autograph_signing_format(format) == expected
+
+
+# ArtifactHandle {{{1
+def test_write_artifact_caches_digests(tmpdir, mocker):
+    path = os.path.join(tmpdir, "artifact")
+    handle = utils.write_artifact(path, [b"foo", b"bar"])
+    assert handle == path
+    assert handle.size == 6
+    mocker.patch("builtins.open", side_effect=AssertionError("re-read"))
+    assert handle.hexdigest("sha1") == hashlib.sha1(b"foobar").hexdigest()
+    assert handle.hexdigest() == hashlib.sha512(b"foobar").hexdigest()
+
+
+def test_artifact_handle_hash_is_a_copy(tmpdir):
+    handle = utils.write_artifact(os.path.join(tmpdir, "artifact"), b"foo")
+    handle.hash("sha1").update(b"bar")
+    assert handle.hexdigest("sha1") == hashlib.sha1(b"foo").hexdigest()
+
+
+def test_artifact_handle_rehashes_modified_file(tmpdir):
+    path = os.path.join(tmpdir, "artifact")
+    handle = utils.write_artifact(path, b"foo")
+    with open(path, "wb") as fh:
+        fh.write(b"foobar")
+    assert handle.hexdigest("sha1") == hashlib.sha1(b"foobar").hexdigest()
+    assert utils.ArtifactHandle(path).hexdigest("sha256") == (
+        hashlib.sha256(b"foobar").hexdigest()
+    )
+
+
+def test_as_artifact(tmpdir):
+    handle = utils.write_artifact(os.path.join(tmpdir, "artifact"), b"foo")
+    assert utils.as_artifact(handle) is handle
+    assert isinstance(utils.as_artifact("path"), utils.ArtifactHandle)
+
+
+def test_copy_artifact(tmpdir):
+    source = os.path.join(tmpdir, "source")
+    with open(source, "wb") as fh:
+        fh.write(b"foo")
+    handle = utils.copy_artifact(source, os.path.join(tmpdir, "target"))
+    assert read_file(handle) == "foo"
+    assert handle.hexdigest("sha1") == hashlib.sha1(b"foo").hexdigest()
+
+
+@pytest.mark.parametrize("contents", (b"", b"foo"))
+def test_artifact_handle_mmap(tmpdir, contents):
+    handle = utils.write_artifact(os.path.join(tmpdir, "artifact"), contents)
+    with handle.mmap() as m:
+        assert bytes(m) == contents
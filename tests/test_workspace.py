@@ -0,0 +1,43 @@
+import os
+
+from signingscript.workspace import Workspace, record
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fh:
+        fh.write("x")
+
+
+# Workspace {{{1
+def test_workspace_members(tmpdir):
+    workspace = Workspace(
+        tmpdir, [os.path.join(tmpdir, "a"), os.path.join(tmpdir, "b", "c")]
+    )
+    workspace.append(os.path.join(tmpdir, "b", "c.sig"))
+    assert workspace.members() == ["a", "b/c", "b/c.sig"]
+    workspace.dirs.append(os.path.join(tmpdir, "b"))
+    assert workspace.members(dirs=True) == ["a", "b/c", "b/c.sig", "b/"]
+    assert workspace.relpath(os.path.join(tmpdir, ".", "d")) == "d"
+
+
+def test_workspace_extra_files(tmpdir):
+    tracked = [os.path.join(tmpdir, f) for f in ("a", os.path.join("b", "c"))]
+    untracked = [os.path.join(tmpdir, f) for f in ("d", os.path.join("b", "e"))]
+    unrecorded = os.path.join(tmpdir, "f")
+    for path in tracked + untracked + [unrecorded]:
+        _touch(path)
+    dangling = os.path.join(tmpdir, "g")
+    os.symlink(os.path.join(tmpdir, "missing"), dangling)
+    workspace = Workspace(tmpdir, tracked)
+    for path in tracked + untracked + [dangling, os.path.join(tmpdir, "h")]:
+        record(path)
+    # Recorded outside the workspace
+    record(os.path.join(os.path.dirname(tmpdir), "i"))
+    # Only recorded regular files are found
+    assert workspace.extra_files() == sorted(
+        os.path.realpath(path) for path in untracked
+    )
+    # Other workspaces for the directory share the recorded files
+    assert Workspace(tmpdir, tracked + untracked).extra_files() == []
+    assert Workspace(tmpdir, tracked).extra_files() == workspace.extra_files()